@@ -1,12 +1,20 @@
-import json
-import requests
+import asyncio
 import time
-import json_repair
-from config import LM_STUDIO_URL, SYSTEM_PROMPT, logger, MAX_LEVEL, get_next_level_xp
-from config import MAX_HEALTH_BASE, MAX_HEALTH_PER_LEVEL, MAX_GOLD
+from config import logger
+from config import LLM_MODEL, LLM_MAX_RETRIES, LLM_TURN_DEADLINE, LLM_ATTEMPT_TIMEOUT, LLM_STRUCTURED_OUTPUT
+from llm.client import get_client, LLMConnectionError, LLMCircuitOpen, LLMTimeout
+from llm.resilience import Deadline, backoff_delay
+from llm.scheduler import get_llm_scheduler, LLMOverloaded
+from llm.streaming import NarrativeExtractor
+from llm.prompt_builder import PromptBuilder
+from llm.history import get_history_context
+from llm.schema import RESPONSE_FORMAT, parse_dm_response, get_response_stats
+from llm.response_cache import get_response_cache, is_cacheable
+from metrics import count_fallback, stage_timer
 
 MAX_INPUT_LENGTH = 500
-MAX_HISTORY_ITEMS = 10
+
+prompt_builder = PromptBuilder(get_history_context())
 
 def sanitize_input(user_input):
     if not user_input:
@@ -15,172 +23,321 @@ def sanitize_input(user_input):
     sanitized = sanitized.replace("\x00", "")
     return sanitized
 
-def build_context_string(state):
-    level = state.get("level", 1)
-    health = state.get("health", 0)
-    max_health = state.get("max_health", MAX_HEALTH_BASE)
-    gold = state.get("gold", 0)
-    location = state.get("location", "Unknown")
-    inventory = state.get("inventory", [])
-    equipment = state.get("equipment", {})
-    status = state.get("status", "exploring")
-    combat = state.get("combat", {})
-    
-    equipment_str = f"Arma: {equipment.get('weapon', 'Ninguna')} | Armadura: {equipment.get('armor', 'Ninguna')} | Escudo: {equipment.get('shield', 'Ninguno')}"
-    
-    combat_info = ""
-    if combat.get("active"):
-        combat_info = f"""
---- COMBATE ACTIVO ---
-- Enemigo: {combat.get('enemy_name', 'Unknown')}
-- HP Enemigo: {combat.get('enemy_hp', 0)}/{combat.get('enemy_max_hp', 0)}
-- Último dado: {combat.get('last_roll', 'N/A')}
-"""
-    
-    effects = state.get("effects", {})
-    status_effects = []
-    if effects.get("poisoned"):
-        status_effects.append("Envenenado")
-    if effects.get("bleeding"):
-        status_effects.append("Sangrando")
-    if effects.get("blinded"):
-        status_effects.append("Ceguera")
-    
-    if status_effects:
-        status += f" | Afcciones: {', '.join(status_effects)}"
-    
-    return f"""
-Nivel: {level}
-Salud: {health}/{max_health}
-Oro: {gold}
-Ubicación: {location}
-Inventario: {', '.join(inventory) if inventory else 'Vacío'}
-Equipo: {equipment_str}
-Estado: {status}
-{combat_info}
-"""
-
-def query_dm(user_input, current_state, mock=False):
+def mock_response(user_input):
+    return {
+        "narrative": f"[MOCK] You acted: '{user_input}'. The system is running in DEV_MODE.",
+        "hp_change": 0,
+        "gold_change": 0,
+        "new_item": None,
+        "item_used": None,
+        "combat_ended": False,
+        "level_up": False,
+        "xp_gained": 0,
+        "choices": ["Continuar", "Explorar"]
+    }
+
+def connection_error_response():
+    count_fallback("connection")
+    return {
+        "narrative": "❌ **Error de Conexión:** No se pudo alcanzar el servidor de IA. ¿Está LM Studio ejecutándose en el puerto 1234?",
+        "hp_change": 0,
+        "gold_change": 0,
+        "new_item": None,
+        "item_used": None,
+        "combat_ended": False,
+        "level_up": False,
+        "xp_gained": 0,
+        "choices": [],
+        "error": True
+    }
+
+def timeout_response():
+    count_fallback("timeout")
+    return {
+        "narrative": "⌛ **El Dungeon Master tarda demasiado:** el servidor de IA no respondió a tiempo. Inténtalo de nuevo en unos segundos.",
+        "hp_change": 0,
+        "gold_change": 0,
+        "new_item": None,
+        "item_used": None,
+        "combat_ended": False,
+        "level_up": False,
+        "xp_gained": 0,
+        "choices": ["Intentar de nuevo"],
+        "error": True
+    }
+
+def circuit_open_response():
+    count_fallback("circuit_open")
+    return {
+        "narrative": "🔌 **Servidor de IA no disponible:** ha fallado varias veces seguidas y el Dungeon Master se toma un respiro. Inténtalo de nuevo en unos segundos.",
+        "hp_change": 0,
+        "gold_change": 0,
+        "new_item": None,
+        "item_used": None,
+        "combat_ended": False,
+        "level_up": False,
+        "xp_gained": 0,
+        "choices": ["Intentar de nuevo"],
+        "error": True
+    }
+
+def overloaded_response(error):
+    count_fallback("overloaded")
+    return {
+        "narrative": f"⏳ **Servidor saturado:** hay {error.waiting} turnos esperando al Dungeon Master. Inténtalo de nuevo en unos segundos.",
+        "hp_change": 0,
+        "gold_change": 0,
+        "new_item": None,
+        "item_used": None,
+        "combat_ended": False,
+        "level_up": False,
+        "xp_gained": 0,
+        "choices": ["Intentar de nuevo"],
+        "error": True
+    }
+
+def queue_notice(on_narrative):
+    return lambda position: on_narrative(f"⏳ *Turno en cola (posición {position}): el Dungeon Master está atendiendo a otros jugadores...*")
+
+def session_key(current_state):
+    return current_state.get("session_id") or current_state.get("created_at")
+
+# Time budget of a turn's attempts. The deadline starts with the first request that gets a
+# slot, so time spent queued for one is bounded by LLM_QUEUE_TIMEOUT instead. Each attempt
+# waits for the server at most attempt_timeout of it, leaving the rest for a retry.
+class TurnBudget:
+    def __init__(self, seconds=LLM_TURN_DEADLINE, attempt_timeout=LLM_ATTEMPT_TIMEOUT):
+        self.seconds = seconds
+        self.attempt_timeout = attempt_timeout
+        self.deadline = None
+
+    def request_timeout(self):
+        if self.deadline is None:
+            self.deadline = Deadline(self.seconds)
+        remaining = self.deadline.remaining()
+        if remaining <= 0:
+            raise LLMTimeout(f"Turn deadline of {self.seconds}s exceeded")
+        return min(remaining, self.attempt_timeout)
+
+    def expired(self):
+        return self.deadline is not None and self.deadline.expired()
+
+def error_response(error):
+    count_fallback("error")
+    return {
+        "narrative": f"**[ERROR DEL SISTEMA]** El Dungeon Master está confuse y no pudo procesar tu acción.\n\n*Info de depuración:* {str(error)}",
+        "hp_change": 0,
+        "gold_change": 0,
+        "new_item": None,
+        "item_used": None,
+        "combat_ended": False,
+        "level_up": False,
+        "xp_gained": 0,
+        "choices": ["Intentar de nuevo"],
+        "error": True
+    }
+
+def build_messages(user_input, current_state):
+    with stage_timer("prompt_build"):
+        messages, stats = prompt_builder.build(user_input, current_state)
+    logger.info(f"Prompt ~{stats['prompt_tokens']} tokens, {stats['history_tokens']} of history ({stats['cache_eligible_tokens']} cache-eligible)")
+    return messages
+
+def build_payload(messages):
+    payload = {
+        "model": LLM_MODEL,
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": 1000
+    }
+    if LLM_STRUCTURED_OUTPUT:
+        payload["response_format"] = RESPONSE_FORMAT
+    return payload
+
+def parse_completion(data, attempt):
+    return parse_content(data["choices"][0]["message"]["content"], attempt)
+
+def parse_content(raw_content, attempt):
+    logger.debug(f"AI Raw Response (Attempt {attempt+1}): {raw_content[:200]}...")
+    with stage_timer("json_parse"):
+        return parse_dm_response(raw_content)
+
+def cached_response(cache_key):
+    cache = get_response_cache()
+    if cache is None or cache_key is None:
+        return None
+    response = cache.get(cache_key)
+    if response is not None:
+        logger.info(f"Response cache hit ({cache.stats()['hit_rate']:.0%} hit rate)")
+    return response
+
+def store_response(cache_key, response, current_state):
+    cache = get_response_cache()
+    if cache is None or cache_key is None:
+        return
+    if is_cacheable(response, current_state.get("combat", {}).get("active", False)):
+        cache.put(cache_key, response)
+
+# What follows attempt `attempt` failing with `error`: (delay, None) to retry after `delay`
+# seconds, or (None, fallback response) to end the turn. Only errors a new attempt could fix
+# (a timeout, an unparseable answer, a 5xx) are retried, and only while the backoff and
+# another attempt fit the budget.
+def handle_failure(error, attempt, budget):
+    if isinstance(error, LLMOverloaded):
+        logger.warning(f"Turn turned away: {error}")
+        return None, overloaded_response(error)
+    if isinstance(error, LLMCircuitOpen):
+        logger.warning(f"Skipping LLM, circuit open: {error}")
+        return None, circuit_open_response()
+    if isinstance(error, LLMConnectionError):
+        logger.critical("Connection Error: Is LM Studio running on port 1234?")
+        return None, connection_error_response()
+
+    if isinstance(error, LLMTimeout):
+        logger.warning(f"LLM timed out on attempt {attempt + 1}: {error}")
+    else:
+        logger.warning(f"Error on attempt {attempt + 1}: {error}")
+    delay = backoff_delay(attempt, budget.deadline) if attempt < LLM_MAX_RETRIES else None
+    if delay is None:
+        logger.error("All retries failed.")
+        return None, timeout_response() if isinstance(error, LLMTimeout) else error_response(error)
+    return delay, None
+
+def count_retry(attempt):
+    logger.info(f"Retry attempt {attempt}...")
+    get_response_stats().count("retries")
+
+# Calls `send(attempt, budget)` until it returns a response or handle_failure gives up. The
+# backoff sleeps after the attempt has released its slot and stopped its llm_wait timer.
+def run_attempts(send, on_retry=None):
+    budget = TurnBudget()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if attempt > 0:
+            count_retry(attempt)
+            if on_retry is not None:
+                on_retry()
+        try:
+            return send(attempt, budget)
+        except Exception as e:
+            delay, fallback = handle_failure(e, attempt, budget)
+            if fallback is not None:
+                return fallback
+        time.sleep(delay)
+
+async def run_attempts_async(send):
+    budget = TurnBudget()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if attempt > 0:
+            count_retry(attempt)
+        try:
+            return await send(attempt, budget)
+        except Exception as e:
+            delay, fallback = handle_failure(e, attempt, budget)
+            if fallback is not None:
+                return fallback
+        await asyncio.sleep(delay)
+
+def query_dm(user_input, current_state, mock=False, cache_key=None):
     logger.info(f"Player action: {user_input}")
     
     user_input = sanitize_input(user_input)
     
     if mock:
         time.sleep(0.5)
-        return {
-            "narrative": f"[MOCK] You acted: '{user_input}'. The system is running in DEV_MODE.",
-            "hp_change": 0,
-            "gold_change": 0,
-            "new_item": None,
-            "item_used": None,
-            "combat_ended": False,
-            "level_up": False,
-            "xp_gained": 0,
-            "choices": ["Continuar", "Explorar"]
-        }
-    
-    state_context = build_context_string(current_state)
-    
-    level = current_state.get("level", 1)
-    health = current_state.get("health", 0)
-    max_health = current_state.get("max_health", MAX_HEALTH_BASE)
-    gold = current_state.get("gold", 0)
-    location = current_state.get("location", "Unknown")
-    inventory = current_state.get("inventory", [])
-    equipment = current_state.get("equipment", {})
-    status = current_state.get("status", "exploring")
-    
-    weapon = equipment.get("weapon", "Espada oxidada")
-    armor = equipment.get("armor", "Ninguna")
-    shield = equipment.get("shield", "Ninguno")
-    equipment_str = f"Arma: {weapon} | Armadura: {armor} | Escudo: {shield}"
-    
-    formatted_prompt = SYSTEM_PROMPT.format(
-        level=level,
-        health=health,
-        max_health=max_health,
-        gold=gold,
-        location=location,
-        inventory=", ".join(inventory) if inventory else "Vacío",
-        equipment=equipment_str,
-        status=status,
-        state=state_context
-    )
-    
-    messages = [
-        {"role": "system", "content": formatted_prompt},
-    ]
-    
-    history = current_state.get("history", [])
-    if history:
-        messages.extend(history[-MAX_HISTORY_ITEMS:])
-    
-    style_injection = f"""
-[Acción del Jugador]: "{user_input}"
-
-[Instrucción]: Eres el Narrador. Narra la consecuencia inmediata de esta acción en ESPAÑOL.
-OBLIGATORIO: Responde SOLAMENTE con el objeto JSON.
-"""
-    
-    messages.append({"role": "user", "content": style_injection})
-    
-    max_retries = 2
-    
-    for attempt in range(max_retries + 1):
-        try:
-            if attempt > 0:
-                logger.info(f"Retry attempt {attempt}...")
-            
-            response = requests.post(
-                LM_STUDIO_URL, 
-                json={
-                    "model": "local-model", 
-                    "messages": messages, 
-                    "temperature": 0.7,
-                    "max_tokens": 1000
-                },
-                timeout=60
-            )
-            response.raise_for_status()
-            
-            raw_content = response.json()["choices"][0]["message"]["content"]
-            logger.debug(f"AI Raw Response (Attempt {attempt+1}): {raw_content[:200]}...")
-            
-            decoded_object = json_repair.loads(raw_content)
-            
-            if "narrative" not in decoded_object:
-                raise ValueError("Parsed JSON missing 'narrative' field")
-            
-            return decoded_object
-
-        except requests.exceptions.ConnectionError:
-            logger.critical("Connection Error: Is LM Studio running on port 1234?")
-            return {
-                "narrative": "❌ **Error de Conexión:** No se pudo alcanzar el servidor de IA. ¿Está LM Studio ejecutándose en el puerto 1234?",
-                "hp_change": 0,
-                "gold_change": 0,
-                "new_item": None,
-                "item_used": None,
-                "combat_ended": False,
-                "level_up": False,
-                "xp_gained": 0,
-                "choices": []
-            }
-            
-        except Exception as e:
-            logger.warning(f"Error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries:
-                time.sleep(1.5)
-            else:
-                logger.error("All retries failed.")
-                return {
-                    "narrative": f"**[ERROR DEL SISTEMA]** El Dungeon Master está confuse y no pudo procesar tu acción.\n\n*Info de depuración:* {str(e)}",
-                    "hp_change": 0,
-                    "gold_change": 0,
-                    "new_item": None,
-                    "item_used": None,
-                    "combat_ended": False,
-                    "level_up": False,
-                    "xp_gained": 0,
-                    "choices": ["Intentar de nuevo"]
-                }
+        return mock_response(user_input)
+    
+    cached = cached_response(cache_key)
+    if cached is not None:
+        return cached
+    
+    payload = build_payload(build_messages(user_input, current_state))
+    client = get_client()
+    
+    def send(attempt, budget):
+        with stage_timer("llm_wait"), get_llm_scheduler().slot(session_key(current_state)):
+            data = client.post_chat(payload, timeout=budget.request_timeout())
+        response = parse_completion(data, attempt)
+        store_response(cache_key, response, current_state)
+        return response
+    
+    return run_attempts(send)
+
+async def query_dm_async(user_input, current_state, mock=False, cache_key=None):
+    logger.info(f"Player action: {user_input}")
+    
+    user_input = sanitize_input(user_input)
+    
+    if mock:
+        await asyncio.sleep(0.5)
+        return mock_response(user_input)
+    
+    cached = cached_response(cache_key)
+    if cached is not None:
+        return cached
+    
+    payload = build_payload(build_messages(user_input, current_state))
+    client = get_client()
+    scheduler = get_llm_scheduler()
+    
+    async def send(attempt, budget):
+        with stage_timer("llm_wait"):
+            ticket = scheduler.request(session_key(current_state))
+            try:
+                if not ticket.granted:
+                    await scheduler.wait_async(ticket)
+                data = await client.post_chat_async(payload, timeout=budget.request_timeout())
+            finally:
+                scheduler.release(ticket)
+        response = parse_completion(data, attempt)
+        store_response(cache_key, response, current_state)
+        return response
+    
+    return await run_attempts_async(send)
+
+def mock_stream(user_input):
+    words = mock_response(user_input)["narrative"].split(" ")
+    for count in range(1, len(words) + 1):
+        time.sleep(0.05)
+        yield " ".join(words[:count])
+
+def query_dm_stream(user_input, current_state, on_narrative, mock=False, cache_key=None):
+    logger.info(f"Player action: {user_input}")
+    
+    user_input = sanitize_input(user_input)
+    
+    if mock:
+        for partial in mock_stream(user_input):
+            on_narrative(partial)
+        return mock_response(user_input)
+    
+    cached = cached_response(cache_key)
+    if cached is not None:
+        on_narrative(cached["narrative"])
+        return cached
+    
+    payload = build_payload(build_messages(user_input, current_state))
+    client = get_client()
+    
+    def send(attempt, budget):
+        extractor = NarrativeExtractor()
+        chunks = []
+        with stage_timer("llm_wait"), get_llm_scheduler().slot(session_key(current_state), on_queue=queue_notice(on_narrative)) as ticket:
+            if ticket.queued:
+                on_narrative("")
+            stream = client.stream_chat(payload, timeout=budget.request_timeout())
+            try:
+                for delta in stream:
+                    chunks.append(delta)
+                    if extractor.feed(delta):
+                        on_narrative(extractor.narrative)
+                    if budget.expired():
+                        raise LLMTimeout(f"Turn deadline of {budget.seconds}s exceeded while streaming")
+            finally:
+                stream.close()
+        
+        response = parse_content("".join(chunks), attempt)
+        store_response(cache_key, response, current_state)
+        return response
+    
+    # A retry starts the narrative over.
+    return run_attempts(send, on_retry=lambda: on_narrative(""))
@@ -1,13 +1,29 @@
+import secrets
+import threading
+import time
+import uuid
 import dash
-from dash import html, dcc, Input, Output, State, ctx, no_update, clientside_callback
-from config import logger
-from game_logic import initialize_game, process_turn, save_game_state, load_game_state, get_save_info
+import flask
+from dash import html, dcc, Input, Output, State, Patch, ctx, no_update, clientside_callback
+from config import logger, STREAMING_ENABLED, STREAM_RESULT_TTL_SECONDS, SAVE_USER_MODE, USER_COOKIE_NAME, METRICS_ENABLED, METRICS_PATH
+from game_logic import initialize_game, play_turn, save_game_state, load_game_state, get_save_info
+from game_logic import append_to_log, get_log_page, discard_log
 from game_logic import get_next_level_xp, MAX_LEVEL, MAX_INVENTORY
 from frontend.layout import build_layout
 from frontend.components import render_stat_card_simple, render_health_bar, render_xp_bar, render_combat_card
+from frontend.components import render_chat_entry, OLDER_BUTTON_CLASS
+from llm.streaming import TurnStream
+from storage.sessions import get_session_store, new_session_id, is_session_id
+from storage.journal import get_turn_journal
+from content.registry import get_content
+from metrics import get_registry, timed_stage, CONTENT_TYPE
+from log_setup import setup_logging
 
 DEV_MODE = False
 
+setup_logging()
+get_content().validate()
+
 external_scripts = [
     {'src': 'https://cdn.tailwindcss.com?plugins=typography'} 
 ]
@@ -19,6 +35,85 @@ app = dash.Dash(__name__,
 app.title = "DungeonCore AI"
 app.layout = build_layout()
 
+if METRICS_ENABLED:
+    @app.server.route(METRICS_PATH)
+    def metrics_endpoint():
+        return flask.Response(get_registry().render(), content_type=CONTENT_TYPE)
+
+turn_streams = {}
+turn_streams_lock = threading.Lock()
+
+USER_COOKIE_MAX_AGE = 10 * 365 * 24 * 60 * 60
+
+def get_user_id():
+    if SAVE_USER_MODE != "cookie":
+        return None
+    
+    user_id = flask.request.cookies.get(USER_COOKIE_NAME, "")
+    if len(user_id) != 32 or not all(c in "0123456789abcdef" for c in user_id):
+        user_id = secrets.token_hex(16)
+        ctx.response.set_cookie(USER_COOKIE_NAME, user_id, max_age=USER_COOKIE_MAX_AGE, httponly=True, samesite="Lax")
+    return user_id
+
+def load_session(session_id):
+    if not is_session_id(session_id):
+        return None
+    state = get_session_store().load(session_id)
+    journal = get_turn_journal()
+    if state is None and session_id and journal is not None:
+        # Session store lost it (restart, eviction): rebuild the latest turn from the journal.
+        state = journal.recover(session_id)
+        if state is not None:
+            get_session_store().save(session_id, state)
+    return state
+
+def journal_snapshot(session_id, state, reason):
+    journal = get_turn_journal()
+    if journal is not None:
+        try:
+            journal.snapshot(session_id, state, reason)
+        except Exception as e:
+            logger.error(f"Journal snapshot failed: {e}")
+
+def format_turn_markdown(turn_text):
+    return turn_text.replace("👤 TÚ:", "\n> **👤 TÚ:**").replace("🎲 DM:", "\n**🎲 DM:**")
+
+def run_streamed_turn(stream, session_id, user_text, state):
+    try:
+        new_state, turn_text = play_turn(user_text, state, mock=DEV_MODE, on_narrative=stream.update)
+        entry = format_turn_markdown(turn_text)
+        index = append_to_log(new_state, entry)
+        get_session_store().save(session_id, new_state)
+        result = (new_state, entry, index)
+    except Exception as e:
+        logger.error(f"Streamed turn failed: {e}")
+        result = (None, f"\n\n⚠️ **Error procesando el turno:** {str(e)}", None)
+    stream.finish(result)
+
+# Drops finished turns whose client never polled them. Call with turn_streams_lock held.
+def sweep_turn_streams():
+    now = time.monotonic()
+    for stream_id, stream in list(turn_streams.items()):
+        if stream.finished_at is not None and now - stream.finished_at > STREAM_RESULT_TTL_SECONDS:
+            del turn_streams[stream_id]
+
+# True while a turn of this session is still being played: its result will overwrite the
+# session state when it finishes.
+def session_streaming(session_id):
+    with turn_streams_lock:
+        return any(stream.session_id == session_id and not stream.done for stream in turn_streams.values())
+
+def start_streamed_turn(session_id, user_text, current_state):
+    stream_id = uuid.uuid4().hex
+    stream = TurnStream(format_turn_markdown(f"\n\n👤 TÚ: {user_text.strip()[:500]}"), session_id)
+    with turn_streams_lock:
+        sweep_turn_streams()
+        turn_streams[stream_id] = stream
+    
+    threading.Thread(target=run_streamed_turn, args=(stream, session_id, user_text, current_state), daemon=True).start()
+    return stream_id
+
+@timed_stage("render")
 def render_stats_panel(state):
     level = state.get("level", 1)
     xp = state.get("xp", 0)
@@ -74,7 +169,7 @@ def render_stats_panel(state):
 
 clientside_callback(
     """
-    function(children) {
+    function(tail, streamChildren) {
         var chatBox = document.getElementById('chat-scroll-box');
         if(chatBox) {
             setTimeout(function() {
@@ -85,9 +180,37 @@ clientside_callback(
     }
     """,
     Output("chat-scroll-box", "className"), 
-    Input("chat-display", "children")
+    Input("chat-tail", "data"),
+    Input("stream-display", "children")
 )
 
+clientside_callback(
+    """
+    function(pageStart) {
+        window.dungeonChat.restoreScroll();
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("chat-scroll-box", "title"), 
+    Input("chat-page-start", "data")
+)
+
+SAVE_TRIGGERS = {"save-slot-1": 1, "save-slot-2": 2, "save-slot-3": 3}
+LOAD_TRIGGERS = {"load-slot-1": 1, "load-slot-2": 2, "load-slot-3": 3}
+
+def older_button_class(page_start):
+    return OLDER_BUTTON_CLASS if page_start else f"{OLDER_BUTTON_CLASS} hidden"
+
+def render_latest_page(state):
+    entries, start = get_log_page(state)
+    return [render_chat_entry(entry) for entry in entries], start, older_button_class(start)
+
+def append_entry(state, entry):
+    index = append_to_log(state, entry)
+    chat_patch = Patch()
+    chat_patch.append(render_chat_entry(entry))
+    return chat_patch, index
+
 @app.callback(
     [Output("chat-display", "children"),
      Output("stats-bar", "children"),
@@ -95,7 +218,12 @@ clientside_callback(
      Output("game-store", "data"),
      Output("dev-mode-indicator", "children"),
      Output("loading-trigger", "children"),
-     Output("save-slot-display", "children")], 
+     Output("save-slot-display", "children"),
+     Output("stream-poll", "disabled"),
+     Output("stream-id", "data"),
+     Output("chat-page-start", "data"),
+     Output("load-older-btn", "className"),
+     Output("chat-tail", "data")], 
     [Input("send-btn", "n_clicks"),
      Input("user-input", "n_submit"),
      Input("reset-btn", "n_clicks"),
@@ -107,83 +235,131 @@ clientside_callback(
      Input("load-slot-3", "n_clicks")],
     [State("user-input", "value"),
      State("game-store", "data"),
-     State("chat-display", "children")]
+     State("stream-id", "data")]
 )
 def main_game_loop(btn_click, enter_submit, reset_click, 
                    save1, save2, save3, load1, load2, load3,
-                   user_text, current_state, current_chat_children):
+                   user_text, session_data, active_stream_id):
     trigger = ctx.triggered_id
     dev_msg = f"🛠️ MOCK: {'ON' if DEV_MODE else 'OFF'}"
-    
-    current_log_text = current_chat_children if isinstance(current_chat_children, str) else ""
-    if not current_log_text: 
-        current_log_text = ""
+    sessions = get_session_store()
+    session_id = (session_data or {}).get("session_id")
+    current_state = load_session(session_id)
+    user_id = get_user_id()
     
     slot_display = ""
     for slot in [1, 2, 3]:
-        info = get_save_info(slot)
+        info = get_save_info(slot, user_id)
         if info:
             status = "☠️" if info.get("game_over") else "✅"
             slot_display += f"| Ranura {slot}: {status} Nivel {info['level']} | "
     
+    # A turn still being played would write its result over whatever these leave behind.
+    if current_state and (trigger == "reset-btn" or trigger in SAVE_TRIGGERS or trigger in LOAD_TRIGGERS) and session_streaming(session_id):
+        return no_update, no_update, no_update, no_update, dev_msg, no_update, "⏳ Espera a que termine el turno en curso para guardar, cargar o reiniciar.", no_update, no_update, no_update, no_update, no_update
+    
     if not current_state or trigger == "reset-btn":
         logger.info("Iniciando nueva partida...")
+        session_id = new_session_id()
+        discard_log(current_state)
         new_state = initialize_game()
-        return new_state['display_log'], render_stats_panel(new_state), "", new_state, dev_msg, "", slot_display
-    
-    if trigger == "save-slot-1":
-        success, msg = save_game_state(current_state, 1)
-        updated_log = current_log_text + f"\n\n💾 **{msg}**"
-        current_state['display_log'] = updated_log
-        return updated_log, render_stats_panel(current_state), "", current_state, dev_msg, "", slot_display
-    
-    if trigger == "save-slot-2":
-        success, msg = save_game_state(current_state, 2)
-        updated_log = current_log_text + f"\n\n💾 **{msg}**"
-        current_state['display_log'] = updated_log
-        return updated_log, render_stats_panel(current_state), "", current_state, dev_msg, "", slot_display
-    
-    if trigger == "save-slot-3":
-        success, msg = save_game_state(current_state, 3)
-        updated_log = current_log_text + f"\n\n💾 **{msg}**"
-        current_state['display_log'] = updated_log
-        return updated_log, render_stats_panel(current_state), "", current_state, dev_msg, "", slot_display
-    
-    if trigger == "load-slot-1":
-        loaded_state, msg = load_game_state(1)
-        if loaded_state:
-            return loaded_state['display_log'], render_stats_panel(loaded_state), "", loaded_state, dev_msg, "", slot_display
-        else:
-            updated_log = current_log_text + f"\n\n⚠️ **{msg}**"
-            return updated_log, render_stats_panel(current_state), "", current_state, dev_msg, "", slot_display
+        new_state["session_id"] = session_id
+        sessions.save(session_id, new_state)
+        journal_snapshot(session_id, new_state, "new")
+        chat, start, older_cls = render_latest_page(new_state)
+        return chat, render_stats_panel(new_state), "", {"session_id": session_id}, dev_msg, "", slot_display, no_update, no_update, start, older_cls, start + len(chat)
     
-    if trigger == "load-slot-2":
-        loaded_state, msg = load_game_state(2)
-        if loaded_state:
-            return loaded_state['display_log'], render_stats_panel(loaded_state), "", loaded_state, dev_msg, "", slot_display
-        else:
-            updated_log = current_log_text + f"\n\n⚠️ **{msg}**"
-            return updated_log, render_stats_panel(current_state), "", current_state, dev_msg, "", slot_display
+    if trigger is None:
+        chat, start, older_cls = render_latest_page(current_state)
+        return chat, render_stats_panel(current_state), no_update, no_update, dev_msg, no_update, slot_display, no_update, no_update, start, older_cls, start + len(chat)
     
-    if trigger == "load-slot-3":
-        loaded_state, msg = load_game_state(3)
+    if trigger in SAVE_TRIGGERS:
+        success, msg = save_game_state(current_state, SAVE_TRIGGERS[trigger], user_id)
+        chat, index = append_entry(current_state, f"\n\n💾 **{msg}**")
+        sessions.save(session_id, current_state)
+        return chat, render_stats_panel(current_state), "", no_update, dev_msg, "", slot_display, no_update, no_update, no_update, no_update, index
+    
+    if trigger in LOAD_TRIGGERS:
+        loaded_state, msg = load_game_state(LOAD_TRIGGERS[trigger], user_id)
         if loaded_state:
-            return loaded_state['display_log'], render_stats_panel(loaded_state), "", loaded_state, dev_msg, "", slot_display
+            discard_log(current_state)
+            loaded_state["session_id"] = session_id
+            sessions.save(session_id, loaded_state)
+            journal_snapshot(session_id, loaded_state, "load")
+            chat, start, older_cls = render_latest_page(loaded_state)
+            return chat, render_stats_panel(loaded_state), "", no_update, dev_msg, "", slot_display, no_update, no_update, start, older_cls, start + len(chat)
         else:
-            updated_log = current_log_text + f"\n\n⚠️ **{msg}**"
-            return updated_log, render_stats_panel(current_state), "", current_state, dev_msg, "", slot_display
+            chat, index = append_entry(current_state, f"\n\n⚠️ **{msg}**")
+            sessions.save(session_id, current_state)
+            return chat, render_stats_panel(current_state), "", no_update, dev_msg, "", slot_display, no_update, no_update, no_update, no_update, index
     
     if (trigger == "send-btn" or trigger == "user-input") and user_text:
-        new_state, turn_text = process_turn(user_text, current_state, mock=DEV_MODE)
+        if active_stream_id in turn_streams or session_streaming(session_id):
+            return no_update, no_update, no_update, no_update, dev_msg, no_update, slot_display, no_update, no_update, no_update, no_update, no_update
         
-        turn_text_md = turn_text.replace("👤 TÚ:", "\n> **👤 TÚ:**").replace("🎲 DM:", "\n**🎲 DM:**")
+        if STREAMING_ENABLED:
+            stream_id = start_streamed_turn(session_id, user_text, current_state)
+            return no_update, no_update, "", no_update, dev_msg, "", slot_display, False, stream_id, no_update, no_update, no_update
         
-        full_log = current_log_text + turn_text_md
-        new_state['display_log'] = full_log 
+        new_state, turn_text = play_turn(user_text, current_state, mock=DEV_MODE)
+        chat, index = append_entry(new_state, format_turn_markdown(turn_text))
+        sessions.save(session_id, new_state)
         
-        return full_log, render_stats_panel(new_state), "", new_state, dev_msg, "", slot_display
+        return chat, render_stats_panel(new_state), "", no_update, dev_msg, "", slot_display, no_update, no_update, no_update, no_update, index
+    
+    return no_update, no_update, no_update, no_update, dev_msg, no_update, slot_display, no_update, no_update, no_update, no_update, no_update
+
+@app.callback(
+    [Output("chat-display", "children", allow_duplicate=True),
+     Output("stream-display", "children"),
+     Output("stats-bar", "children", allow_duplicate=True),
+     Output("stream-poll", "disabled", allow_duplicate=True),
+     Output("stream-id", "data", allow_duplicate=True),
+     Output("chat-tail", "data", allow_duplicate=True)],
+    Input("stream-poll", "n_intervals"),
+    State("stream-id", "data"),
+    prevent_initial_call=True
+)
+def poll_turn_stream(n_intervals, stream_id):
+    stream = turn_streams.get(stream_id)
+    if stream is None:
+        return no_update, "", no_update, True, None, no_update
+    
+    narrative, done, result = stream.snapshot()
+    if not done:
+        return no_update, f"{stream.prefix}\n**🎲 DM:** {narrative}▌", no_update, False, no_update, no_update
+    
+    with turn_streams_lock:
+        turn_streams.pop(stream_id, None)
+    
+    new_state, entry, index = result
+    if new_state is None:
+        return no_update, entry, no_update, True, None, no_update
+    
+    chat_patch = Patch()
+    chat_patch.append(render_chat_entry(entry))
+    return chat_patch, "", render_stats_panel(new_state), True, None, index
+
+@app.callback(
+    [Output("chat-display", "children", allow_duplicate=True),
+     Output("chat-page-start", "data", allow_duplicate=True),
+     Output("load-older-btn", "className", allow_duplicate=True)],
+    Input("load-older-btn", "n_clicks"),
+    State("chat-page-start", "data"),
+    State("game-store", "data"),
+    prevent_initial_call=True
+)
+def load_older_turns(n_clicks, page_start, session_data):
+    current_state = load_session((session_data or {}).get("session_id"))
+    if not page_start or not current_state:
+        return no_update, no_update, no_update
+    
+    entries, start = get_log_page(current_state, before=page_start)
+    chat_patch = Patch()
+    for entry in reversed(entries):
+        chat_patch.prepend(render_chat_entry(entry))
     
-    return no_update, no_update, no_update, no_update, dev_msg, no_update, slot_display
+    return chat_patch, start, older_button_class(start)
 
 if __name__ == "__main__":
     app.run(debug=True, port=8050)
@@ -0,0 +1,35 @@
+// Pages older turns into the chat when the player scrolls to the top, keeping the
+// scroll position anchored on the turn they were reading.
+window.dungeonChat = {
+    previousHeight: null,
+
+    restoreScroll: function() {
+        var chatBox = document.getElementById('chat-scroll-box');
+        var previousHeight = window.dungeonChat.previousHeight;
+        if (!chatBox || previousHeight === null) {
+            return;
+        }
+        setTimeout(function() {
+            chatBox.scrollTop = chatBox.scrollHeight - previousHeight;
+            window.dungeonChat.previousHeight = null;
+        }, 50);
+    }
+};
+
+document.addEventListener('click', function(event) {
+    if (event.target && event.target.id === 'load-older-btn') {
+        var chatBox = document.getElementById('chat-scroll-box');
+        window.dungeonChat.previousHeight = chatBox ? chatBox.scrollHeight : null;
+    }
+}, true);
+
+document.addEventListener('scroll', function(event) {
+    var chatBox = event.target;
+    if (!chatBox || chatBox.id !== 'chat-scroll-box' || chatBox.scrollTop > 40) {
+        return;
+    }
+    var button = document.getElementById('load-older-btn');
+    if (button && !button.classList.contains('hidden') && window.dungeonChat.previousHeight === null) {
+        button.click();
+    }
+}, true);
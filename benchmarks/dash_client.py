@@ -0,0 +1,68 @@
+import json
+import requests
+
+# Drives Dash callbacks the way the browser does: POST /_dash-update-component with the
+# callback's outputs, inputs and state. Works against a live server (base_url) or in-process
+# through the Flask test client (flask_app).
+
+
+class DashCallbackClient:
+    def __init__(self, base_url=None, flask_app=None, timeout=120):
+        self.base_url = (base_url or "").rstrip("/")
+        self.timeout = timeout
+        self._test_client = flask_app.test_client() if flask_app is not None else None
+        self._session = requests.Session() if self._test_client is None else None
+        self._callbacks = None
+
+    def _get(self, path):
+        if self._test_client is not None:
+            return json.loads(self._test_client.get(path).data)
+        response = self._session.get(self.base_url + path, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _post(self, path, payload):
+        if self._test_client is not None:
+            response = self._test_client.post(path, json=payload)
+            return response.status_code, response.data
+        response = self._session.post(self.base_url + path, json=payload, timeout=self.timeout)
+        return response.status_code, response.content
+
+    def callbacks(self):
+        if self._callbacks is None:
+            self._callbacks = self._get("/_dash-dependencies")
+        return self._callbacks
+
+    # First callback whose outputs include every "component.property" in `outputs`.
+    def find(self, *outputs):
+        for callback in self.callbacks():
+            names = [o.split("@")[0] for o in callback["output"].strip(".").split("...")]
+            if all(output in names for output in outputs):
+                return callback
+        raise KeyError(f"No callback with outputs {outputs}")
+
+    def call(self, callback, inputs=None, state=None, changed=()):
+        inputs, state = inputs or {}, state or {}
+
+        def spec(items, values):
+            return [{"id": d["id"], "property": d["property"], "value": values.get(f"{d['id']}.{d['property']}")}
+                    for d in items]
+
+        outputs = []
+        for output in callback["output"].strip(".").split("..."):
+            component, prop = output.split("@")[0].split(".", 1)
+            outputs.append({"id": component, "property": prop})
+
+        payload = {
+            "output": callback["output"],
+            "outputs": outputs,
+            "inputs": spec(callback["inputs"], inputs),
+            "state": spec(callback["state"], state),
+            "changedPropIds": list(changed)
+        }
+        status, body = self._post("/_dash-update-component", payload)
+        if status == 204:
+            return {}
+        if status != 200:
+            raise RuntimeError(f"Callback {callback['output'][:60]} failed with HTTP {status}: {body[:300]!r}")
+        return json.loads(body)["response"]
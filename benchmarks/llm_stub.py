@@ -0,0 +1,131 @@
+import hashlib
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Deterministic stand-in for the LM Studio server: the same prompt always gets the same
+# completion, instantly, so benchmarks measure the game and not the model.
+
+NARRATIVES = [
+    "La antorcha chisporrotea mientras avanzas. Las paredes húmedas devuelven el eco de tus pasos.",
+    "Un crujido a tu espalda te pone en guardia, pero solo es una rata que huye entre los huesos.",
+    "El aire huele a hierro y a moho. Encuentras marcas de garras recientes en la piedra.",
+    "Tu golpe resuena en la cripta. El enemigo retrocede, tambaleándose, con un gruñido de dolor.",
+    "Una corriente helada apaga por un instante tu antorcha. Algo te observa desde la oscuridad."
+]
+
+
+def stub_content(payload):
+    messages = payload.get("messages") or [{}]
+    digest = hashlib.sha1(str(messages[-1].get("content", "")).encode("utf-8")).digest()
+    return json.dumps({
+        "narrative": NARRATIVES[digest[0] % len(NARRATIVES)],
+        "hp_change": 0,
+        "gold_change": digest[1] % 3,
+        "new_item": None,
+        "item_used": None,
+        "combat_ended": False,
+        "choices": ["Avanzar", "Examinar", "Retroceder"]
+    }, ensure_ascii=False)
+
+def prompt_tokens(payload):
+    return sum(len(str(message.get("content", ""))) for message in payload.get("messages") or []) // 4
+
+def usage(content, prompt_tokens=0):
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4}
+
+def completion_body(content, prompt_tokens=0):
+    return {
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage(content, prompt_tokens)
+    }
+
+def wants_usage(payload):
+    return bool((payload.get("stream_options") or {}).get("include_usage"))
+
+def sse_event(data):
+    return f"data: {data}\n\n".encode("utf-8")
+
+def chunk_event(delta):
+    return sse_event(json.dumps({"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": delta}}]},
+                                ensure_ascii=False))
+
+# Last chunk of a stream requested with stream_options.include_usage: no choices, just usage.
+def usage_event(content, prompt_tokens=0):
+    return sse_event(json.dumps({"object": "chat.completion.chunk", "choices": [], "usage": usage(content, prompt_tokens)}))
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, delayed ACKs add ~40ms per call.
+    disable_nagle_algorithm = True
+    chunk_chars = 16
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_payload(self):
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.write_chunk(sse_event("[DONE]"))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        payload = self.read_payload()
+        content = stub_content(payload)
+        if not payload.get("stream"):
+            self.send_json(200, completion_body(content, prompt_tokens(payload)))
+            return
+
+        self.start_stream()
+        for i in range(0, len(content), self.chunk_chars):
+            self.write_chunk(chunk_event(content[i:i + self.chunk_chars]))
+        if wants_usage(payload):
+            self.write_chunk(usage_event(content, prompt_tokens(payload)))
+        self.end_stream()
+
+
+class StubLLMServer:
+    def __init__(self, host="127.0.0.1", port=0, handler=StubLLMHandler):
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
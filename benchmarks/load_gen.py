@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from benchmarks.dash_client import DashCallbackClient
+from benchmarks.mock_lmstudio import add_latency_arguments, server_from_arguments
+from benchmarks.turn_bench import percentile, INPUTS
+
+# Load generator: N simulated players, each in its own thread with its own HTTP session,
+# play turns through the real Dash callback endpoint (/_dash-update-component) exactly like
+# the browser: click send, then follow the stream poll until the turn lands.
+#
+#   python -m benchmarks.load_gen --players 8 --turns 5 --slots 2 --malformed-rate 0.05
+#   python -m benchmarks.load_gen --url http://127.0.0.1:8050 --players 4   (running app)
+
+# Narratives the game shows when the LLM call failed for good.
+DEGRADED_MARKERS = ("Error de Conexión", "ERROR DEL SISTEMA", "Error procesando el turno", "tarda demasiado",
+                    "Servidor de IA no disponible")
+
+
+class Player(threading.Thread):
+    def __init__(self, index, base_url, turns, think_time, poll_interval, start_gate):
+        super().__init__(daemon=True)
+        self.index = index
+        self.turns = turns
+        self.think_time = think_time
+        self.poll_interval = poll_interval
+        self.start_gate = start_gate
+        self.client = DashCallbackClient(base_url)
+        self.latencies = []
+        self.first_narrative = []
+        self.degraded = 0
+        self.queued_turns = 0
+        self.errors = []
+
+    def play_turn(self, main_loop, poll, session_data, clicks, text):
+        started = time.perf_counter()
+        response = self.client.call(main_loop, {"send-btn.n_clicks": clicks},
+                                    {"user-input.value": text, "game-store.data": session_data, "stream-id.data": None},
+                                    ["send-btn.n_clicks"])
+        stream_id = response.get("stream-id", {}).get("data")
+        body = json.dumps(response, ensure_ascii=False)
+
+        polls, first_narrative, queued = 0, None, False
+        while stream_id:
+            time.sleep(self.poll_interval)
+            polls += 1
+            response = self.client.call(poll, {"stream-poll.n_intervals": polls}, {"stream-id.data": stream_id},
+                                        ["stream-poll.n_intervals"])
+            shown = response.get("stream-display", {}).get("children") or ""
+            queued = queued or "⏳" in shown
+            # The queue notice ("⏳ Turno en cola ...") is not narration.
+            if first_narrative is None and shown.endswith("▌") and not shown.endswith("**🎲 DM:** ▌") and "⏳" not in shown:
+                first_narrative = time.perf_counter() - started
+            if response.get("stream-poll", {}).get("disabled"):
+                body = json.dumps(response, ensure_ascii=False)
+                break
+
+        self.latencies.append(time.perf_counter() - started)
+        if first_narrative is not None:
+            self.first_narrative.append(first_narrative)
+        if queued:
+            self.queued_turns += 1
+        if any(marker in body for marker in DEGRADED_MARKERS):
+            self.degraded += 1
+
+    def run(self):
+        try:
+            main_loop = self.client.find("chat-display.children", "user-input.value")
+            poll = self.client.find("stream-display.children")
+            session_data = self.client.call(main_loop)["game-store"]["data"]
+        except Exception as e:
+            self.errors.append(f"setup: {e}")
+        self.start_gate.wait()
+        if self.errors:
+            return
+
+        for turn in range(self.turns):
+            try:
+                self.play_turn(main_loop, poll, session_data, turn + 1, INPUTS[(self.index + turn) % len(INPUTS)])
+            except Exception as e:
+                self.errors.append(str(e))
+            if self.think_time:
+                time.sleep(self.think_time)
+
+
+def start_app_server(llm_urls, streaming, slots, routing="least_loaded", hedge=False):
+    # Imported here, after main() has moved into the work directory (see turn_bench).
+    from werkzeug.serving import make_server
+    from llm.client import LLMClient, set_client
+    from llm.router import LLMRouter
+    from llm.scheduler import get_llm_scheduler
+    import app
+
+    client = LLMRouter(llm_urls, strategy=routing, hedge=hedge) if len(llm_urls) > 1 else LLMClient(llm_urls[0])
+    set_client(client)
+    get_llm_scheduler().slots = slots
+    app.STREAMING_ENABLED = streaming
+    server = make_server("127.0.0.1", 0, app.app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", client
+
+def summarize(players, wall_seconds):
+    latencies = sorted(t for p in players for t in p.latencies)
+    first = sorted(t for p in players for t in p.first_narrative)
+    errors = [e for p in players for e in p.errors]
+
+    def ms(values, q):
+        value = percentile(values, q)
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "players": len(players),
+        "turns": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "degraded_turns": sum(p.degraded for p in players),
+        "queued_turns": sum(p.queued_turns for p in players),
+        "wall_seconds": round(wall_seconds, 2),
+        "turns_per_second": round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        "turn_ms": {"mean": round(statistics.fmean(latencies) * 1000, 1) if latencies else None,
+                    "p50": ms(latencies, 50), "p95": ms(latencies, 95), "p99": ms(latencies, 99), "max": ms(latencies, 100)},
+        "first_narrative_ms": {"p50": ms(first, 50), "p95": ms(first, 95), "p99": ms(first, 99)}
+    }
+
+def print_report(report):
+    turn, first = report["turn_ms"], report["first_narrative_ms"]
+    print(f"players {report['players']}  turns {report['turns']}  wall {report['wall_seconds']}s  "
+          f"throughput {report['turns_per_second']} turns/s")
+    print(f"turn latency ms      p50 {turn['p50']}  p95 {turn['p95']}  p99 {turn['p99']}  max {turn['max']}")
+    if first["p50"] is not None:
+        print(f"first narrative ms   p50 {first['p50']}  p95 {first['p95']}  p99 {first['p99']}")
+    print(f"queued turns {report['queued_turns']}  degraded turns {report['degraded_turns']}  client errors {report['errors']}")
+    for sample in report["error_samples"]:
+        print(f"  ! {sample}")
+    for stats in report.get("llm", []):
+        print(f"mock LLM {json.dumps(stats)}")
+    if "responses" in report:
+        responses = report["responses"]
+        print(f"DM responses {responses['responses']}  strict {responses['strict']}  repaired {responses['repaired']}  "
+              f"failed {responses['failed']}  retries {responses['retries']} ({responses['retry_rate']:.1%})")
+    if "router" in report:
+        print(f"router {json.dumps({k: v for k, v in report['router'].items() if k != 'backends'})}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive concurrent simulated players through the Dash callbacks.")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=5, help="Turns per player")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds each player waits between turns")
+    parser.add_argument("--poll-interval", type=float, default=0.15, help="Stream poll interval (STREAM_POLL_INTERVAL_MS)")
+    parser.add_argument("--url", help="Base URL of a running app; by default one is started in-process")
+    parser.add_argument("--llm-url", action="append",
+                        help="LLM endpoint for the in-process app, repeat to route over several; by default mock servers are started")
+    parser.add_argument("--backends", type=int, default=1, help="Mock LLM servers to start and route over")
+    parser.add_argument("--straggler", type=float, default=1.0,
+                        help="Multiply the last mock backend's time to first token by this (a slow box)")
+    parser.add_argument("--routing", choices=["least_loaded", "latency"], default="least_loaded")
+    parser.add_argument("--hedge", action="store_true", help="Hedge requests across backends after their p95")
+    parser.add_argument("--llm-slots", type=int,
+                        help="LLM_SLOTS of the in-process app (default: --slots times the number of backends)")
+    parser.add_argument("--no-streaming", action="store_true", help="In-process app answers turns synchronously")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--workdir", help="Directory for the saves/transcripts the game writes (default: a temp dir)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the game's INFO logging on")
+    add_latency_arguments(parser)
+    args = parser.parse_args(argv)
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    mocks, app_server, base_url, client = [], None, args.url, None
+    if base_url is None:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        os.chdir(args.workdir or tempfile.mkdtemp(prefix="dungeoncore-load-"))
+        from config import logger
+        if not args.verbose:
+            logger.setLevel("WARNING")
+            import logging
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+        llm_urls = args.llm_url
+        if not llm_urls:
+            for i in range(args.backends):
+                mock = server_from_arguments(args, index=i)
+                if i == args.backends - 1:
+                    mock.ttft *= args.straggler
+                mocks.append(mock.start())
+            llm_urls = [mock.url for mock in mocks]
+        slots = args.llm_slots or args.slots * len(llm_urls)
+        app_server, base_url, client = start_app_server(llm_urls, not args.no_streaming, slots, args.routing, args.hedge)
+
+    gate = threading.Barrier(args.players + 1)
+    players = [Player(i, base_url, args.turns, args.think_time, args.poll_interval, gate) for i in range(args.players)]
+    try:
+        # One request before the players start: the server's lazy imports (plotly's JSON encoder
+        # pulls in numpy on first use) then happen once, outside the measured, concurrent traffic.
+        warmup = DashCallbackClient(base_url)
+        warmup.call(warmup.find("chat-display.children", "user-input.value"))
+
+        for player in players:
+            player.start()
+        gate.wait(timeout=60)
+        started = time.perf_counter()
+        for player in players:
+            player.join()
+        report = summarize(players, time.perf_counter() - started)
+        if mocks:
+            report["llm"] = [mock.stats() for mock in mocks]
+        if client is not None and hasattr(client, "backends"):
+            report["router"] = client.stats()
+        if app_server is not None:
+            from llm.schema import get_response_stats
+            report["responses"] = get_response_stats().stats()
+    finally:
+        if app_server is not None:
+            app_server.shutdown()
+        for mock in mocks:
+            mock.stop()
+
+    print_report(report)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import argparse
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from benchmarks.llm_stub import StubLLMHandler, StubLLMServer, stub_content, completion_body, chunk_event
+from benchmarks.llm_stub import usage_event, wants_usage, prompt_tokens
+
+# OpenAI-compatible stand-in for LM Studio with a latency model and fault injection, so the
+# HTTP, JSON-repair and retry paths can be load-tested without a GPU:
+#
+#   python -m benchmarks.mock_lmstudio --port 1234 --ttft 0.4 --tps 35 --slots 1 --malformed-rate 0.05
+#
+# Every request waits for one of `slots` generation slots (LM Studio runs a fixed number of
+# parallel sequences and queues the rest), then pays the time to first token plus
+# tokens / tokens_per_second.
+
+CHARS_PER_TOKEN = 4
+
+# Broken completions the model produces in practice. json_repair fixes the first three;
+# the last two fail parsing and force a retry.
+MALFORMED_KINDS = ["truncated", "fenced", "single_quotes", "no_narrative", "prose"]
+
+def malform(content, kind):
+    if kind == "truncated":
+        return content[:int(len(content) * 0.8)]
+    if kind == "fenced":
+        return f"Claro, aquí tienes la respuesta:\n```json\n{content}\n```"
+    if kind == "single_quotes":
+        return content.replace('"', "'")
+    if kind == "no_narrative":
+        data = json.loads(content)
+        data.pop("narrative")
+        return json.dumps(data, ensure_ascii=False)
+    return json.loads(content)["narrative"]
+
+
+class MockLMStudioHandler(StubLLMHandler):
+    def do_GET(self):
+        mock = self.server.mock
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": mock.model, "object": "model", "owned_by": "organization_owner"}]})
+        elif self.path.rstrip("/").endswith("/stats"):
+            self.send_json(200, mock.stats())
+        else:
+            self.send_json(404, {"error": f"Unexpected endpoint or method. (GET {self.path})"})
+
+    def do_POST(self):
+        mock = self.server.mock
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": f"Unexpected endpoint or method. (POST {self.path})"})
+            return
+
+        payload = self.read_payload()
+        constrained = (payload.get("response_format") or {}).get("type") == "json_schema"
+        if constrained and not mock.structured_output:
+            mock.count("schema_rejected")
+            self.send_json(400, {"error": "'response_format.type' must be 'text'"})
+            return
+        fault = mock.roll_fault(constrained)
+        if fault == "drop":
+            # Reset the connection without answering: the client sees a connection error.
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        if fault in ("500", "503"):
+            self.send_json(int(fault), {"error": "Model is busy" if fault == "503" else "Model crashed during generation"})
+            return
+
+        content = stub_content(payload)
+        if fault in MALFORMED_KINDS:
+            content = malform(content, fault)
+        tokens = max(1, len(content) // CHARS_PER_TOKEN)
+
+        with mock.slot():
+            time.sleep(mock.time_to_first_token())
+            if not payload.get("stream"):
+                time.sleep(tokens / mock.tokens_per_second)
+                self.send_json(200, completion_body(content, prompt_tokens(payload)))
+            else:
+                self.start_stream()
+                delay = self.chunk_chars / CHARS_PER_TOKEN / mock.tokens_per_second
+                for i in range(0, len(content), self.chunk_chars):
+                    self.write_chunk(chunk_event(content[i:i + self.chunk_chars]))
+                    time.sleep(delay)
+                if wants_usage(payload):
+                    self.write_chunk(usage_event(content, prompt_tokens(payload)))
+                self.end_stream()
+                mock.count("streamed")
+        mock.count("completed")
+        mock.count("completion_tokens", tokens)
+
+
+class MockLMStudioServer(StubLLMServer):
+    def __init__(self, host="127.0.0.1", port=0, ttft=0.3, ttft_jitter=0.1, tokens_per_second=40.0, slots=1,
+                 error_rate=0.0, drop_rate=0.0, malformed_rate=0.0, seed=None, model="local-model", structured_output=True):
+        super().__init__(host, port, handler=MockLMStudioHandler)
+        self.server.mock = self
+        self.ttft = ttft
+        self.ttft_jitter = ttft_jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.malformed_rate = malformed_rate
+        self.model = model
+        self.structured_output = structured_output
+        self._slots = threading.BoundedSemaphore(slots)
+        self._slot_count = slots
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "completed": 0, "streamed": 0, "errors_injected": 0, "drops_injected": 0,
+                       "malformed_injected": 0, "schema_rejected": 0, "completion_tokens": 0, "queued": 0,
+                       "max_queued": 0, "busy_slots": 0}
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, slots=self._slot_count)
+
+    # A schema-constrained completion (response_format json_schema) is never malformed.
+    def roll_fault(self, constrained=False):
+        with self._lock:
+            self._stats["requests"] += 1
+            roll = self._rng.random()
+            if roll < self.drop_rate:
+                self._stats["drops_injected"] += 1
+                return "drop"
+            roll -= self.drop_rate
+            if roll < self.error_rate:
+                self._stats["errors_injected"] += 1
+                return self._rng.choice(["500", "503"])
+            roll -= self.error_rate
+            if roll < self.malformed_rate and not constrained:
+                self._stats["malformed_injected"] += 1
+                return self._rng.choice(MALFORMED_KINDS)
+            return None
+
+    def time_to_first_token(self):
+        with self._lock:
+            return max(0.0, self.ttft + self._rng.uniform(-self.ttft_jitter, self.ttft_jitter))
+
+    # Waits in line for a generation slot, tracking the queue depth.
+    @contextmanager
+    def slot(self):
+        with self._lock:
+            self._stats["queued"] += 1
+            self._stats["max_queued"] = max(self._stats["max_queued"], self._stats["queued"])
+        self._slots.acquire()
+        with self._lock:
+            self._stats["queued"] -= 1
+            self._stats["busy_slots"] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._stats["busy_slots"] -= 1
+            self._slots.release()
+
+
+def add_latency_arguments(parser):
+    parser.add_argument("--ttft", type=float, default=0.3, help="Time to first token in seconds")
+    parser.add_argument("--ttft-jitter", type=float, default=0.1, help="Uniform +/- jitter on the TTFT")
+    parser.add_argument("--tps", type=float, default=40.0, help="Generated tokens per second, per slot")
+    parser.add_argument("--slots", type=int, default=1, help="Parallel generation slots; other requests queue")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500/503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Share of connections reset without an answer")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of completions with broken JSON")
+    parser.add_argument("--seed", type=int, help="Seed for jitter and fault injection")
+    parser.add_argument("--no-structured-output", action="store_true",
+                        help="Answer requests with a json_schema response_format with HTTP 400, like servers without grammar support")
+
+# `index` tells apart several servers started from the same arguments (distinct seeds).
+def server_from_arguments(args, host="127.0.0.1", port=0, index=0):
+    seed = None if args.seed is None else args.seed + index
+    return MockLMStudioServer(host, port, ttft=args.ttft, ttft_jitter=args.ttft_jitter, tokens_per_second=args.tps,
+                              slots=args.slots, error_rate=args.error_rate, drop_rate=args.drop_rate,
+                              malformed_rate=args.malformed_rate, seed=seed,
+                              structured_output=not args.no_structured_output)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock LM Studio server with a latency model and fault injection.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234, help="1234 is LM Studio's default, so the game needs no config change")
+    add_latency_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = server_from_arguments(args, args.host, args.port)
+    print(f"Mock LM Studio listening on {server.url} (Ctrl+C to stop)")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+        print(json.dumps(server.stats(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import copy
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# Turn-latency benchmark: times every stage of a turn (sanitize -> parse -> combat -> prompt
+# -> HTTP -> JSON repair -> state update -> stats panel -> save I/O) and the whole
+# process_turn / main_game_loop path against the deterministic LLM stub.
+#
+#   python -m benchmarks.turn_bench --save benchmarks/baselines/v1.json
+#   python -m benchmarks.turn_bench --compare benchmarks/baselines/v1.json
+
+INPUTS = ["atacar", "miro alrededor", "defiendo", "busco en los restos", "ataco con la espada"]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def measure(fn, setup=None, iterations=200, warmup=10, alloc_iterations=30):
+    for _ in range(warmup):
+        fn(*(setup() if setup else ()))
+
+    times = []
+    for _ in range(iterations):
+        args = setup() if setup else ()
+        started = time.perf_counter_ns()
+        fn(*args)
+        times.append(time.perf_counter_ns() - started)
+    times.sort()
+
+    # Separate pass: tracemalloc slows every allocation down, so it must not skew the timings.
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(min(iterations, alloc_iterations)):
+            args = setup() if setup else ()
+            blocks_before = sys.getallocatedblocks()
+            tracemalloc.reset_peak()
+            current_before = tracemalloc.get_traced_memory()[0]
+            fn(*args)
+            peak = tracemalloc.get_traced_memory()[1]
+            retained.append(sys.getallocatedblocks() - blocks_before)
+            peaks.append(peak - current_before)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "mean_ms": statistics.fmean(times) / 1e6,
+        "p50_ms": percentile(times, 50) / 1e6,
+        "p95_ms": percentile(times, 95) / 1e6,
+        "p99_ms": percentile(times, 99) / 1e6,
+        "max_ms": times[-1] / 1e6,
+        "peak_kb": statistics.median(peaks) / 1024,
+        "retained_blocks": int(statistics.median(retained))
+    }
+
+
+def build_stages(llm_url):
+    # Imported here, after main() has moved into the work directory, so the saves,
+    # transcripts, journals and logs the game writes stay out of the source tree.
+    import app
+    import game_logic
+    from ai_engine import sanitize_input, prompt_builder, build_payload, parse_completion
+    from intents import parse_intent
+    from llm.client import LLMClient, set_client, get_client
+    from llm.prompt_builder import build_context_string
+    from session_rng import SessionRandom
+    from storage.sessions import get_session_store, new_session_id
+    from benchmarks.dash_client import DashCallbackClient
+    from benchmarks.llm_stub import stub_content, completion_body
+
+    set_client(LLMClient(llm_url))
+    app.STREAMING_ENABLED = False
+
+    explore_state = game_logic.initialize_game(seed=1)
+    explore_state["session_id"] = new_session_id()
+    for i in range(5):
+        explore_state["history"].append({"role": "user", "content": INPUTS[i]})
+        explore_state["history"].append({"role": "assistant", "content": "La antorcha chisporrotea mientras avanzas."})
+    combat_state = copy.deepcopy(explore_state)
+    game_logic.start_combat(combat_state, game_logic.spawn_enemy("orc", SessionRandom(1)))
+
+    messages, _ = prompt_builder.build("atacar", combat_state)
+    payload = build_payload(messages)
+    completion = completion_body(stub_content(payload))
+    dm_response = parse_completion(completion, 0)
+
+    counter = {"i": 0}
+    def next_input():
+        counter["i"] += 1
+        return INPUTS[counter["i"] % len(INPUTS)]
+
+    def combat_args():
+        counter["i"] += 1
+        return copy.deepcopy(combat_state), SessionRandom(counter["i"])
+
+    sessions = get_session_store()
+    dash = DashCallbackClient(flask_app=app.app.server)
+    main_loop = dash.find("chat-display.children", "user-input.value")
+    session_data = dash.call(main_loop)["game-store"]["data"]
+
+    def dash_turn(text):
+        counter["i"] += 1
+        dash.call(main_loop, {"send-btn.n_clicks": counter["i"]},
+                  {"user-input.value": text, "game-store.data": session_data, "stream-id.data": None},
+                  ["send-btn.n_clicks"])
+
+    return [
+        ("sanitize_input", sanitize_input, lambda: ("   Ataco al goblin con la espada\x00  ",)),
+        ("parse_intent", parse_intent, lambda: (next_input(),)),
+        ("resolve_combat", lambda state, rng: game_logic.resolve_combat("attack", state, rng), combat_args),
+        ("build_context", build_context_string, lambda: (combat_state,)),
+        ("prompt_build", prompt_builder.build, lambda: (next_input(), combat_state)),
+        ("llm_http", get_client().post_chat, lambda: (payload,)),
+        ("parse_response", parse_completion, lambda: (completion, 0)),
+        ("rules_and_state_update",
+         lambda text, state, rng: game_logic.process_turn(text, state, rng=rng, dm_response=dm_response),
+         lambda: (next_input(),) + combat_args()),
+        ("render_stats_panel", app.render_stats_panel, lambda: (combat_state,)),
+        ("session_store", lambda state: sessions.load(sessions.save(state["session_id"], state) or state["session_id"]),
+         lambda: (explore_state,)),
+        ("save_io", game_logic.save_game_state, lambda: (explore_state, 1)),
+        ("process_turn", lambda text, state, rng: game_logic.process_turn(text, state, rng=rng),
+         lambda: (next_input(),) + combat_args()),
+        ("main_game_loop", dash_turn, lambda: (next_input(),))
+    ]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_suite(iterations, warmup, only=None):
+    from benchmarks.llm_stub import StubLLMServer
+
+    server = StubLLMServer().start()
+    try:
+        results = {}
+        for name, fn, setup in build_stages(server.url):
+            if only and name not in only:
+                continue
+            results[name] = measure(fn, setup, iterations, warmup)
+            print(format_row(name, results[name]), flush=True)
+    finally:
+        server.stop()
+
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations
+        },
+        "stages": results
+    }
+
+def format_row(name, stats):
+    return (f"{name:<24}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}"
+            f"{stats['peak_kb']:>11.1f}{stats['retained_blocks']:>10}")
+
+# A stage regresses when its p95 is more than `tolerance` slower than the baseline and the
+# difference is above the timer noise floor.
+def compare(baseline, current, tolerance=0.25, floor_ms=0.05):
+    regressions = []
+    print(f"\n{'stage':<24}{'base p95':>10}{'now p95':>10}{'change':>9}")
+    for name, stats in current["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            print(f"{name:<24}{'-':>10}{stats['p95_ms']:>10.3f}{'new':>9}")
+            continue
+        change = stats["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        regressed = change > tolerance and stats["p95_ms"] - base["p95_ms"] > floor_ms
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<24}{base['p95_ms']:>10.3f}{stats['p95_ms']:>10.3f}{change:>+8.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every stage of a game turn.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--stages", nargs="*", help="Only run these stages")
+    parser.add_argument("--save", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against (exit code 1 on regressions)")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--workdir", help="Directory for the saves/transcripts the game writes (default: a temp dir)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the game's INFO logging on")
+    args = parser.parse_args(argv)
+
+    save_path = os.path.abspath(args.save) if args.save else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="dungeoncore-bench-"))
+
+    from config import logger
+    if not args.verbose:
+        logger.setLevel("WARNING")
+
+    print(f"{'stage':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>11}{'blocks':>10}")
+    results = run_suite(args.iterations, args.warmup, args.stages)
+
+    if save_path:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {save_path}")
+
+    if compare_path:
+        with open(compare_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
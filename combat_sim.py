@@ -0,0 +1,308 @@
+import argparse
+import json
+import math
+import sys
+import time
+from config import COMBAT_MECHANICS, MAX_LEVEL, get_xp_for_level
+from content.registry import get_content
+from session_rng import SessionRandom
+from game_logic import get_equipment_bonus, get_level_bonus, get_max_health, spawn_enemy, start_combat, resolve_combat
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Headless balance simulator. Fights follow the rules in game_logic.resolve_combat (d20 vs
+# base_ac, crits, weapon/level damage bonus, enemy damage ranges, defend halving, flee DC),
+# but thousands of fights advance together, one NumPy operation per turn.
+
+ACTIONS = ("attack", "defend", "flee")
+RUNNING, WIN, DEAD, FLED, TIMEOUT = 0, 1, 2, 3, 4
+DEFAULT_POLICY = {"attack": 1.0}
+
+
+def policy_probabilities(policy):
+    unknown = set(policy) - set(ACTIONS)
+    if unknown:
+        raise ValueError(f"Unknown combat actions in policy: {sorted(unknown)}")
+    weights = [float(policy.get(action, 0)) for action in ACTIONS]
+    total = sum(weights)
+    if total <= 0:
+        raise ValueError("Policy needs at least one action with positive weight")
+    return [w / total for w in weights]
+
+def parse_policy(text):
+    policy = {}
+    for part in text.split(","):
+        action, _, weight = part.partition("=")
+        policy[action.strip()] = float(weight or 1)
+    return policy
+
+def fight_setup(enemy_type, level, weapon):
+    enemy = get_content().enemies.get(enemy_type)
+    if enemy is None:
+        raise ValueError(f"Unknown enemy type: {enemy_type}")
+    weapon_bonus, _ = get_equipment_bonus({"equipment": {"weapon": weapon}})
+    return enemy, weapon_bonus + get_level_bonus(level), get_max_health(level)
+
+def kills_to_level(level, xp_reward):
+    if level >= MAX_LEVEL or xp_reward <= 0:
+        return None
+    return math.ceil((get_xp_for_level(level + 1) - get_xp_for_level(level)) / xp_reward)
+
+
+def simulate_batch(gen, fights, enemy, bonus, max_health, policy_p, max_turns, ambush):
+    ac = COMBAT_MECHANICS["base_ac"]
+    crit_threshold = COMBAT_MECHANICS["crit_threshold"]
+    crit_multiplier = COMBAT_MECHANICS["crit_multiplier"]
+    flee_dc = COMBAT_MECHANICS["flee_dc"]
+    damage_min, damage_max = enemy["damage"]
+
+    enemy_hp = np.full(fights, enemy["hp"], dtype=np.int32)
+    player_hp = np.full(fights, max_health, dtype=np.int32)
+    outcome = np.zeros(fights, dtype=np.int8)
+    turns = np.zeros(fights, dtype=np.int32)
+
+    # The /generar turn itself is an unrecognized combat action: the enemy strikes first.
+    if ambush:
+        player_hp -= gen.integers(damage_min, damage_max + 1, fights, dtype=np.int32)
+        outcome[player_hp <= 0] = DEAD
+
+    active = np.flatnonzero(outcome == RUNNING)
+    for turn in range(1, max_turns + 1):
+        if active.size == 0:
+            break
+        count = active.size
+
+        action = gen.choice(len(ACTIONS), count, p=policy_p)
+        d20 = gen.integers(1, 21, count, dtype=np.int32)
+        enemy_roll = gen.integers(damage_min, damage_max + 1, count, dtype=np.int32)
+
+        attacking = action == 0
+        hit = attacking & (d20 + bonus >= ac)
+        damage = gen.integers(1, 9, count, dtype=np.int32) + bonus
+        damage = np.where(d20 >= crit_threshold, damage * crit_multiplier, damage)
+        remaining = enemy_hp[active] - np.where(hit, damage, 0)
+        enemy_hp[active] = remaining
+
+        fleeing = action == 2
+        fled = fleeing & (d20 >= flee_dc)
+        taken = np.where(action == 1, np.maximum(1, enemy_roll // 2), 0)
+        taken = np.where(fleeing & ~fled, enemy_roll, taken)
+        health = player_hp[active] - taken
+        player_hp[active] = health
+
+        turns[active] = turn
+        result = np.select([hit & (remaining <= 0), fled, health <= 0], [WIN, FLED, DEAD], RUNNING)
+        outcome[active] = result
+        active = active[result == RUNNING]
+
+    outcome[active] = TIMEOUT
+    hp_loss = max_health - np.clip(player_hp, 0, max_health)
+    return outcome, turns, hp_loss
+
+
+def hist_percentile(hist, q):
+    total = hist.sum()
+    if total == 0:
+        return None
+    return int(np.searchsorted(np.cumsum(hist), q / 100 * total))
+
+def hist_mean_std(hist):
+    total = hist.sum()
+    if total == 0:
+        return None, None
+    values = np.arange(hist.size)
+    mean = float((values * hist).sum() / total)
+    return mean, float(math.sqrt(max(0.0, (values ** 2 * hist).sum() / total - mean ** 2)))
+
+def summarize(enemy_type, enemy, level, max_health, counts, turn_hist, loss_hist):
+    fights = int(counts.sum())
+    turns_mean, turns_std = hist_mean_std(turn_hist)
+    loss_mean, loss_std = hist_mean_std(loss_hist)
+    return {
+        "enemy": enemy_type,
+        "level": level,
+        "fights": fights,
+        "win_rate": counts[WIN] / fights,
+        "death_rate": counts[DEAD] / fights,
+        "flee_rate": counts[FLED] / fights,
+        "timeout_rate": counts[TIMEOUT] / fights,
+        "turns_mean": turns_mean,
+        "turns_std": turns_std,
+        "turns_p50": hist_percentile(turn_hist, 50),
+        "turns_p90": hist_percentile(turn_hist, 90),
+        "turns_p99": hist_percentile(turn_hist, 99),
+        "turns_histogram": turn_hist.tolist(),
+        "hp_loss_mean": loss_mean,
+        "hp_loss_std": loss_std,
+        "hp_loss_p95": hist_percentile(loss_hist, 95),
+        "max_health": max_health,
+        "xp_reward": enemy["xp_reward"],
+        "kills_to_level": kills_to_level(level, enemy["xp_reward"])
+    }
+
+def accumulate(outcome, turns, hp_loss, counts, turn_hist, loss_hist, max_turns, max_health):
+    counts += np.bincount(outcome, minlength=5)[:5]
+    turn_hist += np.bincount(turns[outcome == WIN], minlength=max_turns + 1)[:max_turns + 1]
+    loss_hist += np.bincount(hp_loss, minlength=max_health + 1)[:max_health + 1]
+
+
+# Turns-to-kill statistics cover won fights only; HP loss covers every fight.
+def simulate(enemy_type, level=1, fights=100_000, weapon="Espada oxidada", policy=None, max_turns=200,
+             ambush=True, seed=None, batch_size=250_000):
+    if np is None:
+        raise RuntimeError("numpy is required for the combat simulator (pip install numpy)")
+
+    enemy, bonus, max_health = fight_setup(enemy_type, level, weapon)
+    policy_p = policy_probabilities(policy or DEFAULT_POLICY)
+    gen = np.random.default_rng(seed)
+
+    counts = np.zeros(5, dtype=np.int64)
+    turn_hist = np.zeros(max_turns + 1, dtype=np.int64)
+    loss_hist = np.zeros(max_health + 1, dtype=np.int64)
+    remaining = fights
+    while remaining > 0:
+        batch = min(batch_size, remaining)
+        outcome, turns, hp_loss = simulate_batch(gen, batch, enemy, bonus, max_health, policy_p, max_turns, ambush)
+        accumulate(outcome, turns, hp_loss, counts, turn_hist, loss_hist, max_turns, max_health)
+        remaining -= batch
+
+    return summarize(enemy_type, enemy, level, max_health, counts, turn_hist, loss_hist)
+
+# Same fights, one at a time through game_logic.resolve_combat: the reference the
+# vectorized version is checked against.
+def simulate_scalar(enemy_type, level=1, fights=10_000, weapon="Espada oxidada", policy=None, max_turns=200,
+                    ambush=True, seed=None):
+    if np is None:
+        raise RuntimeError("numpy is required for the combat simulator (pip install numpy)")
+
+    enemy, _, max_health = fight_setup(enemy_type, level, weapon)
+    policy = policy or DEFAULT_POLICY
+    actions = [action for action in ACTIONS if policy.get(action)]
+    weights = [policy[action] for action in actions]
+    rng = SessionRandom(seed)
+
+    outcomes, turns, losses = [], [], []
+    for _ in range(fights):
+        state = {
+            "level": level,
+            "health": max_health,
+            "max_health": max_health,
+            "equipment": {"weapon": weapon, "armor": None},
+            "combat": {"active": False},
+            "total_kills": 0
+        }
+        start_combat(state, spawn_enemy(enemy_type, rng))
+
+        outcome, turn = RUNNING, 0
+        if ambush:
+            state["health"] -= resolve_combat(None, state, rng)["enemy_damage"]
+            if state["health"] <= 0:
+                outcome = DEAD
+
+        while outcome == RUNNING:
+            if turn == max_turns:
+                outcome = TIMEOUT
+                break
+            turn += 1
+            result = resolve_combat(rng.choices(actions, weights)[0], state, rng)
+            state["health"] -= result["enemy_damage"]
+            if result["enemy_dead"]:
+                outcome = WIN
+            elif result["combat_ended"]:
+                outcome = FLED
+            elif state["health"] <= 0:
+                outcome = DEAD
+
+        outcomes.append(outcome)
+        turns.append(turn)
+        losses.append(max_health - min(max(state["health"], 0), max_health))
+
+    counts = np.zeros(5, dtype=np.int64)
+    turn_hist = np.zeros(max_turns + 1, dtype=np.int64)
+    loss_hist = np.zeros(max_health + 1, dtype=np.int64)
+    accumulate(np.array(outcomes, dtype=np.int8), np.array(turns), np.array(losses), counts, turn_hist,
+               loss_hist, max_turns, max_health)
+    return summarize(enemy_type, enemy, level, max_health, counts, turn_hist, loss_hist)
+
+
+# Compares the vectorized simulator with the scalar rules. Every metric must agree within
+# `z` standard errors; returns [(metric, scalar, vectorized, tolerance, ok), ...].
+def check_consistency(enemy_type, level=1, fights=20_000, policy=None, weapon="Espada oxidada", seed=0, z=4.5):
+    scalar = simulate_scalar(enemy_type, level, fights, weapon, policy, seed=seed)
+    vector = simulate(enemy_type, level, fights * 10, weapon, policy, seed=seed)
+
+    checks = []
+    for metric in ("win_rate", "death_rate", "flee_rate"):
+        p = (scalar[metric] + vector[metric]) / 2
+        tolerance = z * math.sqrt(p * (1 - p) * (1 / scalar["fights"] + 1 / vector["fights"])) + 1e-9
+        checks.append((metric, scalar[metric], vector[metric], tolerance))
+
+    for metric, std, count in (("turns_mean", "turns_std", "win_rate"), ("hp_loss_mean", "hp_loss_std", None)):
+        if scalar[metric] is None or vector[metric] is None:
+            checks.append((metric, scalar[metric], vector[metric], 0.0))
+            continue
+        n_scalar = scalar["fights"] * (scalar[count] if count else 1)
+        n_vector = vector["fights"] * (vector[count] if count else 1)
+        tolerance = z * math.sqrt(scalar[std] ** 2 / n_scalar + vector[std] ** 2 / n_vector) + 1e-9
+        checks.append((metric, scalar[metric], vector[metric], tolerance))
+
+    return [(metric, a, b, tol, a == b if a is None or b is None else abs(a - b) <= tol) for metric, a, b, tol in checks]
+
+
+def format_row(stats):
+    def pct(value):
+        return f"{value * 100:6.1f}%"
+    turns = "-" if stats["turns_p50"] is None else f"{stats['turns_p50']}/{stats['turns_p90']}"
+    return (f"{stats['enemy']:<14}{stats['level']:>4} {pct(stats['win_rate'])} {pct(stats['death_rate'])} "
+            f"{pct(stats['flee_rate'])} {turns:>9} {stats['hp_loss_mean']:8.1f} {stats['hp_loss_p95']:6} "
+            f"{stats['kills_to_level'] if stats['kills_to_level'] is not None else '-':>6}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo combat balance simulator.")
+    parser.add_argument("--enemies", nargs="*", help="Enemy keys (default: every enemy in the content packs)")
+    parser.add_argument("--levels", nargs="*", type=int, default=[1, 5, 10, 20])
+    parser.add_argument("--fights", type=int, default=1_000_000)
+    parser.add_argument("--policy", default="attack=1", help="Action weights, e.g. attack=0.8,defend=0.2")
+    parser.add_argument("--weapon", default="Espada oxidada")
+    parser.add_argument("--max-turns", type=int, default=200)
+    parser.add_argument("--no-ambush", action="store_true", help="Do not let the enemy strike on the spawn turn")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", help="Write the full results (with turn histograms) to this file")
+    parser.add_argument("--check", action="store_true", help="Check the vectorized simulator against the scalar rules")
+    args = parser.parse_args(argv)
+
+    policy = parse_policy(args.policy)
+    enemies = args.enemies or list(get_content().enemies.keys)
+
+    if args.check:
+        failed = 0
+        for enemy_type in enemies:
+            for level in args.levels:
+                for metric, scalar, vector, tolerance, ok in check_consistency(enemy_type, level, policy=policy, weapon=args.weapon):
+                    failed += not ok
+                    print(f"{'ok  ' if ok else 'FAIL'} {enemy_type:<14}{level:>4} {metric:<13} scalar={scalar} vector={vector} tol={tolerance:.4f}")
+        print(f"{failed} metric(s) out of tolerance")
+        return 1 if failed else 0
+
+    print(f"{'Enemy':<14}{'Lvl':>4} {'Win':>7} {'Death':>7} {'Flee':>7} {'Turns50/90':>9} {'HP loss':>8} {'p95':>6} {'Kills':>6}")
+    results = []
+    started = time.perf_counter()
+    for enemy_type in enemies:
+        for level in args.levels:
+            stats = simulate(enemy_type, level, args.fights, args.weapon, policy, args.max_turns,
+                             not args.no_ambush, args.seed)
+            results.append(stats)
+            print(format_row(stats))
+    elapsed = time.perf_counter() - started
+    print(f"{len(results) * args.fights:,} fights in {elapsed:.1f}s")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"policy": policy, "weapon": args.weapon, "results": results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
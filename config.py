@@ -1,19 +1,158 @@
 import logging
+import os
 import sys
 
 LM_STUDIO_URL = "http://localhost:1234/v1/chat/completions"
 
+# --- LLM TRANSPORT ---
+LLM_MODEL = "local-model"
+LLM_TIMEOUT = 60
+LLM_POOL_SIZE = 16
+LLM_KEEPALIVE_SECONDS = 30
+LLM_MAX_RETRIES = 2
+# Retries back off exponentially with full jitter, from LLM_RETRY_DELAY up to
+# LLM_RETRY_MAX_DELAY seconds. All attempts of a turn share LLM_TURN_DEADLINE seconds,
+# counted from the moment its first request is sent. One attempt may wait at most
+# LLM_ATTEMPT_TIMEOUT seconds for the server (connect, first token, or a stalled stream), so a
+# hung request leaves time for a retry; a retry only starts with LLM_MIN_ATTEMPT_SECONDS left.
+LLM_RETRY_DELAY = 1.5
+LLM_RETRY_MAX_DELAY = 6
+LLM_TURN_DEADLINE = 45
+LLM_ATTEMPT_TIMEOUT = 20
+LLM_MIN_ATTEMPT_SECONDS = 5
+
+# --- CIRCUIT BREAKER ---
+# After BREAKER_FAILURE_THRESHOLD consecutive transport failures turns get the "server unavailable"
+# fallback at once; one probe request is let through every BREAKER_RESET_SECONDS.
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_SECONDS = 20
+
+# --- STRUCTURED OUTPUT ---
+# Sends the DM response schema as response_format (json_schema), so backends with grammar
+# support (LM Studio, llama.cpp, vLLM) can only generate valid responses. A backend that
+# rejects it gets plain requests from then on.
+LLM_STRUCTURED_OUTPUT = True
+
+# --- LLM BACKENDS ---
+# OpenAI-compatible chat endpoints. With more than one, each request goes to the healthy
+# backend with the fewest requests in flight ("least_loaded") or the lowest recent latency
+# ("latency"), and fails over to the next one when a backend errors. Set LLM_SLOTS below to
+# the parallel sequences of all backends together.
+LLM_BACKENDS = [LM_STUDIO_URL]
+LLM_ROUTING = "least_loaded"
+# Opt-in: a request still unanswered after the p95 latency of recent requests (time to first
+# token when streaming, over the last LLM_LATENCY_WINDOW requests once there are
+# LLM_HEDGE_MIN_SAMPLES) is also sent to the next backend; the first answer wins.
+LLM_HEDGE_ENABLED = False
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200
+
+# --- LLM SCHEDULER ---
+# LLM_SLOTS requests reach the model server at once; match its parallel sequences (LM Studio
+# runs one by default). Further turns queue fairly per session and see their place in line;
+# past LLM_MAX_QUEUE waiting turns, or after LLM_QUEUE_TIMEOUT seconds, they are turned away.
+LLM_SLOTS = 1
+LLM_MAX_QUEUE = 16
+LLM_QUEUE_TIMEOUT = 90
+
+# --- RULES FAST PATH ---
+# Turns whose outcome the rules already decided are narrated from local templates
+# (narration.py) instead of the LLM: combat rounds ("combat") and usar/equipar ("item").
+# Exploration and story beats always go to the LLM. Remove a kind to send it back too.
+FAST_PATH_TURNS = ("combat", "item")
+
+# --- STREAMING ---
+STREAMING_ENABLED = True
+STREAM_POLL_INTERVAL_MS = 150
+# A finished turn nobody polls (tab closed) is dropped after STREAM_RESULT_TTL_SECONDS; the
+# state it produced is already in the session store.
+STREAM_RESULT_TTL_SECONDS = 120
+
+# --- RESPONSE CACHE ---
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_MEMORY_ITEMS = 512
+RESPONSE_CACHE_DISK_PATH = "cache/responses.sqlite3"
+RESPONSE_CACHE_DISK_ITEMS = 20000
+RESPONSE_CACHE_TTL_SECONDS = 6 * 60 * 60
+RESPONSE_CACHE_VARIANTS = 3
+
+# --- TRANSCRIPT ---
+TRANSCRIPT_DIR = "transcripts"
+TRANSCRIPT_CACHE_ITEMS = 128
+# Transcripts untouched for this long are deleted when a new one is created. Keep it at least
+# JOURNAL_RETENTION_SECONDS: a session recovered from its journal still points at its transcript.
+TRANSCRIPT_RETENTION_SECONDS = 7 * 24 * 60 * 60
+CHAT_PAGE_SIZE = 20
+
+# --- SESSIONS ---
+# "memory" for a single worker process, "sqlite" when several workers share sessions.
+SESSION_BACKEND = "memory"
+SESSION_DB_PATH = "sessions.sqlite3"
+SESSION_MAX_ITEMS = 1000
+SESSION_IDLE_SECONDS = 12 * 60 * 60
+
+# --- SAVES ---
+# "file" keeps slot files under SAVE_DIR, "sqlite" stores every slot in SAVE_DB_PATH.
+SAVE_BACKEND = "file"
+SAVE_DIR = "savegames"
+SAVE_DB_PATH = "savegames/saves.sqlite3"
+# "shared" gives every player the same slots (classic behaviour), "cookie" namespaces
+# slots per browser using a long-lived user cookie.
+SAVE_USER_MODE = "shared"
+DEFAULT_SAVE_USER = "local"
+USER_COOKIE_NAME = "dungeoncore_user"
+
+# --- CONVERSATION HISTORY ---
+# Recent turns go to the LLM verbatim up to HISTORY_TOKEN_BUDGET; older ones are folded into
+# a running summary (at most SUMMARY_MAX_TOKENS) by a background worker, SUMMARY_MIN_ENTRIES
+# messages at a time. HISTORY_MAX_ITEMS caps the stored history if summaries fall behind.
+HISTORY_TOKEN_BUDGET = 1200
+HISTORY_MAX_ITEMS = 40
+SUMMARY_ENABLED = True
+SUMMARY_MAX_TOKENS = 300
+SUMMARY_MIN_ENTRIES = 4
+
+# --- SPECULATIVE PREFETCH ---
+# Opt-in. After a turn, DM responses for the first SPECULATION_CHOICES suggested choices are
+# generated on SPECULATION_WORKERS background threads while the player reads. If the player
+# sends one of them and the state still matches, it is served instantly; everything else is
+# cancelled. SPECULATION_MAX_PENDING bounds the queued work across all sessions.
+SPECULATION_ENABLED = False
+SPECULATION_CHOICES = 2
+SPECULATION_WORKERS = 2
+SPECULATION_MAX_PENDING = 8
+
+# --- TURN JOURNAL ---
+# Every turn is appended to a per-session event journal with a full snapshot every
+# JOURNAL_SNAPSHOT_EVERY turns; only the last JOURNAL_KEEP_SNAPSHOTS snapshots are kept.
+JOURNAL_ENABLED = True
+JOURNAL_DIR = "journals"
+JOURNAL_SNAPSHOT_EVERY = 10
+JOURNAL_KEEP_SNAPSHOTS = 5
+JOURNAL_FSYNC = False
+JOURNAL_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+# --- METRICS ---
+# Prometheus text format on the Flask server behind Dash: per-stage turn timings, LLM token
+# usage and throughput, retries, connection errors, fallbacks, sessions and save/load times.
+METRICS_ENABLED = True
+METRICS_PATH = "/metrics"
+
+# --- LOGGING ---
+# Set up by log_setup.setup_logging() when the app starts, not on import. Records are queued
+# and written by a background thread. LOG_FILE rotates at LOG_MAX_BYTES and at every
+# LOG_ROTATE_SECONDS boundary (0 disables either), keeping LOG_BACKUP_COUNT old files.
+# LOG_JSON writes JSON lines carrying the session id and turn of each record.
+LOG_LEVEL = "INFO"
+LOG_FILE = "debug.log"
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_SECONDS = 24 * 60 * 60
+LOG_BACKUP_COUNT = 5
+LOG_JSON = False
+
 if sys.platform == "win32" and hasattr(sys.stdout, 'reconfigure'):
     sys.stdout.reconfigure(encoding='utf-8')
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("debug.log", encoding='utf-8'), 
-        logging.StreamHandler(sys.stdout)           
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # --- GAME CONSTANTS ---
@@ -54,140 +193,35 @@ def get_next_level_xp(current_level):
         return None
     return XP_TABLE.get(current_level + 1, XP_TABLE[MAX_LEVEL])
 
-ENEMY_TEMPLATES = {
-    "goblin": {
-        "name": "Goblin Escarbador",
-        "hp": 15,
-        "damage": (3, 6),
-        "xp_reward": 15,
-        "gold_reward": (1, 8),
-        "description": "Una criatura baja y astuta con ojos amarillos."
-    },
-    "skeleton": {
-        "name": "Esqueleto Guerrero",
-        "hp": 25,
-        "damage": (4, 8),
-        "xp_reward": 25,
-        "gold_reward": (5, 15),
-        "description": "Los huesos de un guerrero olvidado, aún moviéndose."
-    },
-    "rat": {
-        "name": "Rata Gigante",
-        "hp": 10,
-        "damage": (2, 5),
-        "xp_reward": 8,
-        "gold_reward": (0, 3),
-        "description": "Del tamaño de un perro, con colmillos relucientes."
-    },
-    "cultist": {
-        "name": "Cultista Oscuro",
-        "hp": 30,
-        "damage": (5, 10),
-        "xp_reward": 35,
-        "gold_reward": (10, 25),
-        "description": "Encapuchado, murmura oraciones profanas."
-    },
-    "orc": {
-        "name": "Orco Berserker",
-        "hp": 45,
-        "damage": (6, 12),
-        "xp_reward": 50,
-        "gold_reward": (15, 30),
-        "description": "Masivo, con cicatrices de mil batallas."
-    },
-    "troll": {
-        "name": "Troll de Roca",
-        "hp": 60,
-        "damage": (8, 15),
-        "xp_reward": 75,
-        "gold_reward": (25, 50),
-        "description": "Una mole de piedra viviente con apetito voraz."
-    },
-    "wraith": {
-        "name": "Espectro Vengativo",
-        "hp": 35,
-        "damage": (7, 12),
-        "xp_reward": 60,
-        "gold_reward": (20, 40),
-        "description": "Una entidad fantasmal que drena la vida."
-    },
-    "dragon_whelp": {
-        "name": "Dracónicedo",
-        "hp": 80,
-        "damage": (10, 18),
-        "xp_reward": 100,
-        "gold_reward": (50, 100),
-        "description": "Una joven dragón con escamas negras."
-    }
-}
-
 COMBAT_MECHANICS = {
     "base_ac": 12,
     "crit_threshold": 20,
-    "crit_multiplier": 2
+    "crit_multiplier": 2,
+    "flee_dc": 10
 }
 
-ITEM_TEMPLATES = {
-    "pocion_vida": {
-        "name": "Poción de Vida",
-        "type": "consumible",
-        "effect": "heal",
-        "value": 25,
-        "description": "Restaura 25 puntos de vida."
-    },
-    "pocion_vida_mayor": {
-        "name": "Poción de Vida Mayor",
-        "type": "consumible",
-        "effect": "heal",
-        "value": 50,
-        "description": "Restaura 50 puntos de vida."
-    },
-    "antidoto": {
-        "name": "Antídoto",
-        "type": "consumible",
-        "effect": "cure_poison",
-        "value": 0,
-        "description": "Cura el estado de envenenamiento."
-    },
-    "espada_rustica": {
-        "name": "Espada Rústica",
-        "type": "weapon",
-        "damage_bonus": 1,
-        "description": "Una espada oxidada pero funcional. +1 Daño."
-    },
-    "escudo_madera": {
-        "name": "Escudo de Madera",
-        "type": "armor",
-        "ac_bonus": 1,
-        "description": "Un escudo de madera reforzada. +1 CA."
-    },
-    "armadura_cuero": {
-        "name": "Armadura de Cuero",
-        "type": "armor",
-        "ac_bonus": 2,
-        "description": "Armadura ligera de cuero. +2 CA."
-    },
-    "bomba_humo": {
-        "name": "Bomba de Humo",
-        "type": "consumible",
-        "effect": "escape",
-        "value": 0,
-        "description": "Permite escapar de cualquier combate."
-    }
-}
+# --- CONTENT ---
+# Item and enemy definitions live in data packs (directories with enemies.json and/or
+# items.json). Later packs add to or override the keys of earlier ones.
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content", "packs")
+CONTENT_PACKS = ["core"]
+
+# ENEMY_TEMPLATES and ITEM_TEMPLATES are kept for scripts that still import them: read-only
+# {key: template} views of the loaded packs, built on first access (content.registry
+# imports this module).
+CONTENT_ALIASES = {"ENEMY_TEMPLATES": "enemies", "ITEM_TEMPLATES": "items"}
 
+def __getattr__(name):
+    if name in CONTENT_ALIASES:
+        from content.registry import get_content
+        return getattr(get_content(), CONTENT_ALIASES[name]).by_key
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# SYSTEM_PROMPT must stay byte-identical between turns so the LLM server can reuse
+# its KV/prefix cache. Everything that changes per turn goes in STATE_PROMPT.
 SYSTEM_PROMPT = """ERES EL DUNGEON MASTER (DM) DE UNA AVENTURA DE ROL DE FANTASÍA OSCURA Y LETAL.
 TU OBJETIVO ES NARRAR UNA HISTORIA INMERSIVA Y EN ESPAÑOL.
-
---- CONTEXTO DEL JUGADOR ---
-- **Nombre:** Aventurero
-- **Nivel:** {level}
-- **Salud:** {health}/{max_health}
-- **Oro:** {gold}
-- **Ubicación:** {location}
-- **Inventario:** {inventory}
-- **Equipo:** {equipment}
-- **Estado:** {status}
+El jugador se llama Aventurero. Su estado actual llega al final de cada mensaje, en la sección ESTADO ACTUAL.
 
 --- REGLAS ABSOLUTAS ---
 1. **IDIOMA:** SIEMPRE ESPAÑOL.
@@ -206,7 +240,7 @@ TU OBJETIVO ES NARRAR UNA HISTORIA INMERSIVA Y EN ESPAÑOL.
 Responde ÚNICAMENTE con un objeto JSON válido.
 
 Ejemplo:
-{{
+{
     "narrative": "Avanzas por el pasillo. De repente...",
     "hp_change": -5,
     "gold_change": 0,
@@ -214,7 +248,7 @@ Ejemplo:
     "item_used": null,
     "combat_ended": false,
     "choices": ["Investigar", "Continuar", "Buscar salida"]
-}}
+}
 
 --- CAMPOS DISPONIBLES ---
 - narrative: (string) Tu narración en español
@@ -226,11 +260,43 @@ Ejemplo:
 - level_up: (bool) true si el jugador sube de nivel
 - xp_gained: (int) XP ganada (0-100 max)
 - choices: (array) 2-4 opciones para el jugador
+"""
+
+STATE_PROMPT = """--- ESTADO ACTUAL ---
+Nivel: {level}
+Salud: {health}/{max_health}
+Oro: {gold}
+Ubicación: {location}
+Inventario: {inventory}
+Equipo: {equipment}
+Estado: {status}
+{combat}"""
 
---- ESTADO ACTUAL ---
-{state}
+COMBAT_PROMPT = """
+--- COMBATE ACTIVO ---
+- Enemigo: {enemy_name}
+- HP Enemigo: {enemy_hp}/{enemy_max_hp}
+- Último dado: {last_roll}
 """
 
+ACTION_PROMPT = """
+[Acción del Jugador]: "{user_input}"
+
+[Instrucción]: Eres el Narrador. Narra la consecuencia inmediata de esta acción en ESPAÑOL.
+OBLIGATORIO: Responde SOLAMENTE con el objeto JSON.
+"""
+
+# Appended to SYSTEM_PROMPT once the campaign has a summary. It only changes when a batch
+# of old turns is folded in, so the prefix stays cacheable between turns.
+SUMMARY_CONTEXT_PROMPT = """
+--- RESUMEN DE LA HISTORIA HASTA AHORA ---
+{summary}
+"""
+
+SUMMARY_PROMPT = """Eres el cronista de una partida de rol de fantasía oscura.
+Actualiza el resumen de la historia con los turnos nuevos. Conserva solo lo que importa para continuar la historia: lugares visitados, personajes y enemigos, objetos obtenidos o perdidos, heridas, promesas y misiones pendientes.
+Escribe en ESPAÑOL, en prosa breve y en pasado, con un máximo de {max_words} palabras. Responde SOLO con el resumen, sin JSON ni comentarios."""
+
 INITIAL_STATE = {
     "health": 100,
     "max_health": 100,
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+from types import MappingProxyType
+from config import logger, CONTENT_DIR, CONTENT_PACKS
+
+
+class ContentError(ValueError):
+    pass
+
+
+# Field name -> (type, required). "range" is a [min, max] pair of ints.
+SCHEMAS = {
+    "enemies": {
+        "name": (str, True),
+        "hp": (int, True),
+        "damage": ("range", True),
+        "xp_reward": (int, True),
+        "gold_reward": ("range", True),
+        "description": (str, True)
+    },
+    "items": {
+        "name": (str, True),
+        "type": (str, True),
+        "description": (str, True),
+        "effect": (str, False),
+        "value": (int, False),
+        "damage_bonus": (int, False),
+        "ac_bonus": (int, False)
+    }
+}
+
+def check_field(value, kind):
+    if kind == "range":
+        return (isinstance(value, (list, tuple)) and len(value) == 2
+                and all(isinstance(v, int) for v in value) and value[0] <= value[1])
+    return isinstance(value, kind) and not isinstance(value, bool)
+
+def validate_template(kind, key, template, source):
+    problems = []
+    if not isinstance(template, dict):
+        return [f"{source}: {kind}.{key} is not an object"]
+    for field, (field_type, required) in SCHEMAS[kind].items():
+        if field not in template:
+            if required:
+                problems.append(f"{source}: {kind}.{key} is missing '{field}'")
+        elif not check_field(template[field], field_type):
+            problems.append(f"{source}: {kind}.{key}.{field} has an invalid value {template[field]!r}")
+    return problems
+
+def freeze(key, template):
+    frozen = {k: tuple(v) if isinstance(v, list) else v for k, v in template.items()}
+    frozen["key"] = key
+    return MappingProxyType(frozen)
+
+
+# Immutable lookup tables for one kind of content. Every lookup is a dict hit, however
+# many templates the packs define.
+class ContentIndex:
+    def __init__(self, kind, templates):
+        self.kind = kind
+        self.by_key = MappingProxyType(templates)
+        self.by_name = MappingProxyType({t["name"]: t for t in templates.values()})
+        self.by_folded_name = MappingProxyType({t["name"].casefold(): t for t in templates.values()})
+        by_type = {}
+        for template in templates.values():
+            by_type.setdefault(template.get("type"), []).append(template)
+        self.by_type = MappingProxyType({t: tuple(group) for t, group in by_type.items()})
+        self.keys = tuple(templates)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.by_key
+
+    def get(self, key):
+        return self.by_key.get(key)
+
+    # Exact display name first, then case-insensitive.
+    def find(self, name):
+        if not name:
+            return None
+        return self.by_name.get(name) or self.by_folded_name.get(name.strip().casefold())
+
+    def of_type(self, template_type):
+        return self.by_type.get(template_type, ())
+
+
+# Loads every pack's <kind>.json on first access to that kind and validates it once.
+class ContentRegistry:
+    def __init__(self, packs=CONTENT_PACKS, content_dir=CONTENT_DIR):
+        self.pack_dirs = [os.path.join(content_dir, pack) for pack in packs]
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _load(self, kind):
+        templates = {}
+        sources = {}
+        problems = []
+
+        for pack_dir in self.pack_dirs:
+            path = os.path.join(pack_dir, f"{kind}.json")
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except ValueError as e:
+                problems.append(f"{path}: {e}")
+                continue
+            if not isinstance(data, dict):
+                problems.append(f"{path}: expected an object keyed by {kind[:-1]} id")
+                continue
+
+            for key, template in data.items():
+                template_problems = validate_template(kind, key, template, path)
+                if template_problems:
+                    problems.extend(template_problems)
+                    continue
+                if key in templates:
+                    logger.info(f"Content {kind}.{key} from {sources[key]} overridden by {path}")
+                templates[key] = freeze(key, template)
+                sources[key] = path
+
+        names = {}
+        for key, template in templates.items():
+            folded = template["name"].casefold()
+            if folded in names:
+                problems.append(f"{kind}.{key} and {kind}.{names[folded]} share the name {template['name']!r}")
+            names[folded] = key
+
+        if problems:
+            raise ContentError(f"Invalid {kind} content:\n- " + "\n- ".join(problems))
+
+        logger.info(f"Loaded {len(templates)} {kind} from {len(self.pack_dirs)} pack(s)")
+        return ContentIndex(kind, templates)
+
+    def _index(self, kind):
+        index = self._indexes.get(kind)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(kind)
+                if index is None:
+                    index = self._indexes[kind] = self._load(kind)
+        return index
+
+    @property
+    def enemies(self):
+        return self._index("enemies")
+
+    @property
+    def items(self):
+        return self._index("items")
+
+    # Loads and validates every kind now, so broken packs fail at startup instead of mid-game.
+    def validate(self):
+        for kind in SCHEMAS:
+            self._index(kind)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_content():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ContentRegistry()
+    return _registry
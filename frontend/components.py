@@ -91,14 +91,30 @@ def render_stat_card_simple(icon, label, value, color_class="text-white"):
         ], className="flex flex-col")
     ], className="flex items-center bg-gray-900/50 p-3 rounded-lg border border-gray-800")
 
+OLDER_BUTTON_CLASS = "w-full mb-4 py-1 text-[10px] font-mono uppercase tracking-widest text-gray-500 hover:text-gray-300 border border-gray-800 rounded-lg"
+
+def render_chat_entry(entry):
+    return dcc.Markdown(entry)
+
 def render_chat_area():
     return html.Div([
         html.Div(
             id="chat-scroll-box",
             className="w-full h-[500px] bg-gray-950/80 border border-gray-800 rounded-lg p-6 overflow-y-auto shadow-inner custom-scrollbar",
             children=[
-                dcc.Markdown(
+                html.Button(
+                    "⬆️ Turnos anteriores",
+                    id="load-older-btn",
+                    n_clicks=0,
+                    className=f"{OLDER_BUTTON_CLASS} hidden"
+                ),
+                html.Div(
                     id="chat-display",
+                    children=[],
+                    className="prose prose-invert max-w-none text-gray-300 font-mono text-sm leading-relaxed"
+                ),
+                dcc.Markdown(
+                    id="stream-display",
                     className="prose prose-invert max-w-none text-gray-300 font-mono text-sm leading-relaxed"
                 )
             ]
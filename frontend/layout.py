@@ -1,4 +1,5 @@
 from dash import html, dcc
+from config import STREAM_POLL_INTERVAL_MS
 from frontend.components import (
     render_chat_area, 
     render_input_area, 
@@ -24,5 +25,9 @@ def build_layout():
         ], className="max-w-4xl mx-auto px-4 min-h-screen flex flex-col justify-center"),
         
         dcc.Store(id='game-store', storage_type='session'),
+        dcc.Store(id='stream-id'),
+        dcc.Store(id='chat-page-start'),
+        dcc.Store(id='chat-tail'),
+        dcc.Interval(id='stream-poll', interval=STREAM_POLL_INTERVAL_MS, disabled=True),
         
     ], className="bg-gray-950 min-h-screen text-gray-100 selection:bg-red-900 selection:text-white")
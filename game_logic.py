@@ -1,18 +1,28 @@
-import json
-import os
+import copy
 import random
+import time
 from datetime import datetime
 from config import logger, MAX_GOLD, MAX_INVENTORY, MAX_LEVEL, MAX_HEALTH_BASE, MAX_HEALTH_PER_LEVEL
-from config import XP_TABLE, get_xp_for_level, get_next_level_xp, ENEMY_TEMPLATES, COMBAT_MECHANICS, ITEM_TEMPLATES
-from ai_engine import query_dm
+from config import XP_TABLE, get_xp_for_level, get_next_level_xp, COMBAT_MECHANICS
+from config import CHAT_PAGE_SIZE
+from ai_engine import query_dm, query_dm_stream
+from llm.response_cache import get_response_cache, make_key
+from llm.history import get_history_context, apply_summary, trim_history, SYSTEM_COMMANDS
+from llm.speculation import get_speculation_engine
+from llm.scheduler import background_priority
+from narration import fast_path_response
+from storage.transcript import get_transcript_store
+from content.registry import get_content
+from intents import parse_intent
+from metrics import TURNS, STORAGE_SECONDS, observe_stage, speculative_metrics
+from log_setup import log_context
+from session_rng import SessionRandom, get_session_rng
+from storage.saves import get_save_store
+from storage.journal import get_turn_journal, state_delta, apply_delta, RecordingRandom, ReplayRandom, ReplayMismatch
 
-SAVE_DIR = "savegames"
-os.makedirs(SAVE_DIR, exist_ok=True)
+PROLOGUE = "🌧️ **PRÓLOGO**\n\nHas llegado a la entrada de la Cripta de los Lamentos. La lluvia golpea tu armadura oxidada y el viento aúlla como un lobo herido.\n\nNadie ha salido vivo de aquí en cien años.\n\n*Usa /ayuda para ver comandos disponibles.*\n\n¿Qué haces?"
 
-def get_save_path(slot):
-    return os.path.join(SAVE_DIR, f"slot_{slot}.json")
-
-def initialize_game():
+def initialize_game(seed=None):
     return {
         "health": MAX_HEALTH_BASE,
         "max_health": MAX_HEALTH_BASE,
@@ -47,36 +57,46 @@ def initialize_game():
         "death_count": 0,
         "total_kills": 0,
         "playtime_seconds": 0,
+        "turn": 0,
+        "rng": SessionRandom(seed).to_dict(),
         "created_at": datetime.now().isoformat(),
         "last_played": datetime.now().isoformat(),
-        "display_log": "🌧️ **PRÓLOGO**\n\nHas llegado a la entrada de la Cripta de los Lamentos. La lluvia golpea tu armadura oxidada y el viento aúlla como un lobo herido.\n\nNadie ha salido vivo de aquí en cien años.\n\n*Usa /ayuda para ver comandos disponibles.*\n\n¿Qué haces?"
+        "transcript_id": get_transcript_store().create([PROLOGUE])
     }
 
+def append_to_log(state, entry):
+    return get_transcript_store().append(state["transcript_id"], entry)
+
+def get_log_page(state, before=None, limit=CHAT_PAGE_SIZE):
+    return get_transcript_store().page(state["transcript_id"], before, limit)
+
+# For a state that is being replaced (new game, loaded save): its transcript is not needed
+# anymore, saves keep their own copy of the log.
+def discard_log(state):
+    if state and state.get("transcript_id"):
+        get_transcript_store().delete(state["transcript_id"])
+
 def get_equipment_bonus(state):
     weapon_bonus = 0
     armor_bonus = 0
     
-    weapon = state.get("equipment", {}).get("weapon")
-    if weapon:
-        for item_key, item_data in ITEM_TEMPLATES.items():
-            if item_data.get("name") == weapon and item_data.get("type") == "weapon":
-                weapon_bonus = item_data.get("damage_bonus", 0)
-                break
+    items = get_content().items
+    
+    weapon = items.by_name.get(state.get("equipment", {}).get("weapon"))
+    if weapon and weapon.get("type") == "weapon":
+        weapon_bonus = weapon.get("damage_bonus", 0)
     
-    armor = state.get("equipment", {}).get("armor")
-    if armor:
-        for item_key, item_data in ITEM_TEMPLATES.items():
-            if item_data.get("name") == armor and item_data.get("type") == "armor":
-                armor_bonus = item_data.get("ac_bonus", 0)
-                break
+    armor = items.by_name.get(state.get("equipment", {}).get("armor"))
+    if armor and armor.get("type") == "armor":
+        armor_bonus = armor.get("ac_bonus", 0)
     
     return weapon_bonus, armor_bonus
 
-def spawn_enemy(enemy_type=None):
+def spawn_enemy(enemy_type=None, rng=random):
     if enemy_type is None:
-        enemy_type = random.choice(list(ENEMY_TEMPLATES.keys()))
+        enemy_type = rng.choice(get_content().enemies.keys)
     
-    template = ENEMY_TEMPLATES[enemy_type]
+    template = get_content().enemies.get(enemy_type)
     return {
         "type": enemy_type,
         "name": template["name"],
@@ -90,11 +110,24 @@ def spawn_enemy(enemy_type=None):
         "description": template["description"]
     }
 
-def calculate_player_attack(state):
+def get_level_bonus(level):
+    return (level - 1) // 2
+
+def get_max_health(level):
+    return MAX_HEALTH_BASE + (level - 1) * MAX_HEALTH_PER_LEVEL
+
+def start_combat(state, enemy):
+    state["combat"]["active"] = True
+    state["combat"]["enemy_name"] = enemy["name"]
+    state["combat"]["enemy_hp"] = enemy["hp"]
+    state["combat"]["enemy_max_hp"] = enemy["max_hp"]
+    state["combat"]["enemy_type"] = enemy["type"]
+
+def calculate_player_attack(state, rng=random):
     weapon_bonus, _ = get_equipment_bonus(state)
-    level_bonus = (state.get("level", 1) - 1) // 2
+    level_bonus = get_level_bonus(state.get("level", 1))
     
-    d20_roll = random.randint(1, 20)
+    d20_roll = rng.randint(1, 20)
     total_bonus = weapon_bonus + level_bonus
     total_roll = d20_roll + total_bonus
     
@@ -102,14 +135,14 @@ def calculate_player_attack(state):
         "d20": d20_roll,
         "bonus": total_bonus,
         "total": total_roll,
-        "crit": d20_roll == 20
+        "crit": d20_roll >= COMBAT_MECHANICS["crit_threshold"]
     }
 
-def calculate_damage(attack_result, state):
+def calculate_damage(attack_result, state, rng=random):
     weapon_bonus, _ = get_equipment_bonus(state)
-    level_bonus = (state.get("level", 1) - 1) // 2
+    level_bonus = get_level_bonus(state.get("level", 1))
     
-    base_damage = random.randint(1, 8)
+    base_damage = rng.randint(1, 8)
     total_damage = base_damage + weapon_bonus + level_bonus
     
     if attack_result["crit"]:
@@ -117,8 +150,8 @@ def calculate_damage(attack_result, state):
     
     return total_damage
 
-def calculate_enemy_attack(enemy):
-    damage = random.randint(enemy["damage_min"], enemy["damage_max"])
+def calculate_enemy_attack(enemy, rng=random):
+    damage = rng.randint(enemy["damage_min"], enemy["damage_max"])
     return damage
 
 def check_level_up(state):
@@ -137,22 +170,16 @@ def check_level_up(state):
 def apply_level_up(state, new_level):
     old_level = state["level"]
     state["level"] = new_level
-    state["max_health"] = MAX_HEALTH_BASE + ((new_level - 1) * MAX_HEALTH_PER_LEVEL)
+    state["max_health"] = get_max_health(new_level)
     state["health"] = state["max_health"]
     
     return f"🎉 ¡SUBISTE DE NIVEL! Nivel {old_level} → {new_level}\n+10 HP Máx | +1 Daño base"
 
-def resolve_combat(user_action, state):
+def resolve_combat(action, state, rng=random):
     combat = state.get("combat", {})
     if not combat.get("active"):
         return None
     
-    action_lower = user_action.lower()
-    attack_keywords = ["atacar", "golpear", "cortar", "attack", "hit", "slash", "stab", "luchar", "empujar"]
-    defend_keywords = ["defender", "bloquear", "escudar", "defend", "block"]
-    use_keywords = ["usar", "beber", "comer", "use", "drink", "eat"]
-    flee_keywords = ["huir", "escapar", "run", "flee", "escape"]
-    
     enemy = {
         "name": combat.get("enemy_name"),
         "hp": combat.get("enemy_hp"),
@@ -161,11 +188,11 @@ def resolve_combat(user_action, state):
         "damage_max": 8
     }
     
-    for etype, template in ENEMY_TEMPLATES.items():
-        if template["name"] == enemy["name"]:
-            enemy["damage_min"] = template["damage"][0]
-            enemy["damage_max"] = template["damage"][1]
-            break
+    enemies = get_content().enemies
+    template = enemies.get(combat.get("enemy_type")) or enemies.by_name.get(enemy["name"])
+    if template:
+        enemy["damage_min"] = template["damage"][0]
+        enemy["damage_max"] = template["damage"][1]
     
     combat_result = {
         "player_action": None,
@@ -179,8 +206,8 @@ def resolve_combat(user_action, state):
         "message": ""
     }
     
-    if any(word in action_lower for word in attack_keywords):
-        attack = calculate_player_attack(state)
+    if action == "attack":
+        attack = calculate_player_attack(state, rng)
         combat["last_roll"] = attack["total"]
         
         ac = COMBAT_MECHANICS["base_ac"]
@@ -188,7 +215,7 @@ def resolve_combat(user_action, state):
         if attack["total"] >= ac:
             combat_result["player_hit"] = True
             combat_result["player_crit"] = attack["crit"]
-            damage = calculate_damage(attack, state)
+            damage = calculate_damage(attack, state, rng)
             combat_result["player_damage"] = damage
             combat["enemy_hp"] -= damage
             
@@ -202,59 +229,48 @@ def resolve_combat(user_action, state):
                 combat_result["enemy_dead"] = True
                 combat_result["combat_ended"] = True
                 
-                xp_reward = 0
-                for etype, template in ENEMY_TEMPLATES.items():
-                    if template["name"] == combat.get("enemy_name"):
-                        xp_reward = template["xp_reward"]
-                        gold_min = template["gold_reward"][0]
-                        gold_max = template["gold_reward"][1]
-                        gold_gained = random.randint(gold_min, gold_max)
-                        combat_result["gold_gained"] = gold_gained
-                        combat_result["xp_gained"] = xp_reward
-                        state["total_kills"] = state.get("total_kills", 0) + 1
-                        break
+                if template:
+                    gold_gained = rng.randint(template["gold_reward"][0], template["gold_reward"][1])
+                    combat_result["gold_gained"] = gold_gained
+                    combat_result["xp_gained"] = template["xp_reward"]
+                    state["total_kills"] = state.get("total_kills", 0) + 1
         else:
             combat_result["message"] = f"❌ Fallaste ({attack['d20']}+{attack['bonus']} < CA {ac})"
         
         combat_result["player_action"] = "attack"
     
-    elif any(word in action_lower for word in defend_keywords):
+    elif action == "defend":
         combat_result["player_action"] = "defend"
         combat_result["message"] = "🛡️ Te preparas para defenderte"
-        enemy_damage = calculate_enemy_attack(enemy)
+        enemy_damage = calculate_enemy_attack(enemy, rng)
         enemy_damage = max(1, enemy_damage // 2)
         combat_result["enemy_damage"] = enemy_damage
     
-    elif any(word in action_lower for word in flee_keywords):
+    elif action == "flee":
         combat_result["player_action"] = "flee"
-        if random.randint(1, 20) >= 10:
+        if rng.randint(1, 20) >= COMBAT_MECHANICS["flee_dc"]:
             combat_result["combat_ended"] = True
             combat_result["message"] = "🏃 Logras huir del combate"
         else:
-            enemy_damage = calculate_enemy_attack(enemy)
+            enemy_damage = calculate_enemy_attack(enemy, rng)
             combat_result["enemy_damage"] = enemy_damage
             combat_result["message"] = f"❌ No logras huir! El enemigo te ataca: {enemy_damage} daño"
     
     else:
-        enemy_damage = calculate_enemy_attack(enemy)
+        enemy_damage = calculate_enemy_attack(enemy, rng)
         combat_result["enemy_damage"] = enemy_damage
         combat_result["message"] = f"⚠️ Acción no reconocida. El {enemy['name']} te ataca: {enemy_damage} daño"
     
-    if not combat_result["combat_ended"] and combat_result["enemy_damage"] > 0:
+    if combat_result["combat_ended"]:
+        combat["active"] = False
+    elif combat_result["enemy_damage"] > 0:
         combat["enemy_damage"] = combat_result["enemy_damage"]
     
     state["combat"] = combat
     return combat_result
 
 def use_item(item_name, state):
-    item_found = None
-    item_key = None
-    
-    for ik, item_data in ITEM_TEMPLATES.items():
-        if item_data["name"].lower() == item_name.lower():
-            item_found = item_data
-            item_key = ik
-            break
+    item_found = get_content().items.find(item_name)
     
     if not item_found:
         return None, "No tienes ese objeto"
@@ -312,47 +328,55 @@ def use_item(item_name, state):
     
     return item_found["name"], result_message
 
-def process_turn(user_input, current_state, mock=False):
+def process_turn(user_input, current_state, mock=False, on_narrative=None, rng=random, trace=None, dm_response=None, intent=None, summary=None):
     if current_state.get("game_over"):
         return current_state, "\n\n⚰️ **HAS MUERTO**\n\nUsa el botón de reiniciar para empezar de nuevo."
     
+    if summary is not None:
+        apply_summary(current_state, summary)
+    if trace is not None:
+        trace["summary"] = summary
+    
     user_input = user_input.strip()[:500]
+    if intent is None:
+        started = time.perf_counter()
+        intent = parse_intent(user_input)
+        observe_stage("parse", started)
     system_override_msg = ""
     item_used = None
+    item_outcome = None
+    item_message = ""
     combat_result = None
+    result_lines = []
+    leveled_up = False
     
-    if user_input.lower().startswith("/ayuda") or user_input.lower() == "/help":
+    if intent.kind == "command" and intent.name == "help":
         help_text = """
 📖 **COMANDOS DISPONIBLES:**
 
 - `/generar [tipo]` - Invoca un enemigo (goblin, skeleton, orc, troll, etc.)
 - `/estado` - Muestra tu estado actual
 - `/historia` - Repite la historia del personaje
+- `/deshacer [n]` - Deshace los últimos turnos
 - `usar [objeto]` - Usa un objeto del inventario
 - `equipar [objeto]` - Equipa un objeto
 - `atacar`, `defender`, `huir` - Acciones de combate
 """
-        current_state["history"].append({"role": "user", "content": user_input})
-        current_state["history"].append({"role": "assistant", "content": help_text})
         return current_state, f"\n👤 TÚ: {user_input}\n{help_text}"
     
-    if user_input.lower().startswith("/generar ") or user_input.lower().startswith("/spawn "):
-        enemy_type = user_input.lower().split()[-1]
-        if enemy_type not in ENEMY_TEMPLATES:
+    if intent.kind == "command" and intent.name == "spawn":
+        enemy_type = intent.arg.lower().split()[-1] if intent.arg else None
+        if enemy_type not in get_content().enemies:
             enemy_type = None
         
         if not current_state.get("combat", {}).get("active"):
-            enemy = spawn_enemy(enemy_type)
-            current_state["combat"]["active"] = True
-            current_state["combat"]["enemy_name"] = enemy["name"]
-            current_state["combat"]["enemy_hp"] = enemy["hp"]
-            current_state["combat"]["enemy_max_hp"] = enemy["max_hp"]
-            current_state["combat"]["enemy_type"] = enemy["type"]
+            enemy = spawn_enemy(enemy_type, rng)
+            start_combat(current_state, enemy)
             system_override_msg = f"[SISTEMA]: ¡Un {enemy['name']} aparece! HP: {enemy['hp']}\nDescripción: {enemy['description']}"
         else:
             system_override_msg = "[SISTEMA]: ¡Ya estás en combate!"
     
-    elif user_input.lower().startswith("/estado") or user_input.lower() == "/stats":
+    elif intent.kind == "command" and intent.name == "stats":
         stats = f"""
 📊 **ESTADO DEL PERSONAJE**
 - Nivel: {current_state['level']}
@@ -363,29 +387,20 @@ def process_turn(user_input, current_state, mock=False):
 - Muertes: {current_state.get('death_count', 0)}
 - Equipo: {current_state['equipment']['weapon'] or 'Ninguno'}
 """
-        current_state["history"].append({"role": "user", "content": user_input})
-        current_state["history"].append({"role": "assistant", "content": stats})
         return current_state, f"\n👤 TÚ: {user_input}\n{stats}"
     
-    elif user_input.lower().startswith("usar ") or user_input.lower().startswith("use "):
-        item_name = user_input[5:].strip()
-        used, msg = use_item(item_name, current_state)
+    elif intent.kind == "item":
+        used, msg = use_item(intent.arg, current_state)
+        item_outcome = used or ""
+        item_message = msg
         if used:
             item_used = used
             system_override_msg = f"[SISTEMA]: {msg}"
         else:
             system_override_msg = f"[SISTEMA]: {msg}"
     
-    elif user_input.lower().startswith("equipar ") or user_input.lower().startswith("equip "):
-        item_name = user_input[8:].strip()
-        used, msg = use_item(item_name, current_state)
-        if used:
-            item_used = used
-            system_override_msg = f"[SISTEMA]: {msg}"
-        else:
-            system_override_msg = f"[SISTEMA]: {msg}"
-    
-    combat_result = resolve_combat(user_input, current_state)
+    started = time.perf_counter()
+    combat_result = resolve_combat(intent.name if intent.kind == "action" else None, current_state, rng)
     
     final_prompt = user_input
     if system_override_msg:
@@ -393,10 +408,12 @@ def process_turn(user_input, current_state, mock=False):
     
     if combat_result:
         combat_context = combat_result["message"]
+        result_lines.append(combat_result["message"])
         if combat_result.get("enemy_dead"):
             gold_gained = combat_result.get("gold_gained", 0)
             xp_gained = combat_result.get("xp_gained", 0)
             combat_context += f"\n[SISTEMA]: ¡Derrotaste al enemigo! +{gold_gained} oro, +{xp_gained} XP"
+            result_lines.append(f"💰 ¡Derrotaste al enemigo! +{gold_gained} oro, +{xp_gained} XP")
             current_state["gold"] = min(MAX_GOLD, current_state["gold"] + gold_gained)
             current_state["xp"] += xp_gained
             
@@ -404,14 +421,37 @@ def process_turn(user_input, current_state, mock=False):
             if leveled_up:
                 level_msg = apply_level_up(current_state, new_level)
                 combat_context += f"\n{level_msg}"
+                result_lines.append(level_msg)
         
         if combat_result.get("enemy_damage", 0) > 0:
             current_state["health"] -= combat_result["enemy_damage"]
         
         final_prompt += f"\n\n{combat_context}\n[INSTRUCCIÓN]: Narra el resultado del combate basándote en los números del sistema."
+    observe_stage("combat", started)
+    
+    if dm_response is None:
+        if intent.kind == "item":
+            result_lines = [item_message]
+        dm_response = fast_path_response(intent, current_state, combat_result, item_used, result_lines, leveled_up)
+        if dm_response is not None and on_narrative:
+            on_narrative(dm_response["narrative"])
+    
+    cache_key = None
+    if dm_response is None and get_response_cache() is not None:
+        cache_key = make_key(user_input, current_state, combat_result, item_outcome)
+    
+    if dm_response is not None:
+        ai_response = dm_response
+    elif on_narrative:
+        ai_response = query_dm_stream(final_prompt, current_state, on_narrative, mock, cache_key=cache_key)
+    else:
+        ai_response = query_dm(final_prompt, current_state, mock, cache_key=cache_key)
     
-    ai_response = query_dm(final_prompt, current_state, mock)
+    if trace is not None:
+        trace["combat"] = combat_result
+        trace["response"] = ai_response
     
+    started = time.perf_counter()
     narrative = ai_response.get("narrative", "...")
     
     if not combat_result:
@@ -431,9 +471,7 @@ def process_turn(user_input, current_state, mock=False):
     
     current_state["history"].append({"role": "user", "content": user_input})
     current_state["history"].append({"role": "assistant", "content": narrative})
-    
-    if len(current_state["history"]) > 20:
-        current_state["history"] = current_state["history"][-20:]
+    trim_history(current_state)
     
     if current_state["health"] <= 0:
         current_state["health"] = 0
@@ -443,29 +481,170 @@ def process_turn(user_input, current_state, mock=False):
         narrative += "\n\n⚰️ **HAS MUERTO**\n\nTu aventura termina aquí... por ahora.\n\n*Presiona 'Reiniciar' para comenzar de nuevo.*"
     
     current_state["last_played"] = datetime.now().isoformat()
+    observe_stage("state_apply", started)
     
     return current_state, f"\n\n👤 TÚ: {user_input}\n🎲 DM: {narrative}"
 
-def save_game_state(state, slot=1):
+SESSION_ONLY_KEYS = ("transcript_id", "session_id", "save_lineage")
+
+def undo_turns(intent, state):
+    steps = max(1, int(intent.arg)) if intent.arg.isdigit() else 1
+    
+    journal = get_turn_journal()
+    session_id = state.get("session_id")
+    overrides = {k: state[k] for k in SESSION_ONLY_KEYS if k in state}
+    restored = journal.rewind(session_id, steps, overrides) if journal and session_id else None
+    if restored is None:
+        return state, f"\n\n👤 TÚ: {intent.text}\n⚠️ No hay turnos que deshacer"
+    
+    logger.info(f"Rewound {steps} turn(s) to turn {restored.get('turn', 0)}")
+    return restored, f"\n\n👤 TÚ: {intent.text}\n⏪ **Deshiciste {steps} turno(s).** Vuelves al turno {restored.get('turn', 0)}."
+
+# process_turn with the state's own dice stream, plus the journal: records the dice draws,
+# combat result, DM response, any history summary applied and the state delta of the turn so
+# it can be recovered, undone (/deshacer) and replayed.
+def play_turn(user_input, current_state, mock=False, on_narrative=None):
+    with log_context(current_state.get("session_id"), current_state.get("turn", 0) + 1):
+        started = time.perf_counter()
+        intent = parse_intent(user_input.strip()[:500])
+        observe_stage("parse", started)
+        if intent.kind == "command" and intent.name == "undo":
+            return undo_turns(intent, current_state)
+        
+        # /ayuda and /estado leave the state alone, so they keep any prefetched responses too.
+        speculation = get_speculation_engine()
+        if intent.kind == "command" and intent.name in SYSTEM_COMMANDS:
+            speculation = None
+        prefetched = speculation.take(current_state, user_input) if speculation is not None else None
+        if prefetched is not None and on_narrative:
+            on_narrative(prefetched["narrative"])
+        
+        session_rng = get_session_rng(current_state)
+        journal = get_turn_journal()
+        session_id = current_state.get("session_id")
+        history_context = get_history_context()
+        summary = history_context.take_summary(current_state)
+        trace = {}
+        if journal is None or not session_id or current_state.get("game_over"):
+            new_state, turn_text = process_turn(user_input, current_state, mock, on_narrative, rng=session_rng, trace=trace,
+                                                dm_response=prefetched, intent=intent, summary=summary)
+            new_state["rng"] = session_rng.to_dict()
+        else:
+            before = copy.deepcopy(current_state)
+            rng = RecordingRandom(session_rng)
+            new_state, turn_text = process_turn(user_input, current_state, mock, on_narrative, rng=rng, trace=trace,
+                                                dm_response=prefetched, intent=intent, summary=summary)
+            new_state["turn"] = before.get("turn", 0) + 1
+            new_state["rng"] = session_rng.to_dict()
+            
+            try:
+                journal.record_turn(
+                    session_id, new_state["turn"], user_input, rng.draws,
+                    trace.get("combat"), trace.get("response"), state_delta(before, new_state), new_state,
+                    summary=trace.get("summary")
+                )
+            except Exception as e:
+                logger.error(f"Journal write failed for turn {new_state['turn']}: {e}")
+        
+        TURNS.inc(turn_source(trace.get("response"), prefetched))
+        history_context.schedule(new_state, mock)
+        if speculation is not None:
+            choices = (trace.get("response") or {}).get("choices") or []
+            speculation.schedule(new_state, choices, speculate_turn, mock)
+        return new_state, turn_text
+
+def turn_source(response, prefetched):
+    if response is None:
+        return "command"
+    if prefetched is not None:
+        return "prefetched"
+    if response.get("fast_path"):
+        return "fast_path"
+    return "fallback" if response.get("error") else "llm"
+
+# Plays a suggested choice on a copy of the state for the speculative engine. The copy carries
+# the same dice stream, so the prefetched narration matches the real turn's mechanics. Its
+# stage timings and fallbacks are labelled speculative.
+def speculate_turn(choice, state, mock):
+    trace = {}
+    with background_priority(), speculative_metrics(), log_context(state.get("session_id"), state.get("turn", 0) + 1):
+        process_turn(choice, state, mock, rng=get_session_rng(state), trace=trace)
+    response = trace.get("response")
+    if response is None or response.get("error"):
+        return None
+    return response
+
+# Re-runs every journaled turn with the recorded DM response and checks that the rules
+# reproduce the journaled state. States with a dice stream re-roll it and must draw exactly
+# the recorded dice; older ones are fed the recorded draws. Returns (final state, turns
+# replayed, mismatches).
+def replay_journal(session_id):
+    state = None
+    replayed = 0
+    mismatches = []
+    
+    for record in get_turn_journal().read(session_id):
+        if record["type"] == "snapshot":
+            state = copy.deepcopy(record["state"])
+            continue
+        if record["type"] != "turn" or state is None:
+            continue
+        
+        expected = apply_delta(copy.deepcopy(state), record["delta"])
+        session_rng = SessionRandom.from_dict(state["rng"]) if state.get("rng") else None
+        rng = RecordingRandom(session_rng) if session_rng else ReplayRandom(record["rolls"])
+        try:
+            state, _ = process_turn(record["input"], state, rng=rng, dm_response=record["response"], summary=record.get("summary"))
+            if session_rng:
+                state["rng"] = session_rng.to_dict()
+                if rng.draws != record["rolls"]:
+                    raise ReplayMismatch(f"Dice stream rolled {rng.draws}, journal has {record['rolls']}")
+            elif rng.position != len(rng.draws):
+                raise ReplayMismatch(f"{len(rng.draws) - rng.position} recorded rolls left unused")
+        except ReplayMismatch as e:
+            mismatches.append((record["turn"], str(e)))
+            state = expected
+            continue
+        
+        state["turn"] = record["turn"]
+        differing = sorted(k for k in set(state) | set(expected) if k != "last_played" and state.get(k) != expected.get(k))
+        if differing:
+            mismatches.append((record["turn"], f"state differs in {', '.join(differing)}"))
+            state = expected
+        replayed += 1
+    
+    return state, replayed, mismatches
+
+def save_game_state(state, slot=1, user_id=None):
     try:
+        started = time.perf_counter()
         state["last_played"] = datetime.now().isoformat()
-        save_path = get_save_path(slot)
-        with open(save_path, 'w', encoding='utf-8') as f:
-            json.dump(state, f, indent=4, ensure_ascii=False)
-        logger.info(f"Game saved to slot {slot}")
+        core_state = {k: v for k, v in state.items() if k not in SESSION_ONLY_KEYS}
+        transcript_id = state["transcript_id"]
+        lineage = state.get("save_lineage", {}).get(str(slot))
+        
+        record = get_save_store().write(
+            user_id, slot, core_state,
+            lambda start: get_transcript_store().entries(transcript_id, start),
+            lineage
+        )
+        state.setdefault("save_lineage", {})[str(slot)] = {"log_id": record["log_id"], "synced": record["log_count"]}
+        STORAGE_SECONDS.observe(time.perf_counter() - started, "save")
+        
+        logger.info(f"Game saved to slot {slot} ({record['log_count']} log entries)")
         return True, f"Partida guardada en Ranura {slot}"
     except Exception as e:
         logger.error(f"Save error: {e}")
         return False, f"Error al guardar: {str(e)}"
 
-def load_game_state(slot=1):
-    save_path = get_save_path(slot)
-    if not os.path.exists(save_path):
-        return None, f"No existe partida en Ranura {slot}"
-    
+def load_game_state(slot=1, user_id=None):
     try:
-        with open(save_path, 'r', encoding='utf-8') as f:
-            state = json.load(f)
+        started = time.perf_counter()
+        saved = get_save_store().read(user_id, slot)
+        if saved is None:
+            return None, f"No existe partida en Ranura {slot}"
+        
+        state, log_data, lineage = saved
         
         if "combat" not in state:
             state["combat"] = {"active": False}
@@ -477,31 +656,25 @@ def load_game_state(slot=1):
             state["death_count"] = 0
         if "total_kills" not in state:
             state["total_kills"] = 0
+        get_session_rng(state)
+        
+        loaded_msg = f"\n\n📂 **Partida cargada** (Ranura {slot})"
+        state["transcript_id"] = get_transcript_store().create_from_lines(log_data, [loaded_msg])
+        state["save_lineage"] = {str(slot): lineage} if lineage else {}
+        STORAGE_SECONDS.observe(time.perf_counter() - started, "load")
         
         logger.info(f"Game loaded from slot {slot}")
-        state['display_log'] += f"\n\n📂 **Partida cargada** (Ranura {slot})"
         return state, f"Carga exitosa desde Ranura {slot}"
     except Exception as e:
         logger.error(f"Load error: {e}")
         return None, f"Error al cargar: {str(e)}"
 
-def get_save_info(slot=1):
-    save_path = get_save_path(slot)
-    if not os.path.exists(save_path):
-        return None
-    
+def get_save_info(slot=1, user_id=None):
     try:
-        with open(save_path, 'r', encoding='utf-8') as f:
-            state = json.load(f)
-        
-        return {
-            "slot": slot,
-            "level": state.get("level", 1),
-            "location": state.get("location", "Unknown"),
-            "health": state.get("health", 0),
-            "max_health": state.get("max_health", 100),
-            "last_played": state.get("last_played", "Unknown"),
-            "game_over": state.get("game_over", False)
-        }
-    except:
+        return get_save_store().info(user_id, slot)
+    except Exception as e:
+        logger.warning(f"Save info error for slot {slot}: {e}")
         return None
+
+def list_save_info(user_id=None):
+    return get_save_store().list(user_id)
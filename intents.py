@@ -0,0 +1,98 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+# kind: "command" (/ayuda, /generar ...), "item" (usar/equipar <objeto>), "action" (atacar,
+# huir ...) or "free" (anything else, narrated by the DM). arg is the raw text after the
+# command or item verb, or the case/accent-folded text after an action word.
+Intent = namedtuple("Intent", ["kind", "name", "arg", "text"])
+
+# Vocabulary per language. Adding a language (or an alias) only adds alternatives to the
+# compiled patterns below, so parsing stays a single regex pass per turn.
+COMMANDS = {
+    "es": {"help": ["ayuda"], "spawn": ["generar"], "stats": ["estado"], "undo": ["deshacer"]},
+    "en": {"help": ["help"], "spawn": ["spawn"], "stats": ["stats"], "undo": ["undo"]}
+}
+
+ITEM_VERBS = {
+    "es": {"use": ["usar"], "equip": ["equipar"]},
+    "en": {"use": ["use"], "equip": ["equip"]}
+}
+
+ACTIONS = {
+    "es": {
+        "attack": ["atacar", "ataco", "ataca", "golpear", "golpeo", "golpea", "cortar", "corto", "luchar", "lucho",
+                   "empujar", "empujo"],
+        "defend": ["defender", "defiendo", "bloquear", "bloqueo", "escudar"],
+        "flee": ["huir", "huyo", "escapar", "escapo"],
+        "use": ["beber", "bebo", "comer"],
+        "look": ["mirar", "miro", "observar", "observo", "examinar", "examino", "inspeccionar"],
+        "search": ["buscar", "busco", "registrar", "registro"],
+        "rest": ["descansar", "descanso", "dormir", "duermo"]
+    },
+    "en": {
+        "attack": ["attack", "hit", "slash", "stab"],
+        "defend": ["defend", "block"],
+        "flee": ["run", "flee", "escape"],
+        "use": ["drink", "eat"],
+        "look": ["look", "examine"],
+        "search": ["search"],
+        "rest": ["rest", "sleep"]
+    }
+}
+
+# Spanish enclitic pronouns, so "atacarlo" or "golpearle" still count as the verb.
+CLITICS = ["me", "te", "se", "lo", "la", "le", "los", "las", "les", "nos"]
+
+
+def fold_text(text):
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def word_table(vocabulary):
+    table = {}
+    for words_by_name in vocabulary.values():
+        for name, words in words_by_name.items():
+            for word in words:
+                table[fold_text(word)] = name
+    return table
+
+def alternation(words):
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+class IntentParser:
+    def __init__(self, commands=COMMANDS, item_verbs=ITEM_VERBS, actions=ACTIONS, clitics=CLITICS):
+        self.commands = word_table(commands)
+        self.item_verbs = word_table(item_verbs)
+        self.actions = word_table(actions)
+
+        self.leading_re = re.compile(
+            rf"^\s*(?:/(?P<command>\w+)|(?P<verb>{alternation(self.item_verbs)})(?!\w))\s*(?P<arg>.*)$",
+            re.IGNORECASE | re.DOTALL
+        )
+        self.action_re = re.compile(rf"(?<!\w)({alternation(self.actions)})(?:{alternation(clitics)})?(?!\w)")
+
+    def parse(self, text):
+        text = text.strip()
+        match = self.leading_re.match(text)
+        if match:
+            arg = match.group("arg").strip()
+            if match.group("command"):
+                name = self.commands.get(fold_text(match.group("command")))
+                if name:
+                    return Intent("command", name, arg, text)
+            elif arg:
+                return Intent("item", self.item_verbs[fold_text(match.group("verb"))], arg, text)
+
+        folded = fold_text(text)
+        match = self.action_re.search(folded)
+        if match:
+            return Intent("action", self.actions[match.group(1)], folded[match.end():].strip(), text)
+        return Intent("free", None, "", text)
+
+
+parser = IntentParser()
+
+def parse_intent(text):
+    return parser.parse(text)
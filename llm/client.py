@@ -0,0 +1,264 @@
+import asyncio
+import json
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from config import LM_STUDIO_URL, LLM_BACKENDS, LLM_TIMEOUT, LLM_POOL_SIZE, LLM_KEEPALIVE_SECONDS, logger
+from llm.resilience import CircuitBreaker
+from metrics import LLM_CONNECTION_ERRORS, record_usage
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+# The backend could not answer. Callers tell the causes apart: a timeout is worth another
+# attempt within the turn, a refused connection or an open circuit is not.
+class LLMUnavailable(Exception):
+    pass
+
+class LLMConnectionError(LLMUnavailable):
+    pass
+
+class LLMTimeout(LLMUnavailable):
+    pass
+
+# Raised without touching the network while the backend's circuit breaker is open.
+class LLMCircuitOpen(LLMUnavailable):
+    pass
+
+
+STREAM_DONE = object()
+
+# Last chunk of a stream sent with stream_options.include_usage: token counts, no content.
+class StreamUsage(dict):
+    pass
+
+# OpenAI-compatible servers stream "data: {...}" lines and finish with "data: [DONE]".
+def parse_sse_line(line):
+    if not line:
+        return None
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    if not line.startswith("data:"):
+        return None
+    
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return STREAM_DONE
+    
+    chunk = json.loads(data)
+    choices = chunk.get("choices") or []
+    if not choices:
+        return StreamUsage(chunk["usage"]) if chunk.get("usage") else None
+    return choices[0].get("delta", {}).get("content") or None
+
+
+# Status code of a requests.HTTPError or aiohttp.ClientResponseError, else None.
+def http_status(error):
+    return getattr(getattr(error, "response", None), "status_code", None) or getattr(error, "status", None)
+
+def is_server_error(error):
+    status = http_status(error)
+    return status is not None and status >= 500
+
+
+class LLMClient:
+    def __init__(self, url=LM_STUDIO_URL, pool_size=LLM_POOL_SIZE, timeout=LLM_TIMEOUT):
+        self.url = url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(url)
+        self.structured_output = True
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._async_sessions = {}
+
+    def _get_session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    # Every request goes through the breaker: transport failures (connection errors, timeouts,
+    # 5xx) count against it, any other answer from the server proves it is up.
+    @contextmanager
+    def _guarded(self):
+        if not self.breaker.allow():
+            LLM_CONNECTION_ERRORS.inc("circuit_open")
+            raise LLMCircuitOpen(f"LLM backend {self.url} unavailable, next probe in {self.breaker.retry_in():.0f}s")
+        try:
+            yield
+        except (requests.exceptions.Timeout, asyncio.TimeoutError) as e:
+            self.breaker.record_failure()
+            LLM_CONNECTION_ERRORS.inc("timeout")
+            raise LLMTimeout(str(e) or "LLM request timed out") from e
+        except requests.exceptions.ConnectionError as e:
+            self.breaker.record_failure()
+            LLM_CONNECTION_ERRORS.inc("connection")
+            raise LLMConnectionError(str(e)) from e
+        except Exception as e:
+            if aiohttp is not None and isinstance(e, aiohttp.ClientConnectionError):
+                self.breaker.record_failure()
+                LLM_CONNECTION_ERRORS.inc("connection")
+                raise LLMConnectionError(str(e)) from e
+            if is_server_error(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        else:
+            self.breaker.record_success()
+
+    def _prepare(self, payload):
+        if self.structured_output or "response_format" not in payload:
+            return payload
+        return {k: v for k, v in payload.items() if k != "response_format"}
+
+    # A 400/422 to a request that carried response_format means the backend has no structured
+    # output support: remember it and resend the request without.
+    def _schema_rejected(self, error, sent):
+        if http_status(error) not in (400, 422) or "response_format" not in sent:
+            return False
+        if self.structured_output:
+            self.structured_output = False
+            logger.warning(f"LLM backend {self.url} rejected response_format, sending unconstrained requests from now on")
+        return True
+
+    def post_chat(self, payload, timeout=None):
+        sent = self._prepare(payload)
+        try:
+            return self._post_chat(sent, timeout)
+        except requests.exceptions.HTTPError as e:
+            if not self._schema_rejected(e, sent):
+                raise
+        return self._post_chat(self._prepare(payload), timeout)
+
+    def _post_chat(self, payload, timeout):
+        started = time.perf_counter()
+        with self._guarded():
+            response = self._get_session().post(self.url, json=payload, timeout=timeout or self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        record_usage(data.get("usage"), time.perf_counter() - started)
+        return data
+
+    def stream_chat(self, payload, timeout=None):
+        sent = self._prepare(payload)
+        try:
+            yield from self._stream_chat(sent, timeout)
+            return
+        except requests.exceptions.HTTPError as e:
+            if not self._schema_rejected(e, sent):
+                raise
+        yield from self._stream_chat(self._prepare(payload), timeout)
+
+    # `timeout` bounds the connection and each read, so a stalled stream fails within it.
+    # Token throughput is measured from the first token, leaving prompt processing out.
+    def _stream_chat(self, payload, timeout):
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        started = time.perf_counter()
+        first_token = None
+        usage = None
+        with self._guarded():
+            response = self._get_session().post(self.url, json=payload, timeout=timeout or self.timeout, stream=True)
+            with response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    delta = parse_sse_line(line)
+                    if delta is None:
+                        continue
+                    if delta is STREAM_DONE:
+                        break
+                    if isinstance(delta, StreamUsage):
+                        usage = delta
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    yield delta
+        record_usage(usage, time.perf_counter() - (first_token or started))
+
+    # aiohttp sessions are bound to the loop that created them, so keep one per loop.
+    def _get_async_session(self):
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is required for async LLM queries (pip install aiohttp)")
+
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=LLM_KEEPALIVE_SECONDS)
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._async_sessions[loop] = session
+        return session
+
+    async def post_chat_async(self, payload, timeout=None):
+        sent = self._prepare(payload)
+        try:
+            return await self._post_chat_async(sent, timeout)
+        except Exception as e:
+            if not self._schema_rejected(e, sent):
+                raise
+        return await self._post_chat_async(self._prepare(payload), timeout)
+
+    async def _post_chat_async(self, payload, timeout):
+        session = self._get_async_session()
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        started = time.perf_counter()
+        with self._guarded():
+            async with session.post(self.url, json=payload, timeout=request_timeout) as response:
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+        record_usage(data.get("usage"), time.perf_counter() - started)
+        return data
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if len(LLM_BACKENDS) > 1:
+                    # Imported here: the router is built out of LLMClients.
+                    from llm.router import LLMRouter
+                    logger.info(f"Routing LLM requests over {len(LLM_BACKENDS)} backends: {', '.join(LLM_BACKENDS)}")
+                    _client = LLMRouter()
+                else:
+                    logger.info(f"Creating pooled LLM client for {LLM_BACKENDS[0]}")
+                    _client = LLMClient(LLM_BACKENDS[0])
+    return _client
+
+# Swaps the shared client, e.g. to point the game at a local stand-in server.
+def set_client(client):
+    global _client
+    with _client_lock:
+        previous, _client = _client, client
+    if previous is not None and previous is not client:
+        previous.close()
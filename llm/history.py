@@ -0,0 +1,193 @@
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import logger, LLM_MODEL, SUMMARY_PROMPT
+from config import HISTORY_TOKEN_BUDGET, HISTORY_MAX_ITEMS, SUMMARY_ENABLED, SUMMARY_MAX_TOKENS, SUMMARY_MIN_ENTRIES
+from intents import parse_intent
+from llm.client import get_client
+from llm.scheduler import get_llm_scheduler, BACKGROUND
+from llm.prompt_builder import estimate_tokens, CHARS_PER_TOKEN, MAX_TRACKED_SESSIONS
+
+# /ayuda and /estado answers are UI output, not story: they never reach the prompt or the summary.
+SYSTEM_COMMANDS = ("help", "stats")
+
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s")
+
+
+def is_system_exchange(user_message):
+    content = user_message.get("content", "")
+    if not content.startswith("/"):
+        return False
+    intent = parse_intent(content)
+    return intent.kind == "command" and intent.name in SYSTEM_COMMANDS
+
+def story_pairs(entries):
+    pairs = []
+    for i in range(0, len(entries) - 1, 2):
+        if not is_system_exchange(entries[i]):
+            pairs.append((entries[i], entries[i + 1]))
+    return pairs
+
+def clip_summary(text, max_tokens=SUMMARY_MAX_TOKENS):
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    # Keep the most recent events: they matter more for the next turn than the oldest ones.
+    clipped = text[-limit:]
+    cut = clipped.find(" ")
+    return "…" + clipped[cut + 1:] if cut >= 0 else clipped
+
+# Fallback when the LLM is unavailable (and for mock mode): first sentence of each narrative.
+def extractive_summary(previous, entries):
+    lines = [previous] if previous else []
+    for _, answer in story_pairs(entries):
+        narrative = answer.get("content", "").strip()
+        if narrative:
+            lines.append(SENTENCE_END.split(narrative, 1)[0])
+    return clip_summary(" ".join(lines))
+
+def llm_summary(previous, entries, session=None):
+    turns = "\n".join(f"Jugador: {question['content']}\nDM: {answer['content']}" for question, answer in story_pairs(entries))
+    payload = {
+        "model": LLM_MODEL,
+        "messages": [
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_words=SUMMARY_MAX_TOKENS * 3 // 4)},
+            {"role": "user", "content": f"RESUMEN ANTERIOR:\n{previous or '(ninguno)'}\n\nTURNOS NUEVOS:\n{turns}"}
+        ],
+        "temperature": 0.3,
+        "max_tokens": SUMMARY_MAX_TOKENS * 2
+    }
+    # Only on an idle server: None puts the summary off until a later turn.
+    scheduler = get_llm_scheduler()
+    ticket = scheduler.request_idle(session, BACKGROUND)
+    if ticket is None:
+        return None
+    try:
+        data = get_client().post_chat(payload)
+    finally:
+        scheduler.release(ticket)
+    content = data["choices"][0]["message"]["content"].strip()
+    if not content:
+        raise ValueError("Empty summary")
+    return clip_summary(content)
+
+
+# Token-budgeted view of state["history"]. The prompt gets the newest exchanges that fit
+# HISTORY_TOKEN_BUDGET; whatever falls out of the window is folded into state["summary"] by a
+# single background worker after the turn, so the player never waits for it. A finished
+# summary is picked up at the start of the next turn (take_summary) and applied through
+# apply_summary, which the journal records like any other LLM output. Summaries only start
+# when the LLM has a free slot and no turn waiting; otherwise the next turn schedules them again.
+class HistoryContext:
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, min_entries=SUMMARY_MIN_ENTRIES, enabled=SUMMARY_ENABLED):
+        self.token_budget = token_budget
+        self.min_entries = min_entries
+        self.enabled = enabled
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    # Index of the first history entry sent verbatim. Whole exchanges only, newest first, and
+    # always at least the last one.
+    def window_start(self, history):
+        used = 0
+        start = len(history)
+        while start >= 2:
+            question, answer = history[start - 2], history[start - 1]
+            if not is_system_exchange(question):
+                cost = estimate_tokens(question.get("content", "")) + estimate_tokens(answer.get("content", ""))
+                if used + cost > self.token_budget and used > 0:
+                    break
+                used += cost
+            start -= 2
+        return start
+
+    def window(self, history):
+        messages = []
+        for question, answer in story_pairs(history[self.window_start(history):]):
+            messages.append(question)
+            messages.append(answer)
+        return messages
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        return self._executor
+
+    def _summarize(self, session, previous, entries, mock):
+        if not mock:
+            try:
+                summary = llm_summary(previous, entries, session)
+                if summary is None:
+                    logger.info("History summary deferred: the LLM is busy with player turns")
+                return summary
+            except Exception as e:
+                logger.warning(f"History summary failed, using extractive fallback: {e}")
+        return extractive_summary(previous, entries)
+
+    # Queues the exchanges that fell out of the prompt window for summarizing, once there are
+    # at least min_entries of them. One job per session at a time.
+    def schedule(self, state, mock=False):
+        if not self.enabled or state.get("game_over"):
+            return
+        key = state.get("session_id") or state.get("created_at")
+        history = state.get("history", [])
+        evicted = history[:self.window_start(history)]
+        if len(evicted) < self.min_entries:
+            return
+
+        executor = self._get_executor()
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job["future"].done():
+                return
+            previous = state.get("summary", "")
+            future = executor.submit(self._summarize, key, previous, list(evicted), mock)
+            self._jobs[key] = {"base": previous, "entries": list(evicted), "future": future}
+            self._jobs.move_to_end(key)
+            while len(self._jobs) > MAX_TRACKED_SESSIONS:
+                self._jobs.popitem(last=False)
+        logger.info(f"Summarizing {len(evicted)} old history messages in the background")
+
+    # A finished summary that still matches this state ({"text", "entries"}), or None. Never
+    # waits: an unfinished job is left for a later turn.
+    def take_summary(self, state):
+        key = state.get("session_id") or state.get("created_at")
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or not job["future"].done():
+                return None
+            del self._jobs[key]
+
+        count = len(job["entries"])
+        if job["future"].result() is None:
+            return None
+        if state.get("summary", "") != job["base"] or state.get("history", [])[:count] != job["entries"]:
+            return None
+        return {"text": job["future"].result(), "entries": count}
+
+
+# Deterministic part of a summary update, shared by live turns and journal replay.
+def apply_summary(state, summary):
+    state["summary"] = summary["text"]
+    del state["history"][:summary["entries"]]
+
+def trim_history(state):
+    history = state.get("history", [])
+    if len(history) > HISTORY_MAX_ITEMS:
+        state["history"] = history[-HISTORY_MAX_ITEMS:]
+
+
+_context = None
+_context_lock = threading.Lock()
+
+def get_history_context():
+    global _context
+    if _context is None:
+        with _context_lock:
+            if _context is None:
+                _context = HistoryContext()
+    return _context
@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+from string import Formatter
+from config import SYSTEM_PROMPT, STATE_PROMPT, COMBAT_PROMPT, ACTION_PROMPT, SUMMARY_CONTEXT_PROMPT, MAX_HEALTH_BASE
+
+CHARS_PER_TOKEN = 4
+MAX_TRACKED_SESSIONS = 256
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class CompiledTemplate:
+    def __init__(self, template):
+        self.segments = [(literal, field) for literal, field, _, _ in Formatter().parse(template)]
+
+    def render(self, values):
+        parts = []
+        for literal, field in self.segments:
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(values[field]))
+        return "".join(parts)
+
+
+STATE_TEMPLATE = CompiledTemplate(STATE_PROMPT)
+COMBAT_TEMPLATE = CompiledTemplate(COMBAT_PROMPT)
+ACTION_TEMPLATE = CompiledTemplate(ACTION_PROMPT)
+SUMMARY_TEMPLATE = CompiledTemplate(SUMMARY_CONTEXT_PROMPT)
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+
+def system_message(summary):
+    if not summary:
+        return SYSTEM_MESSAGE
+    return {"role": "system", "content": SYSTEM_PROMPT + SUMMARY_TEMPLATE.render({"summary": summary})}
+
+
+def build_context_string(state):
+    equipment = state.get("equipment", {})
+    combat = state.get("combat", {})
+    inventory = state.get("inventory", [])
+    status = state.get("status", "exploring")
+
+    effects = state.get("effects", {})
+    status_effects = []
+    if effects.get("poisoned"):
+        status_effects.append("Envenenado")
+    if effects.get("bleeding"):
+        status_effects.append("Sangrando")
+    if effects.get("blinded"):
+        status_effects.append("Ceguera")
+
+    if status_effects:
+        status += f" | Afecciones: {', '.join(status_effects)}"
+
+    combat_info = ""
+    if combat.get("active"):
+        combat_info = COMBAT_TEMPLATE.render({
+            "enemy_name": combat.get("enemy_name", "Unknown"),
+            "enemy_hp": combat.get("enemy_hp", 0),
+            "enemy_max_hp": combat.get("enemy_max_hp", 0),
+            "last_roll": combat.get("last_roll", "N/A")
+        })
+
+    return STATE_TEMPLATE.render({
+        "level": state.get("level", 1),
+        "health": state.get("health", 0),
+        "max_health": state.get("max_health", MAX_HEALTH_BASE),
+        "gold": state.get("gold", 0),
+        "location": state.get("location", "Unknown"),
+        "inventory": ", ".join(inventory) if inventory else "Vacío",
+        "equipment": f"Arma: {equipment.get('weapon') or 'Ninguna'} | Armadura: {equipment.get('armor') or 'Ninguna'} | Escudo: {equipment.get('shield') or 'Ninguno'}",
+        "status": status,
+        "combat": combat_info
+    })
+
+
+# Message layout: [static system rules + story summary] + [history window] + [action + volatile
+# state]. The first two parts are a stable prefix between turns, so the server can reuse its KV
+# cache; the summary only changes when old turns are folded into it.
+class PromptBuilder:
+    def __init__(self, history_context):
+        self.history_context = history_context
+        self._previous_prefix = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _reuse_prefix(self, session_key, prefix):
+        with self._lock:
+            previous = self._previous_prefix.get(session_key)
+
+        shared = 0
+        if previous:
+            limit = min(len(previous), len(prefix))
+            while shared < limit and previous[shared] == prefix[shared]:
+                shared += 1
+
+        reused = previous[:shared] + prefix[shared:] if shared else list(prefix)
+
+        with self._lock:
+            self._previous_prefix[session_key] = reused
+            self._previous_prefix.move_to_end(session_key)
+            while len(self._previous_prefix) > MAX_TRACKED_SESSIONS:
+                self._previous_prefix.popitem(last=False)
+
+        return reused, shared, previous is not None
+
+    def build(self, user_input, state):
+        session_key = state.get("session_id") or state.get("created_at")
+        window = self.history_context.window(state.get("history", []))
+        prefix, shared, seen = self._reuse_prefix(session_key, [system_message(state.get("summary"))] + window)
+
+        user_content = ACTION_TEMPLATE.render({"user_input": user_input}) + "\n" + build_context_string(state)
+        messages = prefix + [{"role": "user", "content": user_content}]
+
+        prefix_tokens = [estimate_tokens(m["content"]) for m in prefix]
+        total_tokens = sum(prefix_tokens) + estimate_tokens(user_content)
+        cached_tokens = sum(prefix_tokens[:shared]) if seen else 0
+
+        stats = {
+            "prompt_tokens": total_tokens,
+            "history_tokens": sum(prefix_tokens[1:]),
+            "cache_eligible_tokens": cached_tokens,
+            "cache_eligible_ratio": round(cached_tokens / total_tokens, 3) if total_tokens else 0.0
+        }
+        return messages, stats
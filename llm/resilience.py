@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+from config import logger, LLM_RETRY_DELAY, LLM_RETRY_MAX_DELAY, LLM_MIN_ATTEMPT_SECONDS
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+# Fails fast while the model server is down. After `failure_threshold` consecutive transport
+# failures (connection errors, timeouts, 5xx) the breaker opens and every call is refused at
+# once. After `reset_seconds` one probe call is let through (half-open): success closes the
+# breaker, failure opens it for another `reset_seconds`.
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self._counters = {"opened": 0, "rejected": 0, "failures": 0, "successes": 0}
+
+    def _refresh(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._state = HALF_OPEN
+            self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def retry_in(self):
+        with self._lock:
+            self._refresh()
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    # True if a call may go out now. In half-open state only one probe is in flight at a time.
+    def allow(self):
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                logger.info(f"LLM circuit {self.name} half-open, sending a probe request")
+                return True
+            self._counters["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._counters["successes"] += 1
+            self._failures = 0
+            self._probing = False
+            if self._state != CLOSED:
+                logger.info(f"LLM circuit {self.name} closed, backend recovered")
+            self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._counters["failures"] += 1
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._counters["opened"] += 1
+                logger.warning(f"LLM circuit {self.name} open after {self._failures} failure(s), "
+                               f"failing fast for {self.reset_seconds}s")
+
+    # A call that ended without telling whether the backend works (e.g. an abandoned stream).
+    def release(self):
+        with self._lock:
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return dict(self._counters, state=self._state, consecutive_failures=self._failures)
+
+
+# Time budget of one turn, shared by every attempt and the backoff between them.
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires
+
+
+# Full-jitter exponential backoff before retry `attempt` + 1, or None when the delay and a
+# next attempt of at least `reserve` seconds would not fit in what is left of the deadline.
+def backoff_delay(attempt, deadline=None, base=LLM_RETRY_DELAY, cap=LLM_RETRY_MAX_DELAY, reserve=LLM_MIN_ATTEMPT_SECONDS):
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if deadline is not None and deadline.remaining() <= delay + reserve:
+        return None
+    return delay
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import logger
+from config import RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MEMORY_ITEMS, RESPONSE_CACHE_DISK_PATH
+from config import RESPONSE_CACHE_DISK_ITEMS, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_VARIANTS
+from intents import parse_intent, fold_text
+
+HP_BANDS = 4
+
+
+# Same intent parser as the rules, so "ataco", "Atacó" and "atacar" share one cache entry.
+def normalize_intent(user_input):
+    intent = parse_intent(user_input)
+    if intent.kind == "item" or (intent.kind == "action" and intent.name == "use"):
+        return f"{intent.name}:{fold_text(intent.arg)}"
+    if intent.kind == "action":
+        return intent.name
+    return None
+
+
+def state_fingerprint(state, item_used=None):
+    combat = state.get("combat", {})
+    max_health = max(1, state.get("max_health", 100))
+    hp_band = min(HP_BANDS - 1, max(0, state.get("health", 0)) * HP_BANDS // max_health)
+    outcome = "none" if item_used is None else f"item:{item_used or 'fail'}"
+
+    return "|".join([
+        fold_text(state.get("location", "")),
+        combat.get("enemy_type") or "-",
+        str(hp_band),
+        outcome
+    ])
+
+
+# Combat turns get no key: their narrative is written around this turn's rolls and damage,
+# so another turn's would contradict the state. Mechanical rounds use the fast-path
+# templates instead.
+def make_key(user_input, state, combat_result=None, item_used=None):
+    intent = normalize_intent(user_input)
+    if intent is None or combat_result:
+        return None
+    raw_key = f"{intent}#{state_fingerprint(state, item_used)}"
+    return hashlib.sha1(raw_key.encode("utf-8")).hexdigest()
+
+
+# Only delta-free responses outside combat are reusable.
+def is_cacheable(response, in_combat):
+    if in_combat or not response.get("narrative") or response.get("new_item"):
+        return False
+    return not response.get("hp_change") and not response.get("gold_change")
+
+
+# Each key collects up to `variants` real LLM responses before it starts serving,
+# so repeated actions still get varied narration.
+class ResponseCache:
+    def __init__(self, memory_items=RESPONSE_CACHE_MEMORY_ITEMS, disk_path=RESPONSE_CACHE_DISK_PATH,
+                 disk_items=RESPONSE_CACHE_DISK_ITEMS, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+                 variants=RESPONSE_CACHE_VARIANTS):
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.ttl_seconds = ttl_seconds
+        self.variants = variants
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "stores": 0, "evictions": 0}
+
+        self._db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, variants TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+            self._db.commit()
+
+    def _expired(self, created):
+        return self.ttl_seconds and time.time() - created > self.ttl_seconds
+
+    def _load(self, key):
+        entry = self._memory.get(key)
+        if entry is not None:
+            if self._expired(entry["created"]):
+                del self._memory[key]
+                return None, None
+            self._memory.move_to_end(key)
+            return entry, "memory"
+
+        if self._db is None:
+            return None, None
+
+        row = self._db.execute("SELECT variants, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, None
+        if self._expired(row[1]):
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+            return None, None
+
+        entry = {"variants": json.loads(row[0]), "created": row[1]}
+        self._remember(key, entry)
+        return entry, "disk"
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            entry, tier = self._load(key)
+            if entry is None or len(entry["variants"]) < self.variants:
+                self._counters["misses"] += 1
+                return None
+
+            self._counters["hits"] += 1
+            self._counters[f"{tier}_hits"] += 1
+            if self._db is not None:
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+            return dict(random.choice(entry["variants"]))
+
+    def put(self, key, response):
+        if key is None:
+            return
+        with self._lock:
+            entry, _ = self._load(key)
+            if entry is None:
+                entry = {"variants": [], "created": time.time()}
+            if len(entry["variants"]) >= self.variants:
+                return
+
+            entry["variants"].append(response)
+            self._remember(key, entry)
+            self._counters["stores"] += 1
+
+            if self._db is not None:
+                now = time.time()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, variants, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(entry["variants"], ensure_ascii=False), entry["created"], now)
+                )
+                self._evict_disk()
+                self._db.commit()
+
+    def _evict_disk(self):
+        if self.ttl_seconds:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+        overflow = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.disk_items
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (overflow,)
+            )
+            self._counters["evictions"] += overflow
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_items"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                logger.info("Response cache enabled")
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,358 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from config import logger, LLM_BACKENDS, LLM_ROUTING, LLM_POOL_SIZE, LLM_TIMEOUT
+from config import LLM_HEDGE_ENABLED, LLM_HEDGE_MIN_SAMPLES, LLM_LATENCY_WINDOW
+from llm.client import LLMClient, LLMUnavailable, LLMTimeout, is_server_error
+from llm.resilience import OPEN
+
+EWMA_ALPHA = 0.3
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# Errors that say nothing about the request itself: another backend may well answer it.
+def is_backend_failure(error):
+    return isinstance(error, LLMUnavailable) or is_server_error(error)
+
+
+class Backend:
+    def __init__(self, client, window=LLM_LATENCY_WINDOW):
+        self.client = client
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        # "chat": whole response, "ttft": time to the first streamed token.
+        self.latency = {"chat": deque(maxlen=window), "ttft": deque(maxlen=window)}
+        self.ewma = {"chat": None, "ttft": None}
+
+    @property
+    def url(self):
+        return self.client.url
+
+    def healthy(self):
+        return self.client.breaker.state != OPEN
+
+    def observe(self, kind, seconds):
+        self.latency[kind].append(seconds)
+        previous = self.ewma[kind]
+        self.ewma[kind] = seconds if previous is None else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * previous
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "ewma_ms": {kind: round(value * 1000, 1) for kind, value in self.ewma.items() if value is not None},
+            "p95_ms": {kind: round(percentile(samples, 0.95) * 1000, 1) for kind, samples in self.latency.items() if samples},
+            "breaker": self.client.breaker.stats()
+        }
+
+
+# Drop-in for LLMClient over several OpenAI-compatible backends, each with its own pool and
+# circuit breaker. Every request goes to the preferred healthy backend ("least_loaded": fewest
+# requests in flight, then latency; "latency": lowest recent latency, then load) and fails over
+# to the next one on connection errors, timeouts (connect or read) and 5xx. Each backend tried
+# gets an equal share of what is left of the timeout with the healthy backends after it, so a
+# hung backend leaves time for the next one. With hedging on, a request still
+# unanswered after the p95 latency of recent requests (all backends together) is sent to a
+# second backend too, and whichever answers first wins; the loser's answer is dropped.
+class LLMRouter:
+    def __init__(self, urls=LLM_BACKENDS, strategy=LLM_ROUTING, hedge=LLM_HEDGE_ENABLED, timeout=LLM_TIMEOUT):
+        self.backends = [Backend(LLMClient(url)) for url in urls]
+        self.strategy = strategy
+        self.hedge = hedge
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._latency = {"chat": deque(maxlen=LLM_LATENCY_WINDOW), "ttft": deque(maxlen=LLM_LATENCY_WINDOW)}
+        self._counters = {"failovers": 0, "hedged": 0, "hedge_wins": 0}
+
+    @property
+    def url(self):
+        return self.backends[0].url
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=LLM_POOL_SIZE, thread_name_prefix="llm-hedge")
+        return self._executor
+
+    # Healthy backends first, best first; backends with an open breaker go last so a request
+    # still has somewhere to go (they refuse it at once) if every backend is down.
+    def ranked(self, kind):
+        def score(backend):
+            latency = backend.ewma[kind] or 0.0
+            load = backend.in_flight
+            key = (load, latency) if self.strategy == "least_loaded" else (latency, load)
+            return (not backend.healthy(),) + key
+        with self._lock:
+            return sorted(self.backends, key=score)
+
+    def _begin(self, backend):
+        with self._lock:
+            backend.in_flight += 1
+            backend.requests += 1
+
+    def _observe(self, backend, kind, started):
+        seconds = time.monotonic() - started
+        with self._lock:
+            backend.observe(kind, seconds)
+            self._latency[kind].append(seconds)
+
+    def _end(self, backend, error=None):
+        with self._lock:
+            backend.in_flight -= 1
+            if error is not None:
+                backend.failures += 1
+
+    def _hedge_after(self, backends, kind):
+        if not self.hedge or len(backends) < 2 or not backends[1].healthy():
+            return None
+        with self._lock:
+            samples = self._latency[kind]
+            return percentile(samples, 0.95) if len(samples) >= LLM_HEDGE_MIN_SAMPLES else None
+
+    def _call(self, backend, payload, timeout):
+        started = time.monotonic()
+        self._begin(backend)
+        try:
+            data = backend.client.post_chat(payload, timeout=timeout)
+        except Exception as e:
+            self._end(backend, e)
+            raise
+        self._observe(backend, "chat", started)
+        self._end(backend)
+        return data
+
+    def _failover(self, backend, error):
+        logger.warning(f"LLM backend {backend.url} failed ({error}), trying the next one")
+        with self._lock:
+            self._counters["failovers"] += 1
+
+    def _remaining(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeout("LLM request timed out on every backend tried")
+        return remaining
+
+    # An equal share of what is left with the healthy backends still to try; backends with an
+    # open breaker refuse at once and take no share.
+    def _share(self, deadline, backends):
+        remaining = self._remaining(deadline)
+        return remaining / max(1, sum(1 for backend in backends if backend.healthy()))
+
+    def post_chat(self, payload, timeout=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        backends = self.ranked("chat")
+        hedge_after = self._hedge_after(backends, "chat")
+        if hedge_after is not None:
+            return self._post_hedged(payload, backends, hedge_after, deadline)
+
+        error = None
+        for index, backend in enumerate(backends):
+            try:
+                return self._call(backend, payload, self._share(deadline, backends[index:]))
+            except Exception as e:
+                if not is_backend_failure(e):
+                    raise
+                error = e
+                self._failover(backend, e)
+        raise error
+
+    def _post_hedged(self, payload, backends, hedge_after, deadline):
+        executor = self._get_executor()
+        primary, secondary = backends[0], backends[1]
+        first = executor.submit(self._call, primary, payload, self._remaining(deadline))
+        futures = {first: primary}
+        done, _ = wait(futures, timeout=hedge_after)
+        if done:
+            if first.exception() is None or not is_backend_failure(first.exception()):
+                return first.result()
+            self._failover(primary, first.exception())
+        else:
+            logger.info(f"Hedging LLM request to {secondary.url} after {hedge_after * 1000:.0f}ms on {primary.url}")
+            with self._lock:
+                self._counters["hedged"] += 1
+                secondary.hedges += 1
+        futures[executor.submit(self._call, secondary, payload, self._remaining(deadline))] = secondary
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise LLMTimeout("LLM request timed out on every backend tried")
+            for future in done:
+                try:
+                    data = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if futures[future] is not primary:
+                    with self._lock:
+                        self._counters["hedge_wins"] += 1
+                return data
+        raise error
+
+    def _stream(self, backend, payload, timeout):
+        started = time.monotonic()
+        self._begin(backend)
+        first = True
+        error = None
+        stream = backend.client.stream_chat(payload, timeout=timeout)
+        try:
+            for delta in stream:
+                if first:
+                    self._observe(backend, "ttft", started)
+                    first = False
+                yield delta
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            stream.close()
+            self._end(backend, error)
+
+    # Fails over (on a connect or first-token timeout too) only until the first token: after
+    # that the caller already shows the narration.
+    def stream_chat(self, payload, timeout=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        backends = self.ranked("ttft")
+        hedge_after = self._hedge_after(backends, "ttft")
+        if hedge_after is not None:
+            yield from self._stream_hedged(payload, backends, hedge_after, deadline)
+            return
+
+        error = None
+        for index, backend in enumerate(backends):
+            started = False
+            try:
+                for delta in self._stream(backend, payload, self._share(deadline, backends[index:])):
+                    started = True
+                    yield delta
+                return
+            except Exception as e:
+                if started or not is_backend_failure(e):
+                    raise
+                error = e
+                self._failover(backend, e)
+        raise error
+
+    def _pump(self, backend, payload, timeout, out, cancel):
+        stream = self._stream(backend, payload, timeout)
+        try:
+            for delta in stream:
+                if cancel.is_set():
+                    break
+                out.put((backend, delta))
+            out.put((backend, None))
+        except Exception as e:
+            out.put((backend, e))
+        finally:
+            stream.close()
+
+    # Both streams run on pool threads feeding one queue; the first backend to produce a token
+    # is followed to the end and the other is told to stop.
+    def _stream_hedged(self, payload, backends, hedge_after, deadline):
+        executor = self._get_executor()
+        out = queue.Queue()
+        cancels = {}
+
+        def start(backend):
+            cancels[backend] = threading.Event()
+            executor.submit(self._pump, backend, payload, self._remaining(deadline), out, cancels[backend])
+
+        primary, secondary = backends[0], backends[1]
+        start(primary)
+        winner = None
+        error = None
+        hedge_at = time.monotonic() + hedge_after
+        try:
+            while True:
+                now = time.monotonic()
+                if winner is None and secondary not in cancels and now >= hedge_at:
+                    logger.info(f"Hedging LLM stream to {secondary.url} after {hedge_after * 1000:.0f}ms on {primary.url}")
+                    with self._lock:
+                        self._counters["hedged"] += 1
+                        secondary.hedges += 1
+                    start(secondary)
+                wait_until = hedge_at if winner is None and secondary not in cancels else deadline
+                try:
+                    backend, item = out.get(timeout=max(0.0, min(wait_until, deadline) - now))
+                except queue.Empty:
+                    if time.monotonic() >= deadline:
+                        raise LLMTimeout("LLM stream timed out on every backend tried")
+                    continue
+
+                if winner is not None and backend is not winner:
+                    continue
+                if isinstance(item, Exception):
+                    error = item
+                    if winner is not None or not is_backend_failure(item):
+                        raise item
+                    cancels[backend].set()
+                    if all(event.is_set() for event in cancels.values()):
+                        if secondary in cancels:
+                            raise error
+                        self._failover(backend, item)
+                        start(secondary)
+                    continue
+                if winner is None:
+                    winner = backend
+                    for other, event in cancels.items():
+                        if other is not winner:
+                            event.set()
+                    if winner is not primary:
+                        with self._lock:
+                            self._counters["hedge_wins"] += 1
+                if item is None:
+                    return
+                yield item
+        finally:
+            for event in cancels.values():
+                event.set()
+
+    async def post_chat_async(self, payload, timeout=None):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        error = None
+        backends = self.ranked("chat")
+        for index, backend in enumerate(backends):
+            started = time.monotonic()
+            self._begin(backend)
+            try:
+                data = await backend.client.post_chat_async(payload, timeout=self._share(deadline, backends[index:]))
+            except Exception as e:
+                self._end(backend, e)
+                if not is_backend_failure(e):
+                    raise
+                error = e
+                self._failover(backend, e)
+                continue
+            self._observe(backend, "chat", started)
+            self._end(backend)
+            return data
+        raise error
+
+    def close(self):
+        for backend in self.backends:
+            backend.client.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def aclose(self):
+        await asyncio.gather(*(backend.client.aclose() for backend in self.backends))
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, strategy=self.strategy, hedge=self.hedge,
+                        backends=[backend.stats() for backend in self.backends])
@@ -0,0 +1,261 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from config import logger, LLM_SLOTS, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class LLMOverloaded(Exception):
+    def __init__(self, message, waiting=0):
+        super().__init__(message)
+        self.waiting = waiting
+
+
+# Work started inside `with background_priority():` (summaries, speculative turns) queues
+# behind player turns without every call site having to pass a priority down.
+_local = threading.local()
+
+@contextmanager
+def background_priority():
+    previous = getattr(_local, "priority", None)
+    _local.priority = BACKGROUND
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+def current_priority():
+    priority = getattr(_local, "priority", None)
+    return INTERACTIVE if priority is None else priority
+
+
+class Ticket:
+    def __init__(self, session, priority, on_queue):
+        self.session = session
+        self.priority = priority
+        self.on_queue = on_queue
+        self.created = time.monotonic()
+        self.granted = False
+        self.queued = False
+        self.cancelled = False
+        self.released = False
+        self.waiter = None
+
+
+def resolve_waiter(future):
+    if not future.done():
+        future.set_result(None)
+
+
+# Admission in front of the LLM transport. `slots` requests run at once (match the server's
+# parallel sequences); the rest wait in per-priority queues where sessions take turns
+# round-robin, so one player's burst never starves the others and interactive turns always
+# go before background work. Background work is turned away while players are waiting, and
+# players are turned away once `max_queue` of them are.
+class LLMScheduler:
+    def __init__(self, slots=LLM_SLOTS, max_queue=LLM_MAX_QUEUE, queue_timeout=LLM_QUEUE_TIMEOUT):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._busy = 0
+        self._queues = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}
+        self._counters = {"granted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "deferred": 0, "max_waiting": 0}
+        self._wait_seconds = 0.0
+
+    def _waiting(self, priority):
+        return sum(len(tickets) for tickets in self._queues[priority].values())
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        self._busy += 1
+        self._counters["granted"] += 1
+        self._wait_seconds += time.monotonic() - ticket.created
+        self._wake(ticket)
+
+    # Hands a granted or cancelled ticket back to the event loop awaiting it in wait_async.
+    def _wake(self, ticket):
+        if ticket.waiter is None:
+            return
+        loop, future = ticket.waiter
+        try:
+            loop.call_soon_threadsafe(resolve_waiter, future)
+        except RuntimeError:
+            pass  # the loop is closed: nobody is waiting any more
+
+    def _next(self):
+        for priority in (INTERACTIVE, BACKGROUND):
+            queue = self._queues[priority]
+            if queue:
+                session, tickets = next(iter(queue.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    queue.move_to_end(session)
+                else:
+                    del queue[session]
+                return ticket
+        return None
+
+    def _dispatch(self):
+        while self._busy < self.slots:
+            ticket = self._next()
+            if ticket is None:
+                break
+            self._grant(ticket)
+        self._cond.notify_all()
+
+    def _remove(self, ticket):
+        tickets = self._queues[ticket.priority].get(ticket.session)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[ticket.priority][ticket.session]
+
+    # 1-based place in line: everything of a better priority, then the round-robin order
+    # among the sessions waiting at the same priority.
+    def position(self, ticket):
+        with self._cond:
+            return self._position(ticket)
+
+    def _position(self, ticket):
+        ahead = sum(self._waiting(p) for p in self._queues if p < ticket.priority)
+        sessions = list(self._queues[ticket.priority].items())
+        own = next((i for i, (session, _) in enumerate(sessions) if session == ticket.session), None)
+        if own is None:
+            return ahead + 1
+        index = sessions[own][1].index(ticket)
+        for i, (_, tickets) in enumerate(sessions):
+            if i != own:
+                ahead += min(len(tickets), index + (1 if i < own else 0))
+        return ahead + index + 1
+
+    def request(self, session, priority=None, on_queue=None):
+        priority = current_priority() if priority is None else priority
+        ticket = Ticket(session, priority, on_queue)
+        with self._cond:
+            better_or_equal = sum(self._waiting(p) for p in self._queues if p <= priority)
+            if self._busy < self.slots and better_or_equal == 0:
+                self._grant(ticket)
+                return ticket
+
+            players_waiting = self._waiting(INTERACTIVE)
+            if players_waiting >= (self.max_queue if priority == INTERACTIVE else 1):
+                self._counters["rejected"] += 1
+                raise LLMOverloaded(f"LLM saturated: {players_waiting} turns waiting for {self.slots} slot(s)",
+                                    players_waiting)
+
+            self._queues[priority].setdefault(session, deque()).append(ticket)
+            ticket.queued = True
+            self._counters["queued"] += 1
+            waiting = players_waiting + self._waiting(BACKGROUND) + (1 if priority == INTERACTIVE else 0)
+            self._counters["max_waiting"] = max(self._counters["max_waiting"], waiting)
+        return ticket
+
+    def wait(self, ticket, timeout=None):
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        last_position = None
+        with self._cond:
+            while not ticket.granted:
+                if ticket.cancelled:
+                    raise LLMOverloaded("Request cancelled while queued")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._remove(ticket)
+                    self._counters["timed_out"] += 1
+                    raise LLMOverloaded(f"No LLM slot within {timeout}s", self._waiting(INTERACTIVE))
+                position = self._position(ticket)
+                if position != last_position and ticket.on_queue is not None:
+                    ticket.on_queue(position)
+                last_position = position
+                self._cond.wait(remaining)
+
+    # asyncio counterpart of wait(): the queued ticket waits on a future the scheduler resolves
+    # from whichever thread grants or cancels it, so no thread is tied up per waiting player.
+    async def wait_async(self, ticket, timeout=None):
+        timeout = self.queue_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if ticket.granted:
+                return
+            if ticket.cancelled:
+                raise LLMOverloaded("Request cancelled while queued")
+            ticket.waiter = (loop, future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self._cond:
+            ticket.waiter = None
+            if ticket.granted:
+                return
+            if ticket.cancelled:
+                raise LLMOverloaded("Request cancelled while queued")
+            self._remove(ticket)
+            self._counters["timed_out"] += 1
+            raise LLMOverloaded(f"No LLM slot within {timeout}s", self._waiting(INTERACTIVE))
+
+    def release(self, ticket):
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.granted:
+                self._busy -= 1
+            else:
+                ticket.cancelled = True
+                self._remove(ticket)
+                self._wake(ticket)
+            self._dispatch()
+
+    # A granted ticket if a slot is free and nobody is queued, else None. For work that can be
+    # put off (summaries) and must not hold a slot a player is about to need.
+    def request_idle(self, session, priority=BACKGROUND):
+        ticket = Ticket(session, priority, None)
+        with self._cond:
+            if self._busy >= self.slots or any(self._queues.values()):
+                self._counters["deferred"] += 1
+                return None
+            self._grant(ticket)
+        return ticket
+
+    # Yields the ticket once a slot is free; ticket.queued tells whether it had to wait.
+    @contextmanager
+    def slot(self, session, priority=None, on_queue=None):
+        ticket = self.request(session, priority, on_queue)
+        try:
+            if not ticket.granted:
+                self.wait(ticket)
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        with self._cond:
+            granted = self._counters["granted"]
+            return dict(
+                self._counters,
+                slots=self.slots,
+                busy=self._busy,
+                waiting={PRIORITY_NAMES[p]: self._waiting(p) for p in self._queues},
+                avg_wait_ms=round(self._wait_seconds / granted * 1000, 1) if granted else 0.0
+            )
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_llm_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                logger.info(f"LLM scheduler: {LLM_SLOTS} slot(s), up to {LLM_MAX_QUEUE} queued turns")
+                _scheduler = LLMScheduler()
+    return _scheduler
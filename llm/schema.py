@@ -0,0 +1,144 @@
+import json
+import threading
+import json_repair
+from config import logger
+
+# The DM response contract. "narrative" comes first: grammar-constrained servers generate the
+# properties in schema order, so streaming can show the narration before the numbers.
+DM_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "narrative": {"type": "string"},
+        "hp_change": {"type": "integer"},
+        "gold_change": {"type": "integer"},
+        "new_item": {"type": ["string", "null"]},
+        "item_used": {"type": ["string", "null"]},
+        "combat_ended": {"type": "boolean"},
+        "level_up": {"type": "boolean"},
+        "xp_gained": {"type": "integer"},
+        "choices": {"type": "array", "items": {"type": "string"}, "maxItems": 4}
+    },
+    "required": ["narrative", "hp_change", "gold_change", "new_item", "item_used", "combat_ended", "level_up",
+                 "xp_gained", "choices"],
+    "additionalProperties": False
+}
+
+# OpenAI-style structured output, as accepted by LM Studio, llama.cpp server and vLLM.
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "dm_response", "strict": True, "schema": DM_RESPONSE_SCHEMA}
+}
+
+TRUE_WORDS = ("true", "yes", "si", "sí", "1")
+
+
+def to_int(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(float(str(value).strip()))
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_WORDS
+    return bool(value)
+
+def to_optional_str(value):
+    if value is None or value is False:
+        return None
+    value = str(value).strip()
+    return value if value and value.lower() not in ("null", "none") else None
+
+def to_choices(value):
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        raise ValueError("choices is not a list")
+    return [str(choice).strip() for choice in value if str(choice).strip()]
+
+# field: (converter, default when missing or unusable). "narrative" has no default.
+# Defaults go through the converter too, so every response gets its own choices list.
+FIELDS = {
+    "hp_change": (to_int, 0),
+    "gold_change": (to_int, 0),
+    "new_item": (to_optional_str, None),
+    "item_used": (to_optional_str, None),
+    "combat_ended": (to_bool, False),
+    "level_up": (to_bool, False),
+    "xp_gained": (to_int, 0),
+    "choices": (to_choices, [])
+}
+
+
+# Parse outcomes of DM responses. "strict": valid JSON as sent, "repaired": needed json_repair,
+# "failed": unusable (the turn retries the generation); "coerced": fields that had the wrong
+# type or were missing and got converted or defaulted instead of forcing a retry.
+class ResponseStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {"responses": 0, "strict": 0, "repaired": 0, "failed": 0, "coerced": 0, "retries": 0}
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        responses = counters["responses"]
+        counters["parse_failure_rate"] = counters["failed"] / responses if responses else 0.0
+        counters["repair_rate"] = counters["repaired"] / responses if responses else 0.0
+        counters["retry_rate"] = counters["retries"] / responses if responses else 0.0
+        return counters
+
+
+response_stats = ResponseStats()
+
+def get_response_stats():
+    return response_stats
+
+
+# Checks and normalizes every field in one pass. Only a missing or empty narrative is fatal;
+# anything else falls back to its default, which is cheaper than generating the turn again.
+def check_fields(data):
+    if not isinstance(data, dict):
+        raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+    narrative = data.get("narrative")
+    if not isinstance(narrative, str) or not narrative.strip():
+        raise ValueError("Parsed JSON missing 'narrative' field")
+
+    response = {"narrative": narrative}
+    coerced = 0
+    for field, (convert, default) in FIELDS.items():
+        value = data.get(field)
+        try:
+            checked = convert(default if value is None else value)
+        except (TypeError, ValueError, OverflowError):
+            checked = convert(default)
+        if checked != value:
+            coerced += 1
+        response[field] = checked
+    return response, coerced
+
+# Strict json.loads first (the normal case with a schema-constrained backend), json_repair only
+# when that fails.
+def parse_dm_response(raw_content):
+    response_stats.count("responses")
+    try:
+        data = json.loads(raw_content)
+        mode = "strict"
+    except ValueError:
+        data = json_repair.loads(raw_content)
+        mode = "repaired"
+
+    try:
+        response, coerced = check_fields(data)
+    except ValueError:
+        response_stats.count("failed")
+        raise
+    response_stats.count(mode)
+    if coerced:
+        response_stats.count("coerced", coerced)
+        logger.debug(f"DM response: {coerced} field(s) missing or of the wrong type, defaults used")
+    return response
@@ -0,0 +1,179 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import logger, LLM_TIMEOUT
+from config import SPECULATION_ENABLED, SPECULATION_CHOICES, SPECULATION_WORKERS, SPECULATION_MAX_PENDING
+from intents import fold_text
+from llm.prompt_builder import estimate_tokens, MAX_TRACKED_SESSIONS
+
+# Keys that change without changing what the DM would answer (saving, transcript and journal
+# bookkeeping; /estado still counts as a journaled turn).
+VOLATILE_KEYS = ("last_played", "transcript_id", "save_lineage", "turn")
+
+CHOICE_PUNCTUATION = re.compile(r"[\s.,;:!¡?¿\"'«»]+")
+
+OUTCOME_LABELS = {"hits": "hit", "late_hits": "hit (waited for it)", "misses": "miss", "stale": "stale",
+                  "cancelled": "cancelled before it started"}
+
+
+def normalize_choice(text):
+    return CHOICE_PUNCTUATION.sub(" ", fold_text(text or "")).strip()
+
+# Exact fingerprint of everything a turn depends on, dice stream included: the same state
+# and input roll the same dice, so a prefetched response matches the real turn's mechanics.
+def turn_fingerprint(state):
+    core = {k: v for k, v in state.items() if k not in VOLATILE_KEYS}
+    return hashlib.sha1(json.dumps(core, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+def response_tokens(response):
+    return estimate_tokens(json.dumps(response, ensure_ascii=False)) if response else 0
+
+
+# After each turn, runs `runner(choice, state_copy, mock)` for the top suggested choices on a
+# small shared pool. The next turn of that session either takes the matching result (waiting
+# for it if it is already being generated) or cancels it; results that were generated but not
+# used count as wasted tokens.
+class SpeculativeEngine:
+    def __init__(self, choices=SPECULATION_CHOICES, workers=SPECULATION_WORKERS, max_pending=SPECULATION_MAX_PENDING):
+        self.choices = choices
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculation")
+        self._sessions = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._counters = {"scheduled": 0, "hits": 0, "late_hits": 0, "misses": 0, "stale": 0,
+                          "cancelled": 0, "skipped": 0, "wasted_responses": 0, "wasted_tokens": 0, "served_tokens": 0}
+
+    def _finished(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _discard(self, future):
+        if future.cancel():
+            with self._lock:
+                self._counters["cancelled"] += 1
+            return
+        future.add_done_callback(self._wasted)
+
+    def _wasted(self, future):
+        try:
+            tokens = response_tokens(future.result())
+        except Exception:
+            return
+        with self._lock:
+            self._counters["wasted_responses"] += 1
+            self._counters["wasted_tokens"] += tokens
+
+    def _pop_session(self, key):
+        with self._lock:
+            return self._sessions.pop(key, None)
+
+    def cancel(self, state):
+        entry = self._pop_session(state.get("session_id") or state.get("created_at"))
+        if entry is not None:
+            for future in entry["jobs"].values():
+                self._discard(future)
+
+    def schedule(self, state, choices, runner, mock=False):
+        self.cancel(state)
+        if state.get("game_over") or not choices:
+            return
+
+        key = state.get("session_id") or state.get("created_at")
+        fingerprint = turn_fingerprint(state)
+        jobs = {}
+        for choice in choices[:self.choices]:
+            normalized = normalize_choice(choice)
+            if not normalized or choice.lstrip().startswith("/") or normalized in jobs:
+                continue
+            with self._lock:
+                if self._pending >= self.max_pending:
+                    self._counters["skipped"] += 1
+                    continue
+                self._pending += 1
+                self._counters["scheduled"] += 1
+            future = self._executor.submit(runner, choice, copy.deepcopy(state), mock)
+            future.add_done_callback(self._finished)
+            jobs[normalized] = future
+
+        if jobs:
+            evicted = []
+            with self._lock:
+                self._sessions[key] = {"fingerprint": fingerprint, "jobs": jobs}
+                self._sessions.move_to_end(key)
+                while len(self._sessions) > MAX_TRACKED_SESSIONS:
+                    evicted.extend(self._sessions.popitem(last=False)[1]["jobs"].values())
+            for future in evicted:
+                self._discard(future)
+
+    # The prefetched response for this input if the state still matches, else None. Every
+    # other prefetched choice of the session is cancelled either way.
+    def take(self, state, user_input, timeout=LLM_TIMEOUT):
+        entry = self._pop_session(state.get("session_id") or state.get("created_at"))
+        if entry is None:
+            return None
+
+        future = entry["jobs"].pop(normalize_choice(user_input), None)
+        for other in entry["jobs"].values():
+            self._discard(other)
+
+        outcome = "misses"
+        if future is not None and entry["fingerprint"] != turn_fingerprint(state):
+            outcome = "stale"
+        elif future is not None and future.cancel():
+            # Still queued behind other prefetches: the live turn asks the LLM itself. Not a
+            # lookup that missed, so it stays out of the hit rate.
+            outcome = "cancelled"
+        elif future is not None:
+            # Already generating (or done): waiting beats starting the same request again.
+            outcome = "hits" if future.done() else "late_hits"
+
+        response = None
+        if outcome in ("hits", "late_hits"):
+            try:
+                response = future.result(timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Speculative response failed: {e}")
+            if response is None:
+                outcome = "misses"
+        elif outcome == "stale":
+            self._discard(future)
+
+        with self._lock:
+            self._counters[outcome] += 1
+            if response is not None:
+                self._counters["served_tokens"] += response_tokens(response)
+            stats = self._stats_locked()
+        logger.info(f"Speculation {OUTCOME_LABELS[outcome]}: {stats['hit_rate']:.0%} hit rate, "
+                    f"{stats['wasted_tokens']} tokens wasted")
+        return response
+
+    def _stats_locked(self):
+        counters = dict(self._counters, pending=self._pending)
+        hits = counters["hits"] + counters["late_hits"]
+        lookups = hits + counters["misses"] + counters["stale"]
+        counters["hit_rate"] = hits / lookups if lookups else 0.0
+        return counters
+
+    def stats(self):
+        with self._lock:
+            return self._stats_locked()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_speculation_engine():
+    global _engine
+    if not SPECULATION_ENABLED:
+        return None
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                logger.info("Speculative prefetch enabled")
+                _engine = SpeculativeEngine()
+    return _engine
@@ -0,0 +1,112 @@
+import json
+import re
+import threading
+import time
+
+NARRATIVE_KEY_RE = re.compile(r'"narrative"\s*:\s*"')
+HEX_DIGITS = "0123456789abcdefABCDEF"
+
+
+def decode_json_fragment(fragment):
+    try:
+        return json.loads(f'"{fragment}"', strict=False)
+    except ValueError:
+        return fragment.replace('\\"', '"').replace("\\n", "\n")
+
+
+class NarrativeExtractor:
+    def __init__(self):
+        self.narrative = ""
+        self.done = False
+        self._raw = ""
+        self._pos = None
+
+    # Returns True when new narrative text was decoded from this chunk.
+    def feed(self, chunk):
+        if self.done or not chunk:
+            return False
+
+        self._raw += chunk
+
+        if self._pos is None:
+            match = NARRATIVE_KEY_RE.search(self._raw)
+            if not match:
+                return False
+            self._pos = match.end()
+
+        cut, closed = self._safe_cut()
+        if cut == self._pos:
+            self.done = closed
+            return False
+
+        self.narrative += decode_json_fragment(self._raw[self._pos:cut])
+        self._pos = cut
+        self.done = closed
+        return True
+
+    # Finds how far the raw string can be decoded without splitting an escape sequence.
+    def _safe_cut(self):
+        raw = self._raw
+        i = self._pos
+        end = len(raw)
+
+        while i < end:
+            char = raw[i]
+            if char == '"':
+                return i, True
+            if char != "\\":
+                i += 1
+                continue
+
+            if i + 1 >= end:
+                break
+            if raw[i + 1] != "u":
+                i += 2
+                continue
+
+            if i + 6 > end:
+                break
+            code = raw[i + 2:i + 6]
+            if not all(c in HEX_DIGITS for c in code):
+                i += 2
+                continue
+            if 0xD800 <= int(code, 16) <= 0xDBFF:
+                if i + 12 > end:
+                    break
+                i += 12 if raw[i + 6:i + 8] == "\\u" else 6
+            else:
+                i += 6
+
+        return i, False
+
+
+# One streamed turn, from the worker thread that plays it to the callback that polls it.
+# finished_at lets the app drop results that no client came back for.
+class TurnStream:
+    def __init__(self, prefix="", session_id=None):
+        self.prefix = prefix
+        self.session_id = session_id
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._narrative = ""
+        self._done = False
+        self._result = None
+
+    def update(self, narrative):
+        with self._lock:
+            self._narrative = narrative
+
+    def finish(self, result):
+        with self._lock:
+            self._result = result
+            self._done = True
+            self.finished_at = time.monotonic()
+
+    @property
+    def done(self):
+        with self._lock:
+            return self._done
+
+    def snapshot(self):
+        with self._lock:
+            return self._narrative, self._done, self._result
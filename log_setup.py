@@ -0,0 +1,130 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_ROTATE_SECONDS, LOG_BACKUP_COUNT, LOG_JSON
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# Session and turn of the code running now, stamped on every record it logs. ContextVars follow
+# asyncio tasks; threads start with none, so each turn binds its own.
+_log_context = ContextVar("log_context", default=None)
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+@contextmanager
+def log_context(session_id=None, turn=None):
+    token = _log_context.set((session_id, turn))
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+# Runs in the logging thread, before the record is queued: the listener thread would see its
+# own (empty) context.
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        session_id, turn = _log_context.get() or (None, None)
+        record.session_id = session_id
+        record.turn = turn
+        return True
+
+
+class JSONLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if getattr(record, "session_id", None):
+            entry["session_id"] = record.session_id
+        if getattr(record, "turn", None) is not None:
+            entry["turn"] = record.turn
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Rotates when the file would pass max_bytes and when a new rotate_seconds period starts
+# (periods are aligned to the epoch, so daily rotation happens at midnight UTC). A file last
+# written in an earlier period, e.g. before a restart, is rotated on the first write.
+class RotatingLogHandler(RotatingFileHandler):
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, rotate_seconds=LOG_ROTATE_SECONDS, backup_count=LOG_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.rotate_seconds = rotate_seconds
+        last_write = os.path.getmtime(self.baseFilename) if os.path.exists(self.baseFilename) else time.time()
+        self.rollover_at = self.period_end(last_write)
+
+    def period_end(self, timestamp):
+        if not self.rotate_seconds:
+            return None
+        return (int(timestamp // self.rotate_seconds) + 1) * self.rotate_seconds
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and record.created >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self.period_end(time.time())
+
+
+# Sends every log record through a queue to a background thread that owns the real handlers
+# (stdout and the rotating file), so a slow disk never blocks a turn. Idempotent; the app
+# calls it at startup, tools and tests that only import game modules log nowhere but stderr
+# (warnings and up) unless they call it too.
+def setup_logging(level=LOG_LEVEL, log_file=LOG_FILE, json_lines=LOG_JSON, console=True):
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+
+        formatter = JSONLinesFormatter() if json_lines else logging.Formatter(TEXT_FORMAT)
+        handlers = []
+        if console:
+            handlers.append(logging.StreamHandler(sys.stdout))
+        if log_file:
+            directory = os.path.dirname(log_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            handlers.append(RotatingLogHandler(log_file))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+# Flushes the queue and closes the handlers (also run at exit).
+def stop_logging():
+    global _listener
+    with _listener_lock:
+        listener, _listener = _listener, None
+    if listener is None:
+        return
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler) and handler.queue is listener.queue:
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        handler.close()
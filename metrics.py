@@ -0,0 +1,210 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from llm.schema import get_response_stats
+from storage.sessions import get_session_store
+
+# Prometheus text exposition (format 0.0.4) without the client library. Recording is a lock
+# plus an addition or a bisect, so instrumenting a turn costs a few microseconds; all
+# formatting happens when /metrics is scraped.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                 1, 2.5, 5, 10, 30, 60)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 30, 40, 60, 80, 100, 150, 200, 400)
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {} if labels else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{format_labels(self.labels, key)} {format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=STAGE_BUCKETS, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        if not labels:
+            self._series[()] = [[0] * (len(self.buckets) + 1), 0.0]
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == "+Inf" else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total!r}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+# Value read from elsewhere (a store, a stats() dict) at scrape time. `read` returns a number,
+# or a {label_values: number} dict when the metric has labels.
+class Collected:
+    def __init__(self, name, help_text, read, kind="gauge", labels=()):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.kind = kind
+        self.labels = labels
+
+    def samples(self):
+        value = self.read()
+        if not self.labels:
+            return [f"{self.name} {format_value(value)}"]
+        return [f"{self.name}{format_labels(self.labels, key)} {format_value(v)}" for key, v in value.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.samples()
+            except Exception:
+                # A failing collector (e.g. the session database is down) must not take out
+                # the whole scrape.
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+TURN_STAGES = registry.register(Histogram(
+    "dungeoncore_turn_stage_seconds", "Time spent in each stage of a turn.", labels=("stage", "speculative")))
+TURNS = registry.register(Counter(
+    "dungeoncore_turns_total", "Turns played, by where the DM response came from.", labels=("source",)))
+LLM_CONNECTION_ERRORS = registry.register(Counter(
+    "dungeoncore_llm_connection_errors_total", "LLM requests that could not reach a backend.", labels=("kind",)))
+FALLBACKS = registry.register(Counter(
+    "dungeoncore_fallback_responses_total", "Turns answered with a fallback instead of the DM.", labels=("reason", "speculative")))
+PROMPT_TOKENS = registry.register(Counter(
+    "dungeoncore_llm_prompt_tokens_total", "Prompt tokens reported by the backend (usage)."))
+COMPLETION_TOKENS = registry.register(Counter(
+    "dungeoncore_llm_completion_tokens_total", "Completion tokens reported by the backend (usage)."))
+TOKENS_PER_SECOND = registry.register(Histogram(
+    "dungeoncore_llm_tokens_per_second", "Generation speed of each LLM response.", THROUGHPUT_BUCKETS))
+STORAGE_SECONDS = registry.register(Histogram(
+    "dungeoncore_save_seconds", "Duration of save slot writes and reads.", labels=("operation",)))
+registry.register(Collected(
+    "dungeoncore_llm_retries_total", "LLM generations retried after an error or an unusable response.",
+    lambda: get_response_stats().stats()["retries"], kind="counter"))
+registry.register(Collected(
+    "dungeoncore_llm_responses_total", "DM responses by how they parsed (strict JSON, repaired, failed).",
+    lambda: {(mode,): get_response_stats().stats()[mode] for mode in ("strict", "repaired", "failed")},
+    kind="counter", labels=("parse",)))
+registry.register(Collected(
+    "dungeoncore_active_sessions", "Sessions active within the idle timeout.", lambda: get_session_store().count()))
+
+
+def get_registry():
+    return registry
+
+# Speculative turns (played ahead on a copy of the state) run the same code as real ones.
+# Inside `with speculative_metrics():` the turn stages and fallbacks they record are labelled
+# speculative="1", so dashboards can tell them apart from what players waited for.
+_local = threading.local()
+
+@contextmanager
+def speculative_metrics():
+    previous = getattr(_local, "speculative", False)
+    _local.speculative = True
+    try:
+        yield
+    finally:
+        _local.speculative = previous
+
+def speculative_label():
+    return "1" if getattr(_local, "speculative", False) else "0"
+
+# Records the stage that began at `started` and returns the time it ended, so consecutive
+# stages chain: started = observe_stage("combat", started).
+def observe_stage(stage, started):
+    now = time.perf_counter()
+    TURN_STAGES.observe(now - started, stage, speculative_label())
+    return now
+
+@contextmanager
+def stage_timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        TURN_STAGES.observe(time.perf_counter() - started, stage, speculative_label())
+
+def timed_stage(stage):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count_fallback(reason):
+    FALLBACKS.inc(reason, speculative_label())
+
+def record_usage(usage, seconds):
+    if not usage:
+        return
+    prompt = usage.get("prompt_tokens") or 0
+    completion = usage.get("completion_tokens") or 0
+    PROMPT_TOKENS.inc(amount=prompt)
+    COMPLETION_TOKENS.inc(amount=completion)
+    if completion and seconds > 0:
+        TOKENS_PER_SECOND.observe(completion / seconds)
@@ -0,0 +1,134 @@
+import zlib
+from config import FAST_PATH_TURNS
+from content.registry import get_content
+
+# Local narration for turns whose outcome the rules already decided (combat rounds, usar and
+# equipar). Placeholders: {enemy}, {damage}, {enemy_damage}, {item}. Enemy names go in
+# without an article ("Rata Gigante", "Orco Berserker" ...).
+TEMPLATES = {
+    "hit": [
+        "Tu arma encuentra un hueco en la guardia. {enemy} retrocede herido ({damage} de daño).",
+        "Golpeas con fuerza y {enemy} gruñe de dolor al recibir {damage} de daño.",
+        "El acero muerde la carne: {enemy} recibe {damage} de daño y vuelve a la carga."
+    ],
+    "crit": [
+        "¡Un golpe perfecto! Tu arma se hunde hasta el fondo y {enemy} se tambalea ({damage} de daño).",
+        "Ves la abertura antes de que exista. El tajo es brutal: {damage} de daño a {enemy}.",
+        "El tiempo parece detenerse mientras descargas un golpe devastador sobre {enemy} ({damage} de daño)."
+    ],
+    "miss": [
+        "{enemy} esquiva tu ataque en el último instante. Tu arma solo corta el aire.",
+        "Tu golpe rebota sin fuerza. {enemy} se ríe entre dientes.",
+        "Calculas mal la distancia y tu ataque se pierde en la penumbra."
+    ],
+    "kill": [
+        "Tu último golpe es definitivo. {enemy} se desploma y no vuelve a levantarse.",
+        "{enemy} cae de rodillas con un estertor y su cuerpo queda inmóvil sobre la piedra.",
+        "Con un golpe final acabas con {enemy}. El silencio vuelve a la cripta."
+    ],
+    "defend": [
+        "Alzas la guardia a tiempo. {enemy} golpea, pero solo te alcanza de refilón ({enemy_damage} de daño).",
+        "Te cubres y aguantas la embestida de {enemy}: {enemy_damage} de daño en lugar de un golpe de lleno."
+    ],
+    "flee_success": [
+        "Aprovechas un descuido de {enemy} y te pierdes entre las sombras.",
+        "Das media vuelta y corres. Los gritos de {enemy} se apagan a tu espalda."
+    ],
+    "flee_failure": [
+        "Intentas huir, pero {enemy} te corta el paso y te castiga ({enemy_damage} de daño).",
+        "Tropiezas al retroceder y {enemy} no desaprovecha la ocasión ({enemy_damage} de daño)."
+    ],
+    "heal": [
+        "Bebes {item} de un trago. Un calor reconfortante recorre tus heridas.",
+        "Destapas el frasco de {item} y lo apuras. El dolor remite poco a poco."
+    ],
+    "cure": [
+        "Tomas {item}. El veneno deja de arder en tus venas."
+    ],
+    "escape": [
+        "Lanzas {item} contra el suelo. Una nube espesa lo cubre todo y escapas sin ser visto."
+    ],
+    "equip": [
+        "Te preparas con {item}. Sientes su peso familiar al instante.",
+        "Ajustas {item} con cuidado. Estás listo para lo que venga."
+    ],
+    "item_failed": [
+        "Rebuscas en tu equipo, pero no consigues lo que buscabas."
+    ],
+    "counter": [
+        "{enemy} aprovecha la distracción y te ataca ({enemy_damage} de daño)."
+    ]
+}
+
+COMBAT_CHOICES = ["Atacar", "Defender", "Huir"]
+EXPLORE_CHOICES = ["Explorar los alrededores", "Buscar objetos", "Descansar"]
+
+ITEM_OUTCOMES = {"heal": "heal", "cure_poison": "cure", "escape": "escape"}
+
+
+def combat_outcome(combat_result):
+    action = combat_result.get("player_action")
+    if action == "attack":
+        if combat_result.get("enemy_dead"):
+            return "kill"
+        if combat_result.get("player_crit"):
+            return "crit"
+        return "hit" if combat_result.get("player_hit") else "miss"
+    if action == "defend":
+        return "defend"
+    if action == "flee":
+        return "flee_success" if combat_result.get("combat_ended") else "flee_failure"
+    return None
+
+def item_outcome(item_used):
+    if not item_used:
+        return "item_failed"
+    item = get_content().items.by_name.get(item_used) or {}
+    return ITEM_OUTCOMES.get(item.get("effect"), "equip")
+
+# Picks a template without touching the dice stream: a journaled turn replays with its recorded
+# response and must draw exactly the same dice, so the choice is a hash of the turn instead.
+def render(outcome, state, **values):
+    templates = TEMPLATES[outcome]
+    seed = f"{outcome}:{state.get('turn', 0)}:{len(state.get('history', []))}"
+    return templates[zlib.crc32(seed.encode("utf-8")) % len(templates)].format(**values)
+
+# DM response for a turn the rules fully decided, or None when it needs the LLM (exploration,
+# free text in combat, /generar). `lines` are the mechanical results shown under the narration.
+def fast_path_response(intent, state, combat_result=None, item_used=None, lines=(), level_up=False):
+    combat = state.get("combat", {})
+    ended = bool(combat_result and combat_result.get("combat_ended"))
+    if ended and combat.get("active"):
+        # A kill or escape template over a fight the state still has running would contradict it.
+        return None
+    values = {
+        "enemy": combat.get("enemy_name") or "El enemigo",
+        "damage": (combat_result or {}).get("player_damage", 0),
+        "enemy_damage": (combat_result or {}).get("enemy_damage", 0),
+        "item": item_used or ""
+    }
+
+    if intent.kind == "item" and "item" in FAST_PATH_TURNS:
+        narrative = [render(item_outcome(item_used), state, **values)]
+        if combat_result and combat_result.get("enemy_damage", 0) > 0:
+            narrative.append(render("counter", state, **values))
+    elif intent.kind == "action" and combat_result and "combat" in FAST_PATH_TURNS:
+        outcome = combat_outcome(combat_result)
+        if outcome is None:
+            return None
+        narrative = [render(outcome, state, **values)]
+    else:
+        return None
+
+    return {
+        "narrative": "\n\n".join([" ".join(narrative)] + [line for line in lines if line]),
+        "hp_change": 0,
+        "gold_change": 0,
+        "new_item": None,
+        "item_used": item_used,
+        "combat_ended": ended,
+        "level_up": level_up,
+        "xp_gained": (combat_result or {}).get("xp_gained", 0),
+        "choices": list(COMBAT_CHOICES if combat.get("active") else EXPLORE_CHOICES),
+        "fast_path": True
+    }
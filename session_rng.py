@@ -0,0 +1,87 @@
+import secrets
+
+MASK64 = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9e3779b97f4a7c15
+
+
+def mix64(z):
+    z = ((z ^ (z >> 30)) * 0xbf58476d1ce4e5b9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94d049bb133111eb) & MASK64
+    return z ^ (z >> 31)
+
+def mix_gamma(z):
+    z = ((z ^ (z >> 33)) * 0xff51afd7ed558ccd) & MASK64
+    z = ((z ^ (z >> 33)) * 0xc4ceb9fe1a85ec53) & MASK64
+    z = (z ^ (z >> 33)) | 1
+    if bin(z ^ (z >> 1)).count("1") < 24:
+        z ^= 0xaaaaaaaaaaaaaaaa
+    return z
+
+
+# Splittable (SplitMix64) dice stream owned by one game state. Its whole state is two 64-bit
+# ints, so it is stored in the state itself ("rng") and travels with sessions, saves and
+# journal snapshots: the same state always rolls the same dice. fork() hands out streams
+# that are statistically independent of this one, for parallel workers or simulations.
+class SessionRandom:
+    def __init__(self, seed=None, gamma=GOLDEN_GAMMA):
+        self.seed = (secrets.randbits(64) if seed is None else seed) & MASK64
+        self.gamma = gamma | 1
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(int(data["seed"]), int(data["gamma"]))
+
+    def to_dict(self):
+        return {"seed": self.seed, "gamma": self.gamma}
+
+    def _next_seed(self):
+        self.seed = (self.seed + self.gamma) & MASK64
+        return self.seed
+
+    def next64(self):
+        return mix64(self._next_seed())
+
+    def fork(self):
+        return SessionRandom(self.next64(), mix_gamma(self._next_seed()))
+
+    def forks(self, count):
+        return [self.fork() for _ in range(count)]
+
+    def random(self):
+        return (self.next64() >> 11) * (1.0 / (1 << 53))
+
+    # Unbiased: rejects the top partial bucket instead of taking a plain modulo.
+    def randbelow(self, n):
+        if n <= 0:
+            raise ValueError("randbelow() needs a positive bound")
+        limit = (1 << 64) - (1 << 64) % n
+        while True:
+            value = self.next64()
+            if value < limit:
+                return value % n
+
+    def randint(self, a, b):
+        return a + self.randbelow(b - a + 1)
+
+    def choice(self, seq):
+        if not seq:
+            raise IndexError("Cannot choose from an empty sequence")
+        return seq[self.randbelow(len(seq))]
+
+    def choices(self, population, weights):
+        point = self.random() * sum(weights)
+        for item, weight in zip(population, weights):
+            point -= weight
+            if point < 0:
+                return [item]
+        return [population[-1]]
+
+
+# The state's dice stream, created (and stored) on first use for states saved without one.
+def get_session_rng(state):
+    data = state.get("rng")
+    if data:
+        return SessionRandom.from_dict(data)
+    rng = SessionRandom()
+    state["rng"] = rng.to_dict()
+    return rng
@@ -0,0 +1,233 @@
+import copy
+import json
+import os
+import threading
+import time
+from config import logger, JOURNAL_ENABLED, JOURNAL_DIR, JOURNAL_SNAPSHOT_EVERY, JOURNAL_KEEP_SNAPSHOTS
+from config import JOURNAL_FSYNC, JOURNAL_RETENTION_SECONDS
+
+# Snapshot reasons that start a new timeline: nothing before them can be rewound to.
+BARRIER_REASONS = ("new", "load")
+
+
+# Wraps the dice source for one turn and remembers every draw, so the turn can be replayed.
+class RecordingRandom:
+    def __init__(self, source):
+        self.source = source
+        self.draws = []
+
+    def randint(self, a, b):
+        value = self.source.randint(a, b)
+        self.draws.append(value)
+        return value
+
+    def choice(self, seq):
+        value = self.source.choice(seq)
+        self.draws.append(value)
+        return value
+
+
+class ReplayMismatch(ValueError):
+    pass
+
+
+# Feeds the draws recorded by RecordingRandom back in the same order.
+class ReplayRandom:
+    def __init__(self, draws):
+        self.draws = list(draws)
+        self.position = 0
+
+    def _next(self):
+        if self.position >= len(self.draws):
+            raise ReplayMismatch("Turn asked for more dice rolls than were recorded")
+        value = self.draws[self.position]
+        self.position += 1
+        return value
+
+    def randint(self, a, b):
+        value = self._next()
+        if not a <= value <= b:
+            raise ReplayMismatch(f"Recorded roll {value} outside {a}..{b}")
+        return value
+
+    def choice(self, seq):
+        value = self._next()
+        if value not in seq:
+            raise ReplayMismatch(f"Recorded choice {value!r} not available")
+        return value
+
+
+def state_delta(before, after):
+    delta = {"set": {k: v for k, v in after.items() if k not in before or before[k] != v}}
+    removed = [k for k in before if k not in after]
+    if removed:
+        delta["unset"] = removed
+    return delta
+
+def apply_delta(state, delta):
+    state = dict(state)
+    state.update(delta.get("set", {}))
+    for key in delta.get("unset", ()):
+        state.pop(key, None)
+    return state
+
+# Walks the journal records and returns [(turn, state), ...] for every reachable turn.
+# Values are shared between consecutive states, so callers must copy before mutating.
+def build_timeline(records):
+    timeline = []
+    for record in records:
+        if record["type"] == "snapshot":
+            if record.get("reason") in BARRIER_REASONS:
+                timeline = []
+            while timeline and timeline[-1][0] >= record["turn"]:
+                timeline.pop()
+            timeline.append((record["turn"], record["state"]))
+        elif record["type"] == "turn" and timeline:
+            timeline.append((record["turn"], apply_delta(timeline[-1][1], record["delta"])))
+    return timeline
+
+
+# Append-only per-session journal: one JSON line per turn event (input, dice draws, combat
+# result, DM response and the resulting state delta) plus periodic full snapshots. Appending
+# a turn costs one short write; recovery replays at most JOURNAL_SNAPSHOT_EVERY deltas.
+class TurnJournal:
+    def __init__(self, directory=JOURNAL_DIR, snapshot_every=JOURNAL_SNAPSHOT_EVERY,
+                 keep_snapshots=JOURNAL_KEEP_SNAPSHOTS, fsync=JOURNAL_FSYNC,
+                 retention_seconds=JOURNAL_RETENTION_SECONDS):
+        self.directory = directory
+        self.snapshot_every = max(1, snapshot_every)
+        self.keep_snapshots = max(1, keep_snapshots)
+        self.fsync = fsync
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        if not session_id or not all(c in "0123456789abcdef" for c in session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        return os.path.join(self.directory, f"{session_id}.jsonl")
+
+    def _append(self, session_id, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with open(self._path(session_id), 'a', encoding='utf-8') as f:
+            f.write(line)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read(self, session_id):
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return []
+        records = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Torn write from a crash: everything after it is unusable.
+                    logger.warning(f"Journal {session_id[:8]} truncated at record {len(records)}")
+                    break
+        return records
+
+    def snapshot(self, session_id, state, reason="periodic"):
+        record = {"type": "snapshot", "turn": state.get("turn", 0), "reason": reason, "time": time.time(), "state": state}
+        with self._lock:
+            self._append(session_id, record)
+        if reason == "new":
+            self.purge_expired()
+
+    def record_turn(self, session_id, turn, user_input, draws, combat_result, response, delta, state, summary=None):
+        record = {
+            "type": "turn",
+            "turn": turn,
+            "time": time.time(),
+            "input": user_input,
+            "rolls": draws,
+            "combat": combat_result,
+            "response": response,
+            "delta": delta
+        }
+        if summary is not None:
+            record["summary"] = summary
+        with self._lock:
+            self._append(session_id, record)
+
+        if turn % self.snapshot_every == 0:
+            self.snapshot(session_id, state)
+            if turn % (self.snapshot_every * self.keep_snapshots) == 0:
+                self.compact(session_id)
+
+    # Latest state after a crash (or after the session store dropped it), or None.
+    def recover(self, session_id):
+        records = self.read(session_id)
+        start = max((i for i, r in enumerate(records) if r["type"] == "snapshot"), default=None)
+        if start is None:
+            return None
+
+        state = records[start]["state"]
+        for record in records[start + 1:]:
+            if record["type"] == "turn":
+                state = apply_delta(state, record["delta"])
+        logger.info(f"Session {session_id[:8]} recovered from journal at turn {state.get('turn', 0)}")
+        return copy.deepcopy(state)
+
+    # State as it was `steps` turns ago; the rewind is journaled as a snapshot so the next
+    # turns continue from it. Returns None when the journal does not reach that far back.
+    def rewind(self, session_id, steps=1, overrides=None):
+        timeline = build_timeline(self.read(session_id))
+        if len(timeline) <= steps:
+            return None
+        state = copy.deepcopy(timeline[-1 - steps][1])
+        state.update(overrides or {})
+        self.snapshot(session_id, state, "rewind")
+        return state
+
+    # Drops everything before the last barrier or the last `keep_snapshots` snapshots.
+    def compact(self, session_id):
+        with self._lock:
+            records = self.read(session_id)
+            snapshots = [i for i, r in enumerate(records) if r["type"] == "snapshot"]
+            barriers = [i for i in snapshots if records[i].get("reason") in BARRIER_REASONS]
+            start = max(snapshots[-self.keep_snapshots] if len(snapshots) >= self.keep_snapshots else 0,
+                        barriers[-1] if barriers else 0)
+            if start == 0:
+                return
+
+            path = self._path(session_id)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records[start:]:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            os.replace(tmp_path, path)
+        logger.debug(f"Journal {session_id[:8]} compacted, dropped {start} records")
+
+    def delete(self, session_id):
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def purge_expired(self):
+        cutoff = time.time() - self.retention_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".jsonl") and os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+def get_turn_journal():
+    global _journal
+    if not JOURNAL_ENABLED:
+        return None
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = TurnJournal()
+    return _journal
@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import re
+import sys
+from config import logger, SAVE_DIR, SAVE_DB_PATH, DEFAULT_SAVE_USER
+from log_setup import setup_logging
+from storage.save_format import FileSaveStore
+from storage.sqlite_saves import SQLiteSaveStore
+
+SLOT_FILE_RE = re.compile(r"^slot_([A-Za-z0-9_-]+)\.(save|json)$")
+
+
+def find_slots(save_dir):
+    slots = set()
+    for name in os.listdir(save_dir):
+        match = SLOT_FILE_RE.match(name)
+        if match:
+            slots.add(match.group(1))
+    return sorted(slots)
+
+def decode_lines(log_data):
+    return [json.loads(line) for line in log_data.decode("utf-8").splitlines() if line.strip()]
+
+def migrate(save_dir=SAVE_DIR, db_path=SAVE_DB_PATH, user_id=DEFAULT_SAVE_USER, overwrite=False):
+    source = FileSaveStore(save_dir, user_id)
+    target = SQLiteSaveStore(db_path, user_id)
+    imported, skipped = 0, 0
+
+    for slot in find_slots(save_dir):
+        if not overwrite and target.info(user_id, slot):
+            logger.info(f"Slot {slot} already exists for user {user_id}, skipping")
+            skipped += 1
+            continue
+
+        saved = source.read(user_id, slot)
+        if saved is None:
+            continue
+        state, log_data, _ = saved
+        entries = decode_lines(log_data)
+        target.write(user_id, slot, state, lambda start: entries[start:])
+        logger.info(f"Imported slot {slot} ({len(entries)} log entries)")
+        imported += 1
+
+    return imported, skipped
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import JSON/file save slots into the SQLite save store.")
+    parser.add_argument("--save-dir", default=SAVE_DIR)
+    parser.add_argument("--db", default=SAVE_DB_PATH)
+    parser.add_argument("--user", default=DEFAULT_SAVE_USER, help="Namespace to import the slots into")
+    parser.add_argument("--overwrite", action="store_true", help="Replace slots that already exist in the database")
+    args = parser.parse_args(argv)
+
+    # Per-slot progress on the console only; the game's log file is the server's.
+    setup_logging(log_file=None)
+    imported, skipped = migrate(args.save_dir, args.db, args.user, args.overwrite)
+    print(f"Imported {imported} slot(s), skipped {skipped}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
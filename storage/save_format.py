@@ -0,0 +1,205 @@
+import gzip
+import json
+import os
+import re
+import threading
+import uuid
+from storage.save_index import SaveIndex
+
+SAVE_FORMAT_VERSION = 2
+
+# Version 2 slot layout:
+#   slot_N.save               gzip-compressed compact JSON record with the core state
+#   slot_N.<log_id>.log.jsonl append-only transcript, one JSON string per line
+# The record stores how many log entries (and bytes) belong to the save, so a crash
+# half-way through an append never corrupts the slot: the next save truncates back.
+
+
+NAME_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def check_name(name):
+    name = str(name)
+    if not NAME_RE.fullmatch(name):
+        raise ValueError(f"Invalid save name: {name!r}")
+    return name
+
+
+def core_path(save_dir, slot):
+    return os.path.join(save_dir, f"slot_{slot}.save")
+
+def log_path(save_dir, slot, log_id):
+    return os.path.join(save_dir, f"slot_{slot}.{log_id}.log.jsonl")
+
+def legacy_path(save_dir, slot):
+    return os.path.join(save_dir, f"slot_{slot}.json")
+
+
+def atomic_write(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def encode_entries(entries):
+    return "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+
+
+def read_record(save_dir, slot):
+    path = core_path(save_dir, slot)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        record = json.load(f)
+    if record.get("version", 0) > SAVE_FORMAT_VERSION:
+        raise ValueError(f"Save format v{record['version']} is newer than supported v{SAVE_FORMAT_VERSION}")
+    return record
+
+def write_record(save_dir, slot, record):
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    atomic_write(core_path(save_dir, slot), gzip.compress(payload, compresslevel=6))
+
+
+# lineage = {"log_id", "synced"} means the first `synced` transcript entries already live in
+# that slot log, so only the entries after them have to be appended.
+def write_slot(save_dir, slot, core_state, read_entries, lineage=None):
+    try:
+        previous = read_record(save_dir, slot)
+    except (OSError, ValueError):
+        previous = None
+
+    if (previous and lineage and previous.get("log_id") == lineage.get("log_id")
+            and previous.get("log_count") == lineage.get("synced")):
+        log_id = previous["log_id"]
+        new_entries = read_entries(previous["log_count"])
+        with open(log_path(save_dir, slot, log_id), 'r+b') as f:
+            f.seek(previous["log_bytes"])
+            f.truncate()
+            f.write(encode_entries(new_entries))
+            f.flush()
+            os.fsync(f.fileno())
+            log_bytes = f.tell()
+        log_count = previous["log_count"] + len(new_entries)
+    else:
+        log_id = uuid.uuid4().hex
+        data = encode_entries(read_entries(0))
+        atomic_write(log_path(save_dir, slot, log_id), data)
+        log_bytes = len(data)
+        log_count = data.count(b"\n")
+
+    record = {
+        "version": SAVE_FORMAT_VERSION,
+        "state": core_state,
+        "log_id": log_id,
+        "log_count": log_count,
+        "log_bytes": log_bytes
+    }
+    write_record(save_dir, slot, record)
+
+    if previous and previous.get("log_id") != log_id:
+        try:
+            os.remove(log_path(save_dir, slot, previous["log_id"]))
+        except OSError:
+            pass
+
+    return record
+
+def read_log_bytes(save_dir, slot, record):
+    with open(log_path(save_dir, slot, record["log_id"]), 'rb') as f:
+        return f.read(record["log_bytes"])
+
+def read_legacy(save_dir, slot):
+    path = legacy_path(save_dir, slot)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_save_info(state, slot):
+    return {
+        "slot": slot,
+        "level": state.get("level", 1),
+        "location": state.get("location", "Unknown"),
+        "health": state.get("health", 0),
+        "max_health": state.get("max_health", 100),
+        "last_played": state.get("last_played", "Unknown"),
+        "game_over": state.get("game_over", False)
+    }
+
+
+# File backend: one directory per user namespace, slot metadata served from a SaveIndex.
+class FileSaveStore:
+    def __init__(self, save_dir, default_user):
+        self.save_dir = save_dir
+        self.default_user = default_user
+        self._indexes = {}
+        self._lock = threading.Lock()
+        os.makedirs(save_dir, exist_ok=True)
+
+    def _dir(self, user_id):
+        if not user_id or user_id == self.default_user:
+            return self.save_dir
+        user_dir = os.path.join(self.save_dir, "users", check_name(user_id))
+        os.makedirs(user_dir, exist_ok=True)
+        return user_dir
+
+    def _index(self, save_dir):
+        with self._lock:
+            if save_dir not in self._indexes:
+                self._indexes[save_dir] = SaveIndex(save_dir)
+            return self._indexes[save_dir]
+
+    def write(self, user_id, slot, core_state, read_entries, lineage=None):
+        save_dir = self._dir(user_id)
+        record = write_slot(save_dir, check_name(slot), core_state, read_entries, lineage)
+        mtime = os.stat(core_path(save_dir, slot)).st_mtime_ns
+        self._index(save_dir).put(slot, dict(build_save_info(core_state, slot), mtime=mtime))
+        return record
+
+    # Returns (state, encoded log lines, lineage) or None; legacy JSON saves have no lineage.
+    def read(self, user_id, slot):
+        save_dir = self._dir(user_id)
+        record = read_record(save_dir, check_name(slot))
+        if record:
+            return record["state"], read_log_bytes(save_dir, slot, record), {"log_id": record["log_id"], "synced": record["log_count"]}
+
+        state = read_legacy(save_dir, slot)
+        if state is None:
+            return None
+        display_log = state.pop("display_log", [])
+        if isinstance(display_log, str):
+            display_log = [display_log]
+        return state, encode_entries(display_log), None
+
+    def info(self, user_id, slot):
+        save_dir = self._dir(user_id)
+        index = self._index(save_dir)
+        save_path = core_path(save_dir, check_name(slot))
+        if not os.path.exists(save_path):
+            save_path = legacy_path(save_dir, slot)
+        try:
+            mtime = os.stat(save_path).st_mtime_ns
+        except FileNotFoundError:
+            index.remove(slot)
+            return None
+
+        entry = index.get(slot)
+        if entry and entry.pop("mtime", None) == mtime:
+            return entry
+
+        # Save written before the index existed, or changed outside the game: parse it once.
+        record = read_record(save_dir, slot)
+        state = record["state"] if record else read_legacy(save_dir, slot)
+        info = build_save_info(state, slot)
+        index.put(slot, dict(info, mtime=mtime))
+        return info
+
+    def list(self, user_id):
+        entries = self._index(self._dir(user_id)).all().values()
+        return sorted(
+            ({k: v for k, v in entry.items() if k != "mtime"} for entry in entries),
+            key=lambda info: info.get("last_played", ""),
+            reverse=True
+        )
@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+from config import logger
+
+
+# Manifest of per-slot metadata (level, location, ...) written at save time, so listing
+# slots never has to open and parse the save files themselves. The parsed manifest is
+# cached in-process and re-read only when its mtime changes.
+class SaveIndex:
+    def __init__(self, save_dir, filename="index.json"):
+        self.path = os.path.join(save_dir, filename)
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._mtime = None
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._entries = {}
+            self._mtime = None
+            return
+
+        if mtime != self._mtime:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except ValueError as e:
+                logger.warning(f"Save index unreadable, rebuilding: {e}")
+                self._entries = {}
+            self._mtime = mtime
+
+    def _write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def get(self, slot):
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(str(slot))
+            return dict(entry) if entry else None
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return {slot: dict(entry) for slot, entry in self._entries.items()}
+
+    def put(self, slot, metadata):
+        with self._lock:
+            self._refresh()
+            self._entries[str(slot)] = metadata
+            self._write()
+
+    def remove(self, slot):
+        with self._lock:
+            self._refresh()
+            if self._entries.pop(str(slot), None) is not None:
+                self._write()
@@ -0,0 +1,23 @@
+import threading
+from config import logger, SAVE_BACKEND, SAVE_DIR, SAVE_DB_PATH, DEFAULT_SAVE_USER
+from storage.save_format import FileSaveStore
+from storage.sqlite_saves import SQLiteSaveStore
+
+_store = None
+_store_lock = threading.Lock()
+
+def create_save_store(backend=SAVE_BACKEND):
+    if backend == "file":
+        return FileSaveStore(SAVE_DIR, DEFAULT_SAVE_USER)
+    if backend == "sqlite":
+        return SQLiteSaveStore(SAVE_DB_PATH, DEFAULT_SAVE_USER)
+    raise ValueError(f"Unknown save backend: {backend}")
+
+def get_save_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                logger.info(f"Using {SAVE_BACKEND} save store")
+                _store = create_save_store()
+    return _store
@@ -0,0 +1,152 @@
+import copy
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import logger, SESSION_BACKEND, SESSION_DB_PATH, SESSION_MAX_ITEMS, SESSION_IDLE_SECONDS
+
+
+def new_session_id():
+    return secrets.token_hex(16)
+
+# Session ids come back from the browser: anything that new_session_id() could not have
+# produced is treated as an unknown session.
+def is_session_id(value):
+    return isinstance(value, str) and len(value) == 32 and all(c in "0123456789abcdef" for c in value)
+
+
+# Single-process store: bounded LRU that also drops sessions idle for longer than idle_seconds.
+class MemorySessionStore:
+    def __init__(self, max_items=SESSION_MAX_ITEMS, idle_seconds=SESSION_IDLE_SECONDS):
+        self.max_items = max_items
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_items and now - last_access <= self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            logger.debug(f"Session {session_id[:8]} evicted")
+
+    def load(self, session_id):
+        if not session_id:
+            return None
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], now)
+            self._sessions.move_to_end(session_id)
+            return copy.deepcopy(entry[0])
+
+    def save(self, session_id, state):
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (copy.deepcopy(state), now)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def count(self):
+        with self._lock:
+            self._evict(time.time())
+            return len(self._sessions)
+
+
+# Shared store for multi-worker deployments: every worker process opens the same SQLite file.
+class SQLiteSessionStore:
+    def __init__(self, path=SESSION_DB_PATH, idle_seconds=SESSION_IDLE_SECONDS):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self._local = threading.local()
+        self._last_purge = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access)")
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _purge_idle(self, db, now):
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        db.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.idle_seconds,))
+
+    def load(self, session_id):
+        if not session_id:
+            return None
+        now = time.time()
+        db = self._connect()
+        with db:
+            row = db.execute(
+                "SELECT state FROM sessions WHERE session_id = ? AND last_access >= ?",
+                (session_id, now - self.idle_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def save(self, session_id, state):
+        now = time.time()
+        db = self._connect()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, last_access) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state, ensure_ascii=False), now)
+            )
+            self._purge_idle(db, now)
+
+    def delete(self, session_id):
+        db = self._connect()
+        with db:
+            db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def count(self):
+        row = self._connect().execute(
+            "SELECT COUNT(*) FROM sessions WHERE last_access >= ?", (time.time() - self.idle_seconds,)
+        ).fetchone()
+        return row[0]
+
+
+SESSION_BACKENDS = {
+    "memory": MemorySessionStore,
+    "sqlite": SQLiteSessionStore
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SESSION_BACKEND not in SESSION_BACKENDS:
+                    raise ValueError(f"Unknown session backend: {SESSION_BACKEND}")
+                logger.info(f"Using {SESSION_BACKEND} session store")
+                _store = SESSION_BACKENDS[SESSION_BACKEND]()
+    return _store
@@ -0,0 +1,154 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from storage.save_format import SAVE_FORMAT_VERSION, build_save_info, check_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS saves (
+    user_id TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    location TEXT NOT NULL,
+    health INTEGER NOT NULL,
+    max_health INTEGER NOT NULL,
+    last_played TEXT NOT NULL,
+    game_over INTEGER NOT NULL,
+    format_version INTEGER NOT NULL,
+    state BLOB NOT NULL,
+    log_id TEXT NOT NULL,
+    log_count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, slot)
+);
+CREATE INDEX IF NOT EXISTS idx_saves_user_last_played ON saves(user_id, last_played DESC);
+CREATE TABLE IF NOT EXISTS save_log (
+    user_id TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (user_id, slot, seq)
+);
+"""
+
+INFO_COLUMNS = "slot, level, location, health, max_health, last_played, game_over"
+
+
+def row_to_info(row):
+    return {
+        "slot": row[0],
+        "level": row[1],
+        "location": row[2],
+        "health": row[3],
+        "max_health": row[4],
+        "last_played": row[5],
+        "game_over": bool(row[6])
+    }
+
+
+# SQLite backend: every user gets its own namespace of named slots. Metadata lives in
+# indexed columns, so listing never decompresses a state blob, and each save (record plus
+# transcript rows) commits in a single transaction.
+class SQLiteSaveStore:
+    def __init__(self, path, default_user):
+        self.path = path
+        self.default_user = default_user
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _user(self, user_id):
+        return check_name(user_id or self.default_user)
+
+    def write(self, user_id, slot, core_state, read_entries, lineage=None):
+        user_id, slot = self._user(user_id), check_name(slot)
+        info = build_save_info(core_state, slot)
+        blob = gzip.compress(json.dumps(core_state, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            previous = db.execute(
+                "SELECT log_id, log_count FROM saves WHERE user_id = ? AND slot = ?", (user_id, slot)
+            ).fetchone()
+
+            if previous and lineage and previous[0] == lineage.get("log_id") and previous[1] == lineage.get("synced"):
+                log_id, start = previous
+            else:
+                log_id, start = uuid.uuid4().hex, 0
+                db.execute("DELETE FROM save_log WHERE user_id = ? AND slot = ?", (user_id, slot))
+
+            new_entries = read_entries(start)
+            db.executemany(
+                "INSERT OR REPLACE INTO save_log (user_id, slot, seq, entry) VALUES (?, ?, ?, ?)",
+                ((user_id, slot, start + i, json.dumps(entry, ensure_ascii=False)) for i, entry in enumerate(new_entries))
+            )
+            log_count = start + len(new_entries)
+
+            db.execute(
+                "INSERT OR REPLACE INTO saves (user_id, slot, level, location, health, max_health, last_played, "
+                "game_over, format_version, state, log_id, log_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, slot, info["level"], info["location"], info["health"], info["max_health"],
+                 info["last_played"], int(info["game_over"]), SAVE_FORMAT_VERSION, blob, log_id, log_count)
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+        return {"log_id": log_id, "log_count": log_count}
+
+    def read(self, user_id, slot):
+        user_id, slot = self._user(user_id), check_name(slot)
+        db = self._connect()
+        db.execute("BEGIN")
+        try:
+            row = db.execute(
+                "SELECT state, log_id, log_count FROM saves WHERE user_id = ? AND slot = ?", (user_id, slot)
+            ).fetchone()
+            if row is None:
+                return None
+            lines = db.execute(
+                "SELECT entry FROM save_log WHERE user_id = ? AND slot = ? AND seq < ? ORDER BY seq",
+                (user_id, slot, row[2])
+            ).fetchall()
+        finally:
+            db.execute("COMMIT")
+
+        state = json.loads(gzip.decompress(row[0]).decode("utf-8"))
+        log_data = "".join(line[0] + "\n" for line in lines).encode("utf-8")
+        return state, log_data, {"log_id": row[1], "synced": row[2]}
+
+    def info(self, user_id, slot):
+        row = self._connect().execute(
+            f"SELECT {INFO_COLUMNS} FROM saves WHERE user_id = ? AND slot = ?", (self._user(user_id), check_name(slot))
+        ).fetchone()
+        return row_to_info(row) if row else None
+
+    def list(self, user_id):
+        rows = self._connect().execute(
+            f"SELECT {INFO_COLUMNS} FROM saves WHERE user_id = ? ORDER BY last_played DESC", (self._user(user_id),)
+        ).fetchall()
+        return [row_to_info(row) for row in rows]
+
+    def delete(self, user_id, slot):
+        user_id, slot = self._user(user_id), check_name(slot)
+        db = self._connect()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM saves WHERE user_id = ? AND slot = ?", (user_id, slot))
+            db.execute("DELETE FROM save_log WHERE user_id = ? AND slot = ?", (user_id, slot))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from config import logger, TRANSCRIPT_DIR, TRANSCRIPT_CACHE_ITEMS, TRANSCRIPT_RETENTION_SECONDS
+
+
+# Transcripts are append-only lists of rendered turns. Each one is kept as a JSON-lines
+# file so appending a turn costs one short write, and hot transcripts stay in memory.
+# Replaced transcripts (new game, load) are deleted right away; abandoned ones (the session
+# expired or the browser left) once they have not been written for retention_seconds.
+class TranscriptStore:
+    def __init__(self, directory=TRANSCRIPT_DIR, cache_items=TRANSCRIPT_CACHE_ITEMS,
+                 retention_seconds=TRANSCRIPT_RETENTION_SECONDS):
+        self.directory = directory
+        self.cache_items = cache_items
+        self.retention_seconds = retention_seconds
+        self._last_purge = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, transcript_id):
+        if not transcript_id or not all(c in "0123456789abcdef" for c in transcript_id):
+            raise ValueError(f"Invalid transcript id: {transcript_id!r}")
+        return os.path.join(self.directory, f"{transcript_id}.jsonl")
+
+    def _entries(self, transcript_id):
+        entries = self._cache.get(transcript_id)
+        if entries is None:
+            entries = []
+            path = self._path(transcript_id)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+            self._cache[transcript_id] = entries
+
+        self._cache.move_to_end(transcript_id)
+        while len(self._cache) > self.cache_items:
+            self._cache.popitem(last=False)
+        return entries
+
+    def create(self, entries=()):
+        transcript_id = uuid.uuid4().hex
+        entries = list(entries)
+        with self._lock:
+            with open(self._path(transcript_id), 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._cache[transcript_id] = entries
+        logger.debug(f"Transcript {transcript_id} created with {len(entries)} entries")
+        self.purge_expired()
+        return transcript_id
+
+    # Builds a transcript from already-encoded JSON-lines (e.g. a save log) without parsing it.
+    def create_from_lines(self, data, extra_entries=()):
+        transcript_id = uuid.uuid4().hex
+        with self._lock:
+            with open(self._path(transcript_id), 'wb') as f:
+                f.write(data)
+                for entry in extra_entries:
+                    f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.purge_expired()
+        return transcript_id
+
+    def append(self, transcript_id, entry):
+        with self._lock:
+            entries = self._entries(transcript_id)
+            with open(self._path(transcript_id), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            entries.append(entry)
+            return len(entries) - 1
+
+    def count(self, transcript_id):
+        with self._lock:
+            return len(self._entries(transcript_id))
+
+    # Returns the `limit` entries before index `before` (or the latest ones) and the index of the first.
+    def page(self, transcript_id, before=None, limit=20):
+        with self._lock:
+            entries = self._entries(transcript_id)
+            end = len(entries) if before is None else max(0, min(before, len(entries)))
+            start = max(0, end - limit)
+            return entries[start:end], start
+
+    def entries(self, transcript_id, start=0):
+        with self._lock:
+            return self._entries(transcript_id)[start:]
+
+    def delete(self, transcript_id):
+        with self._lock:
+            self._cache.pop(transcript_id, None)
+            try:
+                os.remove(self._path(transcript_id))
+            except FileNotFoundError:
+                pass
+
+    def purge_expired(self):
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        cutoff = now - self.retention_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".jsonl") and os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+                    with self._lock:
+                        self._cache.pop(name[:-len(".jsonl")], None)
+            except OSError:
+                pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_transcript_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TranscriptStore()
+    return _store
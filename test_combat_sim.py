@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from combat_sim import check_consistency, simulate, simulate_scalar
+
+# The vectorized simulator re-implements resolve_combat; these fail as soon as the combat
+# rules change without it.
+CASES = [
+    ("goblin", 1, {"attack": 1.0}),
+    ("skeleton", 5, {"attack": 0.7, "defend": 0.2, "flee": 0.1}),
+    ("orc", 1, {"attack": 0.8, "flee": 0.2})
+]
+
+
+@pytest.mark.parametrize("enemy_type,level,policy", CASES)
+def test_vectorized_matches_scalar_rules(enemy_type, level, policy):
+    checks = check_consistency(enemy_type, level, fights=400, policy=policy, seed=7)
+    failed = [(metric, scalar, vector, tolerance) for metric, scalar, vector, tolerance, ok in checks if not ok]
+    assert not failed
+
+@pytest.mark.parametrize("enemy_type,level,policy", CASES)
+def test_win_rate_and_turns_within_tolerance(enemy_type, level, policy):
+    scalar = simulate_scalar(enemy_type, level, fights=400, policy=policy, seed=11)
+    vector = simulate(enemy_type, level, fights=20_000, policy=policy, seed=11)
+    assert abs(scalar["win_rate"] - vector["win_rate"]) <= 0.08
+    if scalar["win_rate"] > 0.2:
+        assert abs(scalar["turns_mean"] - vector["turns_mean"]) <= max(0.5, 0.15 * vector["turns_mean"])
+
+def test_fixed_seed_is_reproducible():
+    first = simulate("goblin", 3, fights=2_000, seed=3)
+    second = simulate("goblin", 3, fights=2_000, seed=3)
+    assert first["win_rate"] == second["win_rate"]
+    assert first["turns_mean"] == second["turns_mean"]